@@ -40,6 +40,8 @@ import shutil
 import unittest
 
 import operator #for ConstantArithmetic
+import threading
+import time
 import scipy.fft
 class TestCPU(unittest.TestCase):
     ERR_TOL = 5e-7
@@ -1327,6 +1329,343 @@ class TestCPU(unittest.TestCase):
 
         self.cleanup()
 
+    def test_Streaming(self):
+        self.initialise()
+        data_size = 1024
+        num_segs = 4
+        def get_data_pkts(num_pkts, num_reps=3):
+            return [{
+                'parameters' : ['repetition', 'segment', 'sample'],
+                'data' : { 'ch1' : np.array([[np.sin(0.14*2*np.pi*np.arange(data_size)+0.1*(r+p*num_reps))*(s+1) for s in range(num_segs)] for r in range(num_reps)]) },
+                'misc' : {'SampleRates' : [1]}
+            } for p in range(num_pkts)]
+        def setup_pipeline(new_proc):
+            new_proc.reset_pipeline()
+            new_proc.add_stage(CPU_DDC([0.14]))
+            new_proc.add_stage(CPU_FIR([{'Type' : 'low', 'Taps' : 40, 'fc' : 0.01, 'Win' : 'hamming'}]*2))
+            new_proc.add_stage(CPU_Mean('sample'))
+            new_proc.add_stage_end(CPU_Mean('repetition'))
+        #Reference with synchronous processing
+        new_proc = ProcessorCPU('cpu_test', self.lab)
+        setup_pipeline(new_proc)
+        for cur_pkt in get_data_pkts(8):
+            new_proc.push_data(cur_pkt)
+        ref_data = new_proc.get_all_data()
+        new_proc.reset_pipeline()
+        for cur_pkt in get_data_pkts(8):
+            new_proc.push_data(cur_pkt)
+        ref_data_reps = new_proc.get_all_data()
+        #Streaming gives the same results in the pushed order (regardless of the number of workers)
+        for num_workers in [1, 3]:
+            new_proc = ProcessorCPU('cpu_test', self.lab, streaming=True, num_workers=num_workers, max_queued_packets=2)
+            setup_pipeline(new_proc)
+            for cur_pkt in get_data_pkts(8):
+                new_proc.push_data(cur_pkt)
+            fin_data = new_proc.get_all_data()
+            assert self.arr_equality(fin_data['data']['ch1_I'], ref_data['data']['ch1_I']), "CPU streaming does not yield expected result."
+            assert self.arr_equality(fin_data['data']['ch1_Q'], ref_data['data']['ch1_Q']), "CPU streaming does not yield expected result."
+            new_proc.reset_pipeline()
+            for cur_pkt in get_data_pkts(8):
+                new_proc.push_data(cur_pkt)
+            fin_data = new_proc.get_all_data()
+            assert np.array_equal(fin_data['data']['ch1'], ref_data_reps['data']['ch1']), "CPU streaming does not collate the packets in the pushed order."
+        assert new_proc.get_all_data() is None, "CPU streaming returned data when no packets were pushed."
+        #Backpressure - push_data blocks while MaxQueuedPackets packets are waiting to be processed
+        class CPU_Wait(ProcNodeCPU):
+            def __init__(self, evt, fail_on=-1):
+                self.evt = evt
+                self.fail_on = fail_on
+                self.num_pkts = 0
+            def process_data(self, data_pkt, **kwargs):
+                self.evt.wait()
+                self.num_pkts += 1
+                assert self.num_pkts != self.fail_on, "Failed stage."
+                return data_pkt
+        evt = threading.Event()
+        new_proc = ProcessorCPU('cpu_test', self.lab, streaming=True, max_queued_packets=1)
+        new_proc.reset_pipeline()
+        new_proc.add_stage(CPU_Wait(evt))
+        cur_pkts = get_data_pkts(3)
+        expected_ans = np.concatenate([x['data']['ch1'] for x in cur_pkts])
+        new_proc.push_data(cur_pkts[0])     #Taken by the worker
+        time.sleep(0.2)
+        new_proc.push_data(cur_pkts[1])     #Fills the queue
+        push_thread = threading.Thread(target=new_proc.push_data, args=(cur_pkts[2],))
+        push_thread.start()
+        time.sleep(0.2)
+        assert push_thread.is_alive(), "CPU streaming did not block when the queue was full."
+        assert not new_proc.ready(), "CPU streaming processor is ready while processing packets."
+        evt.set()
+        push_thread.join()
+        fin_data = new_proc.get_all_data()
+        assert new_proc.ready(), "CPU streaming processor is not ready after collecting the data."
+        assert np.array_equal(fin_data['data']['ch1'], expected_ans), "CPU streaming does not collate the packets in the pushed order."
+        #Exceptions in the workers are raised in get_all_data
+        new_proc.reset_pipeline()
+        new_proc.add_stage(CPU_Wait(evt, fail_on=2))
+        for cur_pkt in get_data_pkts(4):
+            new_proc.push_data(cur_pkt)
+        with self.assertRaises(AssertionError):
+            new_proc.get_all_data()
+        #The processor can still be used after an exception
+        new_proc.reset_pipeline()
+        for cur_pkt in get_data_pkts(2):
+            new_proc.push_data(cur_pkt)
+        assert new_proc.get_all_data()['data']['ch1'].shape[0] == 6, "CPU streaming cannot be reused after an exception."
+        #Reconfiguring from the saved configuration
+        new_proc.NumWorkers = 2
+        cur_config = new_proc._get_current_config()
+        new_proc = ProcessorCPU('cpu_test', self.lab)
+        new_proc._set_current_config(cur_config, self.lab)
+        assert new_proc.Streaming and new_proc.NumWorkers == 2 and new_proc.MaxQueuedPackets == 1, "CPU streaming settings were not restored from the configuration."
+        #Reapplying the same configuration must not restart the workers
+        new_proc.reset_pipeline()
+        for cur_pkt in get_data_pkts(2):
+            new_proc.push_data(cur_pkt)
+        new_proc.get_all_data()
+        cur_workers = new_proc._workers[:]
+        new_proc._set_current_config(cur_config, self.lab)
+        assert len(cur_workers) == 2 and new_proc._workers == cur_workers, "CPU streaming workers were restarted on reapplying the same configuration."
+        new_proc.MaxQueuedPackets = 3
+        assert new_proc._workers == [] and not any(x.is_alive() for x in cur_workers), "CPU streaming workers were not stopped on changing the settings."
+        #Releasing the processor (also done when releasing the laboratory) stops the workers
+        for cur_pkt in get_data_pkts(2):
+            new_proc.push_data(cur_pkt)
+        cur_workers = new_proc._workers[:]
+        assert len(cur_workers) == 2, "CPU streaming workers were not restarted on pushing data."
+        new_proc.release()
+        assert new_proc._workers == [] and not any(x.is_alive() for x in cur_workers), "CPU streaming workers were not stopped on releasing the processor."
+        assert new_proc.get_all_data()['data']['ch1'].shape[0] == 6, "CPU streaming lost the pushed packets on releasing the processor."
+        for cur_pkt in get_data_pkts(2):
+            new_proc.push_data(cur_pkt)
+        cur_workers = new_proc._workers[:]
+        self.lab.release_all_instruments()
+        assert new_proc._workers == [] and not any(x.is_alive() for x in cur_workers), "CPU streaming workers were not stopped on releasing the laboratory."
+        new_proc.Streaming = False
+        self.cleanup()
+
+    def test_DDCFIRDecimation(self):
+        self.initialise()
+        rng = np.random.default_rng(23)
+        def get_data_pkt(data_size):
+            return {
+                'parameters' : ['repetition', 'segment', 'sample'],
+                'data' : { 'ch1' : rng.normal(size=(3, 2, data_size)), 'ch2' : rng.normal(size=(3, 2, data_size)) },
+                'misc' : {'SampleRates' : [500e6, 250e6]}
+            }
+        fir_low = {'Type' : 'low', 'Taps' : 40, 'fc' : 10e6, 'Win' : 'hamming'}
+        fir_high = {'Type' : 'high', 'Taps' : 21, 'fc' : 5e6, 'Win' : 'hamming'}
+        #Includes odd lengths, filters longer than the data, different I/Q filters and channels without DDC (or no DDC at all)
+        for data_size in [1024, 997, 30]:
+            for deci_fac in [1, 3, 10]:
+                for ddc_freqs, fir_specs in [([25e6, 35e6], [fir_low]*4), ([25e6, None], [fir_low, fir_high, fir_high]), ([None, 13e6], [fir_high, fir_low, fir_low]), (None, [fir_low, fir_high])]:
+                    cur_data = get_data_pkt(data_size)
+                    exp_data = {'parameters' : cur_data['parameters'][:], 'data' : {x : cur_data['data'][x].copy() for x in cur_data['data']}, 'misc' : {'SampleRates' : cur_data['misc']['SampleRates'][:]}}
+                    cur_stages = [CPU_FIR(fir_specs), CPU_Decimation('sample', deci_fac)]
+                    if ddc_freqs is not None:
+                        cur_stages = [CPU_DDC(ddc_freqs)] + cur_stages
+                    for cur_stage in cur_stages:
+                        exp_data = cur_stage.process_data(exp_data)
+                    fin_data = CPU_DDCFIRDecimation(ddc_freqs, fir_specs, 'sample', deci_fac).process_data(cur_data)
+                    assert fin_data['parameters'] == exp_data['parameters'], "CPU_DDCFIRDecimation does not give the expected parameters."
+                    assert fin_data['misc']['SampleRates'] == exp_data['misc']['SampleRates'], "CPU_DDCFIRDecimation does not give the expected sample rates."
+                    assert list(fin_data['data'].keys()) == list(exp_data['data'].keys()), "CPU_DDCFIRDecimation does not give the expected channels."
+                    for cur_ch in exp_data['data']:
+                        assert self.arr_equality(fin_data['data'][cur_ch], exp_data['data'][cur_ch]), f"CPU_DDCFIRDecimation does not match the unfused stages on channel {cur_ch}."
+        #Within a processor (the kernels are cached across packets) and restored from the configuration
+        new_proc = ProcessorCPU('cpu_test', self.lab)
+        new_proc.reset_pipeline()
+        new_proc.add_stage(CPU_DDCFIRDecimation([25e6, 35e6], [fir_low]*4, 'sample', 8))
+        new_proc.add_stage(CPU_Mean('sample'))
+        new_proc.add_stage_end(CPU_Mean('repetition'))
+        cur_pkts = [get_data_pkt(1024) for m in range(3)]
+        exp_data = {'parameters' : ['repetition', 'segment', 'sample'], 'data' : {x : np.concatenate([y['data'][x] for y in cur_pkts]) for x in ['ch1', 'ch2']}, 'misc' : {'SampleRates' : [500e6, 250e6]}}
+        for cur_stage in [CPU_DDC([25e6, 35e6]), CPU_FIR([fir_low]*4), CPU_Decimation('sample', 8), CPU_Mean('sample'), CPU_Mean('repetition')]:
+            exp_data = cur_stage.process_data(exp_data)
+        cur_config = new_proc._get_current_config()
+        new_proc = ProcessorCPU('cpu_test', self.lab)
+        new_proc._set_current_config(cur_config, self.lab)
+        assert isinstance(new_proc.pipeline[0], CPU_DDCFIRDecimation) and new_proc.pipeline[0]._deci_fac == 8, "CPU_DDCFIRDecimation was not restored from the configuration."
+        for cur_pkt in cur_pkts:
+            new_proc.push_data(cur_pkt)
+        fin_data = new_proc.get_all_data()
+        for cur_ch in exp_data['data']:
+            assert self.arr_equality(fin_data['data'][cur_ch], exp_data['data'][cur_ch]), f"CPU_DDCFIRDecimation does not match the unfused stages in a processor on channel {cur_ch}."
+        #The decimated parameter must be the last one
+        with self.assertRaises(AssertionError):
+            CPU_DDCFIRDecimation([25e6, 35e6], [fir_low]*4, 'segment', 2).process_data(get_data_pkt(64))
+        self.cleanup()
+
+    def test_FIRDecimation(self):
+        self.initialise()
+        rng = np.random.default_rng(29)
+        data_size = 1000
+        def get_data_pkt():
+            return {
+                'parameters' : ['repetition', 'segment', 'sample'],
+                'data' : { 'ch1' : rng.normal(size=(3, 2, data_size)), 'ch2' : rng.normal(size=(3, 2, data_size)) },
+                'misc' : {'SampleRates' : [1e9, 500e6]}
+            }
+        for deci_fac in [1, 4, 10]:
+            #Explicit filters give the same result as CPU_FIR followed by CPU_Decimation
+            fir_specs = [{'Type' : 'low', 'Taps' : 40, 'fc' : 10e6, 'Win' : 'hamming'}, {'Type' : 'high', 'Taps' : 21, 'fc' : 5e6, 'Win' : 'hamming'}]
+            cur_data = get_data_pkt()
+            exp_data = {'parameters' : cur_data['parameters'][:], 'data' : {x : cur_data['data'][x].copy() for x in cur_data['data']}, 'misc' : {'SampleRates' : cur_data['misc']['SampleRates'][:]}}
+            exp_data = CPU_Decimation('sample', deci_fac).process_data(CPU_FIR(fir_specs).process_data(exp_data))
+            fin_data = CPU_FIRDecimation('sample', deci_fac, fir_specs).process_data(cur_data)
+            assert fin_data['parameters'] == exp_data['parameters'], "CPU_FIRDecimation does not give the expected parameters."
+            assert fin_data['misc']['SampleRates'] == exp_data['misc']['SampleRates'], "CPU_FIRDecimation does not give the expected sample rates."
+            for cur_ch in exp_data['data']:
+                assert self.arr_equality(fin_data['data'][cur_ch], exp_data['data'][cur_ch]), f"CPU_FIRDecimation does not match CPU_FIR followed by CPU_Decimation on channel {cur_ch}."
+            #The default anti-aliasing filter matches scipy.signal.resample_poly away from the edges
+            cur_data = get_data_pkt()
+            exp_data = scipy.signal.resample_poly(cur_data['data']['ch1'], 1, deci_fac, axis=-1)
+            fin_data = CPU_FIRDecimation('sample', deci_fac).process_data(cur_data)
+            assert fin_data['misc']['SampleRates'] == [1e9/deci_fac, 500e6/deci_fac], "CPU_FIRDecimation does not give the expected sample rates."
+            assert fin_data['data']['ch1'].shape == exp_data.shape, "CPU_FIRDecimation does not give the expected number of samples."
+            assert self.arr_equality(fin_data['data']['ch1'][..., 11:-11], exp_data[..., 11:-11]), "CPU_FIRDecimation does not match scipy.signal.resample_poly."
+        #Tones above the decimated Nyquist frequency are suppressed instead of being aliased
+        tone = np.sin(2*np.pi*0.09*np.arange(data_size))
+        cur_data = {'parameters' : ['sample'], 'data' : {'ch1' : tone.copy()}, 'misc' : {'SampleRates' : [1]}}
+        fin_data = CPU_FIRDecimation('sample', 10).process_data(cur_data)
+        assert np.max(np.abs(fin_data['data']['ch1'][20:-20])) < 1e-3, "CPU_FIRDecimation does not suppress aliased tones."
+        cur_data = {'parameters' : ['sample'], 'data' : {'ch1' : tone.copy()}, 'misc' : {'SampleRates' : [1]}}
+        fin_data = CPU_Decimation('sample', 10).process_data(cur_data)
+        assert np.max(np.abs(fin_data['data']['ch1'])) > 0.5, "The aliased tone should survive plain decimation."
+        #Restored from the configuration
+        new_proc = ProcessorCPU('cpu_test', self.lab)
+        new_proc.reset_pipeline()
+        new_proc.add_stage(CPU_FIRDecimation('sample', 4))
+        cur_config = new_proc._get_current_config()
+        new_proc = ProcessorCPU('cpu_test', self.lab)
+        new_proc._set_current_config(cur_config, self.lab)
+        assert isinstance(new_proc.pipeline[0], CPU_FIRDecimation) and new_proc.pipeline[0]._deci_fac == 4 and new_proc.pipeline[0]._fir is None, "CPU_FIRDecimation was not restored from the configuration."
+        self.cleanup()
+
+    def test_SinglePrecision(self):
+        self.initialise()
+        rng = np.random.default_rng(31)
+        #Raw 16-bit digitiser-like data
+        raw_pkts = [rng.integers(-2**15, 2**15, size=(20, 3, 1024)).astype(np.int16) for m in range(3)]
+        def setup_pipeline(new_proc, fused):
+            new_proc.reset_pipeline()
+            if fused:
+                new_proc.add_stage(CPU_DDCFIRDecimation([25e6], [{'Type' : 'low', 'Taps' : 40, 'fc' : 10e6, 'Win' : 'hamming'}]*2, 'sample', 8))
+            else:
+                new_proc.add_stage(CPU_DDC([25e6]))
+                new_proc.add_stage(CPU_FIR([{'Type' : 'low', 'Taps' : 40, 'fc' : 10e6, 'Win' : 'hamming'}]*2))
+            new_proc.add_stage(CPU_MeanBlock('sample', 4))
+            new_proc.add_stage_end(CPU_MeanVariance('repetition'))
+            new_proc.add_stage_end(CPU_Integrate('segment'))
+        def run_pipeline(new_proc):
+            for cur_pkt in raw_pkts:
+                new_proc.push_data({'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : cur_pkt.copy()}, 'misc' : {'SampleRates' : [500e6]}})
+            return new_proc.get_all_data()
+        for fused in [False, True]:
+            new_proc = ProcessorCPU('cpu_test', self.lab)
+            setup_pipeline(new_proc, fused)
+            ref_data = run_pipeline(new_proc)
+            assert ref_data['misc']['DataType'] == 'float64' and ref_data['misc']['AccumulatorType'] == 'float64', "CPU processor did not note the precision in the data packet."
+            for acc_float64 in [True, False]:
+                new_proc = ProcessorCPU('cpu_test', self.lab, data_type='float32', accumulate_float64=acc_float64)
+                setup_pipeline(new_proc, fused)
+                fin_data = run_pipeline(new_proc)
+                assert fin_data['misc']['DataType'] == 'float32', "CPU processor did not note the precision in the data packet."
+                assert fin_data['misc']['AccumulatorType'] == ('float64' if acc_float64 else 'float32'), "CPU processor did not note the accumulator precision in the data packet."
+                assert list(fin_data['data'].keys()) == list(ref_data['data'].keys()), "CPU single-precision processing does not give the expected channels."
+                for cur_ch in ref_data['data']:
+                    assert fin_data['data'][cur_ch].dtype == np.float32, f"CPU single-precision processing promoted channel {cur_ch} to {fin_data['data'][cur_ch].dtype}."
+                    assert np.max(np.abs(fin_data['data'][cur_ch] - ref_data['data'][cur_ch])) < 1e-5*np.max(np.abs(ref_data['data'][cur_ch])), f"CPU single-precision processing is inaccurate on channel {cur_ch}."
+        #The float64 accumulators give the float64 reduction of the float32 data (rounded into float32)
+        cur_data = rng.normal(1e3, 1.0, size=(1000, 64)).astype(np.float32)
+        for acc_float64 in [True, False]:
+            new_proc = ProcessorCPU('cpu_test', self.lab, data_type='float32', accumulate_float64=acc_float64)
+            new_proc.reset_pipeline()
+            new_proc.add_stage(CPU_Mean('sample'))
+            new_proc.add_stage_end(CPU_Integrate('repetition'))
+            new_proc.push_data({'parameters' : ['repetition', 'sample'], 'data' : {'ch1' : cur_data.copy()}, 'misc' : {'SampleRates' : [1]}})
+            fin_data = new_proc.get_all_data()
+            cur_dtype = np.float64 if acc_float64 else np.float32
+            exp_data = np.sum(np.mean(cur_data, axis=1, dtype=cur_dtype).astype(np.float32), dtype=cur_dtype).astype(np.float32)
+            assert fin_data['data']['ch1'].dtype == np.float32 and fin_data['data']['ch1'] == exp_data, "CPU reductions did not use the expected accumulator precision."
+        #Complex data is processed as complex64
+        new_proc = ProcessorCPU('cpu_test', self.lab, data_type='float32')
+        new_proc.reset_pipeline()
+        new_proc.add_stage_end(CPU_Variance('repetition'))
+        new_proc.push_data({'parameters' : ['repetition', 'sample'], 'data' : {'ch1' : rng.normal(size=(10, 16)) + 1j*rng.normal(size=(10, 16))}, 'misc' : {'SampleRates' : [1]}})
+        assert new_proc.get_all_data()['data']['ch1'].dtype == np.float32, "CPU single-precision processing does not give float32 variances of complex data."
+        #Reconfiguring from the saved configuration
+        new_proc.AccumulateFloat64 = False
+        cur_config = new_proc._get_current_config()
+        new_proc = ProcessorCPU('cpu_test', self.lab)
+        new_proc._set_current_config(cur_config, self.lab)
+        assert new_proc.DataType == 'float32' and not new_proc.AccumulateFloat64, "CPU precision settings were not restored from the configuration."
+        with self.assertRaises(AssertionError):
+            new_proc.DataType = 'float16'
+        self.cleanup()
+
+    def test_OnlineReduction(self):
+        self.initialise()
+        rng = np.random.default_rng(17)
+        #Packets of different sizes (with a large offset to check the numerical stability of the variance)
+        raw_pkts = [rng.normal(1e3, 2.0, size=(x, 3, 16)) + 1j*rng.normal(0, 0.5, size=(x, 3, 16)) for x in [5, 1, 12, 7]]
+        def get_data_pkts():
+            return [{
+                'parameters' : ['repetition', 'segment', 'sample'],
+                'data' : { 'ch1' : np.real(x).copy(), 'ch2' : x.copy() },
+                'misc' : {'SampleRates' : [1]}
+            } for x in raw_pkts]
+        all_data = np.concatenate(raw_pkts)
+        exp_data = {
+            'CPU_Mean' : {'ch1' : np.mean(np.real(all_data), axis=0), 'ch2' : np.mean(all_data, axis=0)},
+            'CPU_Integrate' : {'ch1' : np.sum(np.real(all_data), axis=0), 'ch2' : np.sum(all_data, axis=0)},
+            'CPU_Variance' : {'ch1' : np.std(np.real(all_data), axis=0), 'ch2' : np.std(all_data, axis=0)},
+            'CPU_MeanVariance' : {'ch1_repetition_Mean' : np.mean(np.real(all_data), axis=0), 'ch1_repetition_Var' : np.var(np.real(all_data), axis=0),
+                                  'ch2_repetition_Mean' : np.mean(all_data, axis=0), 'ch2_repetition_Var' : np.var(all_data, axis=0)}
+        }
+        for streaming in [False, True]:
+            new_proc = ProcessorCPU('cpu_test', self.lab, streaming=streaming, num_workers=2)
+            for cur_stage in exp_data:
+                new_proc.reset_pipeline()
+                new_proc.add_stage_end(globals()[cur_stage]('repetition'))
+                for cur_pkt in get_data_pkts():
+                    new_proc.push_data(cur_pkt)
+                #The packets are folded into the running statistics as they are processed
+                if streaming:
+                    new_proc._wait_for_workers()
+                    assert new_proc._online_state is not None and len(new_proc._cur_data_processed_inds) == 0, f"{cur_stage} did not fold the packets when streaming."
+                fin_data = new_proc.get_all_data()
+                assert fin_data['parameters'] == ['segment', 'sample'], f"{cur_stage} did not remove the reduced parameter."
+                assert fin_data['misc']['SampleRates'] == [1], f"{cur_stage} did not retain the miscellaneous metadata."
+                assert list(fin_data['data'].keys()) == list(exp_data[cur_stage].keys()), f"{cur_stage} did not yield the expected channels."
+                for cur_ch in exp_data[cur_stage]:
+                    assert self.arr_equality_pct(fin_data['data'][cur_ch], exp_data[cur_stage][cur_ch]), f"{cur_stage} does not reduce the packets correctly on channel {cur_ch}."
+            #A single packet gives the same result as reducing it directly
+            new_proc.reset_pipeline()
+            new_proc.add_stage_end(CPU_Variance('repetition'))
+            new_proc.push_data(get_data_pkts()[0])
+            fin_data = new_proc.get_all_data()
+            assert np.array_equal(fin_data['data']['ch2'], np.std(raw_pkts[0], axis=0)), "CPU_Variance does not reduce a single packet exactly."
+            #Stages after the reduction are run on the reduced data
+            new_proc.reset_pipeline()
+            new_proc.add_stage_end(CPU_Mean('repetition'))
+            new_proc.add_stage_end(CPU_Mean('sample'))
+            for cur_pkt in get_data_pkts():
+                new_proc.push_data(cur_pkt)
+            fin_data = new_proc.get_all_data()
+            assert fin_data['parameters'] == ['segment'], "CPU end-stages after an online reduction were not run."
+            assert self.arr_equality_pct(fin_data['data']['ch2'], np.mean(all_data, axis=(0,2))), "CPU end-stages after an online reduction did not yield the expected result."
+            #Reductions across other parameters still collate all packets first
+            new_proc.reset_pipeline()
+            new_proc.add_stage_end(CPU_Mean('sample'))
+            for cur_pkt in get_data_pkts():
+                new_proc.push_data(cur_pkt)
+            fin_data = new_proc.get_all_data()
+            assert fin_data['parameters'] == ['repetition', 'segment'], "CPU end-stage reducing a different parameter was folded online."
+            assert self.arr_equality(fin_data['data']['ch2'], np.mean(all_data, axis=2)), "CPU end-stage reducing a different parameter did not yield the expected result."
+            new_proc.Streaming = False
+        self.cleanup()
+
 
 
 
@@ -5,6 +5,8 @@ from sqdtoolz.HAL.ACQ import*
 from sqdtoolz.HAL.AWG import*
 from sqdtoolz.HAL.DDG import*
 from sqdtoolz.HAL.GENmwSource import*
+from sqdtoolz.HAL.ACQvna import*
+from sqdtoolz.Drivers.dummyLatency import DummyLatency
 
 from sqdtoolz.HAL.WaveformGeneric import*
 from sqdtoolz.HAL.WaveformMapper import*
@@ -12,6 +14,10 @@ from sqdtoolz.HAL.WaveformMapper import*
 import numpy as np
 
 import shutil
+import time
+import threading
+from unittest import mock
+import os
 
 import unittest
 
@@ -1056,6 +1062,153 @@ class TestSaveLoad(unittest.TestCase):
         self.cleanup()
 
 
+class TestPreparation(unittest.TestCase):
+    def initialise(self):
+        os.makedirs('test_save_dir', exist_ok=True)
+        with open('test_save_dir/prep_instruments.yaml', 'w') as outfile:
+            outfile.write("instruments:\n")
+            for cur_instr, cur_type in [('prepMWS', 'dummyGENmwSource.DummyGENmwSrc'), ('prepMWS2', 'dummyGENmwSource.DummyGENmwSrc'), ('prepSMU', 'dummySMU.DummySMU')]:
+                outfile.write(f"  {cur_instr}:\n    type: sqdtoolz.Drivers.{cur_type}\n    init:\n      output_delay: 0.3\n")
+            outfile.write(f"  prepVNA:\n    type: sqdtoolz.Drivers.dummyVNA.DummyVNA\n")
+        self.lab = Laboratory('test_save_dir/prep_instruments.yaml', 'test_save_dir/')
+        self.lab.load_instrument('prepMWS')
+        self.lab.load_instrument('prepMWS2')
+        self.lab.load_instrument('prepSMU')
+        GENmwSource("MW-Src", self.lab, 'prepMWS', 'CH1')
+        GENmwSource("MW-Src2", self.lab, 'prepMWS', 'CH2')
+        GENmwSource("MW-Src3", self.lab, 'prepMWS2', 'CH1')
+        GENsmu('SMU', self.lab, 'prepSMU')
+        ExperimentConfiguration('prepConf', self.lab, 1.0, ['MW-Src', 'MW-Src2', 'MW-Src3', 'SMU'])
+
+    def cleanup(self):
+        self.lab.release_all_instruments()
+        self.lab = None
+        shutil.rmtree('test_save_dir')
+
+    def test_ConcurrentPreparation(self):
+        self.initialise()
+        expConfig = self.lab.CONFIG('prepConf')
+        overlaps = lambda iv1, iv2: iv1[0] < iv2[1] and iv2[0] < iv1[1]
+        def check_phase_order(prep_ivs):
+            #Each phase must finish on every HAL before the next phase begins
+            for cur_phase, next_phase in [('activate', 'prepare_initial'), ('prepare_initial', 'prepare_final')]:
+                assert max(prep_ivs[x][cur_phase][1] for x in prep_ivs) <= min(prep_ivs[x][next_phase][0] for x in prep_ivs), f"The phase {next_phase} began before {cur_phase} finished on every HAL."
+        #Serial preparation - each HAL takes 0.3s to activate
+        expConfig.prepare_instruments()
+        prep_times = expConfig.get_preparation_times()
+        assert set(prep_times.keys()) == set(['MW-Src', 'MW-Src2', 'MW-Src3', 'SMU']), "The preparation times were not reported for every HAL."
+        assert all(prep_times[x]['activate'] >= 0.3 for x in prep_times), "The preparation times were not reported correctly."
+        assert all(set(prep_times[x].keys()) == set(['activate', 'prepare_initial', 'prepare_final']) for x in prep_times), "The preparation times were not reported for every phase."
+        prep_ivs = expConfig.get_preparation_times(intervals=True)
+        assert all(abs(prep_ivs[x]['activate'][1] - prep_ivs[x]['activate'][0] - prep_times[x]['activate']) < 1e-9 for x in prep_ivs), "The preparation intervals do not match the preparation times."
+        act_ivs = [prep_ivs[x]['activate'] for x in prep_ivs]
+        assert not any(overlaps(x, y) for m, x in enumerate(act_ivs) for y in act_ivs[m+1:]), "The serial instrument preparation ran HALs simultaneously."
+        check_phase_order(prep_ivs)
+        #Concurrent preparation - the two HALs on prepMWS must still be run sequentially
+        expConfig.ConcurrentPreparation = True
+        expConfig.prepare_instruments()
+        prep_ivs = expConfig.get_preparation_times(intervals=True)
+        act_ivs = {x : prep_ivs[x]['activate'] for x in prep_ivs}
+        assert not overlaps(act_ivs['MW-Src'], act_ivs['MW-Src2']), "The HALs sharing an instrument were prepared simultaneously."
+        for cur_hal in ['MW-Src3', 'SMU']:
+            assert overlaps(act_ivs[cur_hal], act_ivs['MW-Src']) or overlaps(act_ivs[cur_hal], act_ivs['MW-Src2']), f"The HAL {cur_hal} was not prepared concurrently."
+        check_phase_order(prep_ivs)
+        #The worker threads are not left running after the preparation
+        num_threads = threading.active_count()
+        expConfig.prepare_instruments()
+        assert threading.active_count() == num_threads, "The concurrent instrument preparation left worker threads running."
+        #Opting out runs the HAL after the others
+        self.lab.HAL('SMU').ConcurrentPreparation = False
+        expConfig.prepare_instruments()
+        prep_ivs = expConfig.get_preparation_times(intervals=True)
+        act_ivs = {x : prep_ivs[x]['activate'] for x in prep_ivs}
+        assert overlaps(act_ivs['MW-Src3'], act_ivs['MW-Src']) or overlaps(act_ivs['MW-Src3'], act_ivs['MW-Src2']), "The HAL MW-Src3 was not prepared concurrently."
+        assert all(act_ivs['SMU'][0] >= act_ivs[x][1] for x in ['MW-Src', 'MW-Src2', 'MW-Src3']), "The HAL that opted out was not prepared after the others."
+        check_phase_order(prep_ivs)
+        #Manually activated HALs are still skipped in the activation phase
+        self.lab.HAL('MW-Src3').ManualActivation = True
+        expConfig.prepare_instruments()
+        assert 'activate' not in expConfig.get_preparation_times()['MW-Src3'], "A manually activated HAL was activated."
+        #Errors are propagated
+        self.lab.HAL('MW-Src3').prepare_initial = lambda: 1/0
+        self.assertRaises(ZeroDivisionError, expConfig.prepare_instruments)
+        #The groups are updated when a HAL is bound onto another instrument
+        get_groups = lambda: expConfig._get_preparation_groups([self.lab.HAL(x) for x in ['MW-Src', 'MW-Src2', 'MW-Src3', 'SMU']])
+        assert get_groups() == [['MW-Src', 'MW-Src2'], ['MW-Src3']], "The HALs were not grouped by their instruments."
+        GENmwSource("MW-Src2", self.lab, 'prepMWS2', 'CH2')
+        assert get_groups() == [['MW-Src'], ['MW-Src2', 'MW-Src3']], "The groups were not updated after a HAL was bound onto another instrument."
+        self.cleanup()
+
+    def test_WriteCache(self):
+        self.initialise()
+        expConfig = self.lab.CONFIG('prepConf')
+        init_power = self.lab.HAL('MW-Src').Power
+        #Disabled by default - every write is issued
+        expConfig.init_instruments()
+        num_writes = expConfig.get_write_stats(reset=True)['Issued']
+        assert num_writes > 0, "The HAL property writes were not counted."
+        expConfig.init_instruments()
+        assert expConfig.get_write_stats(reset=True) == {'Issued' : num_writes, 'Skipped' : 0}, "HAL property writes were skipped with HALWriteCache disabled."
+        #Enabling the cache invalidates it (i.e. nothing is skipped, including repeated writes within the configuration); in the
+        #repeated configuration, only the first write of each property is skipped (i.e. a property that a HAL deliberately writes
+        #more than once is always rewritten)
+        self.lab.HALWriteCache = True
+        #The slow Output writes reach the (dummy) instruments only if issued
+        with mock.patch.object(DummyLatency, '_emulate_io') as emulate_io:
+            expConfig.init_instruments()
+        assert expConfig.get_write_stats(reset=True) == {'Issued' : num_writes, 'Skipped' : 0}, "HAL property writes were skipped on an invalidated cache."
+        assert emulate_io.call_count > 0, "The Output writes were not issued on an invalidated cache."
+        with mock.patch.object(DummyLatency, '_emulate_io') as emulate_io:
+            expConfig.init_instruments()
+        assert emulate_io.call_count == 0, "The slow Output writes were not skipped."
+        num_unique = expConfig.get_write_stats()['Skipped']
+        assert num_unique > 0 and expConfig.get_write_stats(reset=True) == {'Issued' : num_writes - num_unique, 'Skipped' : num_unique}, "Redundant HAL property writes were not skipped."
+        #Properties changed via the HAL are rewritten
+        self.lab.HAL('MW-Src').Power = init_power + 5
+        expConfig.init_instruments()
+        assert expConfig.get_write_stats(reset=True) == {'Issued' : num_writes - num_unique + 1, 'Skipped' : num_unique - 1}, "The HAL property changed via the HAL was not rewritten."
+        assert self.lab.HAL('MW-Src').Power == init_power, "The HAL property was not restored."
+        #Properties changed directly on the instrument require a forced refresh
+        self.lab._get_instrument('prepMWS').get_output('CH1').Power = init_power + 5
+        expConfig.init_instruments()
+        assert self.lab.HAL('MW-Src').Power == init_power + 5, "The write cache did not skip the HAL property write."
+        expConfig.init_instruments(force_refresh=True)
+        assert self.lab.HAL('MW-Src').Power == init_power, "The HAL property was not rewritten on a forced refresh."
+        expConfig.get_write_stats(reset=True)
+        self.lab.invalidate_HAL_write_caches()
+        expConfig.init_instruments()
+        assert expConfig.get_write_stats(reset=True)['Issued'] == num_writes, "The HAL write caches were not invalidated."
+        #Locked properties (i.e. set via SPECs) are neither written nor counted
+        self.lab.HAL('MW-Src')._property_lock('Power')
+        self.lab.HAL('MW-Src').Power = init_power + 5
+        assert self.lab.HAL('MW-Src').Power == init_power, "A locked HAL property was written."
+        self.lab.HAL('MW-Src')._property_unlock('Power')
+        self.cleanup()
+
+    def test_WriteCacheVNA(self):
+        self.initialise()
+        self.lab.load_instrument('prepVNA')
+        vna = ACQvna('VNA', self.lab, 'prepVNA')
+        vna.FrequencyStart = 1e9
+        vna.FrequencyEnd = 2e9
+        vna.setup_segmented_sweep([(1e9, 2e9, 11), (3e9, 4e9, 21)])
+        vna.SweepMode = 'Segmented'
+        ExperimentConfiguration('vnaConf', self.lab, 1.0, ['VNA'], 'VNA')
+        self.lab.HALWriteCache = True
+        #Setting up the segments drops the VNA out of segmented mode - so the repeated SweepMode write must not be skipped
+        for cur_exclude in [[], ACQvna._write_cache_exclude]:
+            vna._write_cache_exclude = cur_exclude
+            for m in range(3):
+                self.lab.CONFIG('vnaConf').init_instruments()
+                assert self.lab._get_instrument('prepVNA').SweepMode == 'Segmented', "The write cache skipped re-entering segmented mode on the VNA."
+                assert vna.get_data()['misc']['frequency'].size == 32, "The VNA was not left in segmented mode."
+        #Coupled properties are not cached (i.e. the start/end frequencies are restored after setting the centre/span)
+        vna.FrequencyCentre = 10e9
+        vna.FrequencySpan = 1e9
+        self.lab.CONFIG('vnaConf').init_instruments()
+        assert vna.FrequencyStart == 1e9 and vna.FrequencyEnd == 2e9, "The write cache skipped the coupled VNA frequency properties."
+        self.cleanup()
+
 if __name__ == '__main__':
     temp = TestHALInstantiation()
     temp.test_get_trigger_edges()#test_AWG_Mapping()
@@ -23,6 +23,9 @@ import time
 
 import numpy as np
 import shutil
+import h5py
+import tempfile
+from unittest import mock
 import os.path
 
 import unittest
@@ -190,6 +193,99 @@ class TestExpFileIO(unittest.TestCase):
         reader = None
         self.cleanup()
 
+    def test_DirectoryCatalogue(self):
+        self.initialise()
+        FileIOCatalogue.CACHE_DIR = tempfile.mkdtemp()
+        VariableInternal('test_var', self.lab, 0)
+        #
+        self.lab.group_open("test_group")
+        for m in self.lab.VAR("testAmpl").arange(0,4,1):
+            self.lab.VAR('test_var').Value = 7+m
+            exp = Experiment("test", self.lab.CONFIG('testConf'))
+            res = self.lab.run_single(exp, [(self.lab.VAR("myFreq"), np.arange(3))])
+            time.sleep(1)
+        self.lab.group_close()
+        file_path = res.file_path
+        main_dir = os.path.dirname(os.path.dirname(file_path))
+        res.release()
+        #
+        reader = FileIODirectory(file_path)
+        assert os.path.exists(FileIOCatalogue.get_database_path(main_dir)), "FileIODirectory did not create the catalogue."
+        assert [x for x in os.listdir(main_dir) if x.endswith('.sqlite')] == [], "FileIODirectory wrote the catalogue into the data folder."
+        catalogue = FileIOCatalogue(main_dir)
+        runs, folders_ignored = catalogue.get_runs('data.h5')
+        catalogue.close()
+        assert len(runs) == 4 and len(folders_ignored) == 0, "The catalogue did not index all the runs."
+        assert runs[0]['param_names'][0] == 'myFreq' and self.arr_equality(runs[0]['param_vals'][0], np.arange(3)), "The catalogue stored the wrong parameters."
+        assert [x['lab_vars']['test_var'] for x in runs] == [7,8,9,10], "The catalogue stored the wrong variable values."
+        #Repeated loads (with or without the catalogue) must give the same result
+        for cur_reader in [FileIODirectory(file_path), FileIODirectory(file_path, use_catalogue=False)]:
+            assert cur_reader.folders == reader.folders, "FileIODirectory returned different folders on a repeated load."
+            assert self.arr_equality(cur_reader.get_numpy_array(), reader.get_numpy_array()), "FileIODirectory returned different data on a repeated load."
+            assert self.arr_equality(cur_reader.get_var_dict_arrays()['test_var'], 7+np.arange(0,4,1)), "FileIODirectory returned different variable values on a repeated load."
+        #Filtering via variable values
+        cur_reader = FileIODirectory(file_path, var_filters={'test_var' : lambda x: x > 8})
+        assert self.arr_equality(cur_reader.param_vals[0], np.arange(2,4,1)), "FileIODirectory did not filter the folders via a function."
+        assert cur_reader.get_numpy_array().shape[0] == 2, "FileIODirectory did not filter the data via a function."
+        cur_reader = FileIODirectory(file_path, var_filters={'test_var' : 8})
+        assert cur_reader.folders == reader.folders[1:2], "FileIODirectory did not filter the folders via a value."
+        #Incomplete folders are ignored and checked again on every load
+        os.rename(reader.folders[1] + '/laboratory_parameters.txt', reader.folders[1] + '/laboratory_parameters.bak')
+        cur_reader = FileIODirectory(file_path)
+        assert cur_reader.folders == reader.folders[:1] + reader.folders[2:], "FileIODirectory did not ignore the incomplete folder."
+        os.rename(reader.folders[1] + '/laboratory_parameters.bak', reader.folders[1] + '/laboratory_parameters.txt')
+        cur_reader = FileIODirectory(file_path)
+        assert cur_reader.folders == reader.folders, "FileIODirectory did not pick up the completed folder."
+        #Unchanged directories must not be walked again, while the files of the catalogued runs are still checked
+        for cur_dir, _, _ in os.walk(os.path.dirname(main_dir)):
+            os.utime(cur_dir, (time.time() - 100, time.time() - 100))
+        FileIODirectory(file_path)
+        with mock.patch('os.walk', side_effect=AssertionError("FileIODirectory walked an unchanged directory.")):
+            cur_reader = FileIODirectory(file_path)
+            assert cur_reader.folders == reader.folders, "FileIODirectory returned different folders when skipping the walk."
+            time.sleep(1)
+            with open(reader.folders[2] + '/laboratory_parameters.txt') as json_file:
+                data = json.load(json_file)
+            data['test_var']['Value'] = 4
+            with open(reader.folders[2] + '/laboratory_parameters.txt', 'w') as json_file:
+                json.dump(data, json_file)
+            cur_reader = FileIODirectory(file_path)
+        assert self.arr_equality(cur_reader.get_var_dict_arrays()['test_var'], np.array([7,8,4,10])), "FileIODirectory did not update the modified folder in an unchanged directory."
+        #Modified and deleted runs must be updated in the catalogue
+        time.sleep(1)
+        with open(reader.folders[0] + '/laboratory_parameters.txt') as json_file:
+            data = json.load(json_file)
+        data['test_var']['Value'] = 3
+        with open(reader.folders[0] + '/laboratory_parameters.txt', 'w') as json_file:
+            json.dump(data, json_file)
+        shutil.rmtree(reader.folders[-1])
+        cur_reader = FileIODirectory(file_path)
+        assert cur_reader.folders == reader.folders[:-1], "FileIODirectory did not drop the deleted folder."
+        assert self.arr_equality(cur_reader.get_var_dict_arrays()['test_var'], np.array([3,8,4])), "FileIODirectory did not update the modified folder."
+        catalogue = FileIOCatalogue(main_dir)
+        assert len(catalogue.get_runs('data.h5')[0]) == 3, "The catalogue did not drop the deleted folder."
+        catalogue.close()
+        #Runs added to a nested folder must be found even if the parent directory is unchanged
+        parent_dir = os.path.dirname(main_dir)
+        catalogue = FileIOCatalogue(parent_dir)
+        num_runs = len(catalogue.get_runs('data.h5')[0])
+        for cur_dir, _, _ in os.walk(parent_dir):
+            os.utime(cur_dir, (time.time() - 100, time.time() - 100))
+        catalogue.get_runs('data.h5')
+        parent_mtime = os.stat(parent_dir).st_mtime_ns
+        shutil.copytree(reader.folders[0], reader.folders[0] + '_copy')
+        assert os.stat(parent_dir).st_mtime_ns == parent_mtime, "Adding a nested folder should not modify the parent directory."
+        runs = catalogue.get_runs('data.h5')[0]
+        assert len(runs) == num_runs + 1, "The catalogue did not find the run added to a nested folder."
+        catalogue.close()
+        time.sleep(1)
+        shutil.rmtree(FileIOCatalogue.CACHE_DIR)
+        FileIOCatalogue.CACHE_DIR = None
+        #
+        res = None
+        reader = None
+        self.cleanup()
+
     def test_WriteFileDirect(self):
         data_array = np.zeros( (2,3,4,2) )
         param_names = ["power", "frequency", "flux"]
@@ -347,6 +443,214 @@ class TestExpFileIO(unittest.TestCase):
     
         self.cleanup()
 
+    def test_StorageLayouts(self):
+        self.initialise()
+        VariableInternal('test_var1', self.lab, 0)
+        VariableInternal('test_var2', self.lab, 0)
+
+        swp_1_vals, swp_2_vals = np.array([-10,-5,0]), np.linspace(0,10,7)
+        sweep_arr = [(self.lab.VAR('test_var1'), swp_1_vals), (self.lab.VAR('test_var2'), swp_2_vals)]
+        def _get_pkt(m1, m2):
+            return {
+                'parameters' : ['repetition', 'sample'],
+                'data' : {  'ch1' : np.array([[m1+m2+r*x for x in range(8)] for r in range(5)]),
+                            'ch2' : np.array([[m1-2*m2+r*x for x in range(8)] for r in range(5)]) }
+            }
+        expected_ans = np.array([[np.stack([_get_pkt(m1,m2)['data']['ch1'], _get_pkt(m1,m2)['data']['ch2']], axis=-1) for m2 in range(swp_2_vals.size)] for m1 in range(swp_1_vals.size)])
+
+        for cur_opts in [{}, {'layout':'channels'}, {'layout':'channels', 'compression':None}, {'layout':'channels', 'compression':'lzf'},
+                         {'layout':'channels', 'compression':'gzip', 'compression_opts':1, 'shuffle':True}, {'layout':'monolithic', 'compression':'lzf'}]:
+            leFileW = FileIOWriter('test_save_dir/test.h5', **cur_opts)
+            for m1 in range(swp_1_vals.size):
+                for m2 in range(swp_2_vals.size):
+                    leFileW.push_datapkt(_get_pkt(m1,m2), sweep_arr)
+                    if m1 == 1 and m2 == 0:
+                        #Check query_data mid-way through the sweep (including the NaN fill-values of unwritten entries)
+                        arr = leFileW.query_data([0])
+                        assert self.arr_equality(arr, expected_ans[0:1]), f"Querying data failed for the storage options: {cur_opts}."
+                        arr = leFileW.query_data([2])
+                        assert np.isnan(arr).all(), f"Unwritten entries are not NaN for the storage options: {cur_opts}."
+            leFileW.close()
+            #
+            leData = FileIOReader('test_save_dir/test.h5')
+            assert leData.format_version == FileIOWriter.LAYOUT_VERSIONS[cur_opts.get('layout', 'monolithic')], f"The format version was not stored for the storage options: {cur_opts}."
+            assert leData.dep_params == ['ch1', 'ch2'], f"The channel names were not stored properly for the storage options: {cur_opts}."
+            assert self.arr_equality(leData.get_numpy_array(), expected_ans), f"The data was not stored properly for the storage options: {cur_opts}."
+            assert leData.get_time_stamps().shape == expected_ans.shape[:-1], f"The time-stamps were not stored properly for the storage options: {cur_opts}."
+            leData.release()
+            os.remove('test_save_dir/test.h5')
+
+        #Check resizing on the per-channel layout
+        wrtr = FileIOWriter('test_save_dir/test2.h5', layout='channels')
+        for m in range(1,6):
+            for n in range(3):
+                wrtr.push_datapkt(_get_pkt(m,n), [(self.lab.VAR('test_var1'), np.arange(m)), (self.lab.VAR('test_var2'), np.arange(3))])
+        wrtr.close()
+        leData = FileIOReader('test_save_dir/test2.h5')
+        arr = leData.get_numpy_array()
+        assert arr.shape == (5,3,5,8,2), "Something went wrong in the resizing of the per-channel layout?"
+        assert self.arr_equality(arr[4,2], np.stack([_get_pkt(5,2)['data']['ch1'], _get_pkt(5,2)['data']['ch2']], axis=-1)), "The per-channel layout did not resize properly."
+        leData.release()
+
+        self.cleanup()
+
+    def test_BufferedWrites(self):
+        self.initialise()
+        VariableInternal('test_var1', self.lab, 0)
+        VariableInternal('test_var2', self.lab, 0)
+
+        sweep_arr = [(self.lab.VAR('test_var1'), np.arange(4)), (self.lab.VAR('test_var2'), np.arange(5))]
+        def _get_pkt(m, offset=0):
+            return { 'parameters' : ['sample'], 'data' : { 'ch1' : np.arange(6)+10*m+offset, 'ch2' : -np.arange(6)-10*m-offset } }
+        expected_ans = np.stack([np.arange(20)[:,None]*10+np.arange(6), -np.arange(20)[:,None]*10-np.arange(6)], axis=-1).reshape(4,5,6,2)
+        def _get_file_rows(cur_layout):
+            #Reads the file directly (i.e. as seen by a SWMR reader in another process, which cannot flush the writer)
+            with h5py.File('test_save_dir/test.h5', 'r', libver='latest', swmr=True, locking=False) as hf:
+                if cur_layout == 'channels':
+                    return np.stack([hf['data']['ch1'][:], hf['data']['ch2'][:]], axis=-1).reshape(20,6,2)
+                return hf['data'][:].reshape(20,6,2)
+
+        for cur_layout in ['monolithic', 'channels']:
+            #Check buffering by number of packets - unflushed packets are not visible to a SWMR reader until the flush
+            leFileW = FileIOWriter('test_save_dir/test.h5', layout=cur_layout, buffer_packets=7)
+            for m in range(20):
+                cur_pkt = _get_pkt(m)
+                leFileW.push_datapkt(cur_pkt, sweep_arr)
+                cur_pkt['data']['ch1'][:] = 0  #The buffer must not be affected by the caller reusing the arrays
+                if m == 8:
+                    arr = _get_file_rows(cur_layout)
+                    assert self.arr_equality(arr[:7], expected_ans.reshape(20,6,2)[:7]), "Buffered packets were not flushed after reaching buffer_packets."
+                    assert np.isnan(arr[7:]).all(), "Buffered packets were written before reaching buffer_packets."
+                    #query_data must flush the buffer
+                    arr = leFileW.query_data([0])
+                    assert self.arr_equality(arr, expected_ans[0:1]), "Querying data returned the wrong values."
+                    arr = _get_file_rows(cur_layout)
+                    assert self.arr_equality(arr[:9], expected_ans.reshape(20,6,2)[:9]), "Querying data did not flush the buffered packets."
+                #A FileIOReader in this process must flush the buffer before reading (also on reusing an opened reader)
+                if m == 10:
+                    leData = FileIOReader('test_save_dir/test.h5')
+                    assert np.isnan(_get_file_rows(cur_layout)[11:]).all() and self.arr_equality(_get_file_rows(cur_layout)[:11], expected_ans.reshape(20,6,2)[:11]), "Opening a FileIOReader did not flush the buffered packets."
+                if m == 12:
+                    arr = leData.get_numpy_array().reshape(20,6,2)
+                    assert self.arr_equality(arr[:13], expected_ans.reshape(20,6,2)[:13]) and np.isnan(arr[13:]).all(), "Reading via a FileIOReader did not flush the buffered packets."
+                    leData.release()
+            leFileW.close()
+            leData = FileIOReader('test_save_dir/test.h5')
+            leData.refresh()
+            assert self.arr_equality(leData.get_numpy_array(), expected_ans), "Buffered packets were not flushed on closing."
+            assert not (leData.get_time_stamps() == np.datetime64()).any(), "Buffered time-stamps were not written."
+            leData.release()
+            os.remove('test_save_dir/test.h5')
+            #
+            #Check buffering solely on query_data/close with out-of-order and rewritten packet indices
+            leFileW = FileIOWriter('test_save_dir/test.h5', layout=cur_layout, buffer_packets=None)
+            for m in range(20):
+                leFileW.push_datapkt(_get_pkt(m, 5), sweep_arr, dset_ind=19-m)
+            for m in range(20):
+                leFileW.push_datapkt(_get_pkt(m), sweep_arr, dset_ind=m)
+            leFileW.close()
+            leData = FileIOReader('test_save_dir/test.h5')
+            assert self.arr_equality(leData.get_numpy_array(), expected_ans), "Buffered packets were not written in the pushed order."
+            leData.release()
+            os.remove('test_save_dir/test.h5')
+            #
+            #Check buffering by time - the buffer must be flushed even if no further packets are pushed
+            leFileW = FileIOWriter('test_save_dir/test.h5', layout=cur_layout, buffer_packets=None, buffer_time=0.5)
+            leFileW.push_datapkt(_get_pkt(0), sweep_arr)
+            leFileW.push_datapkt(_get_pkt(1), sweep_arr)
+            assert np.isnan(_get_file_rows(cur_layout)).all(), "Buffered packets were written before buffer_time."
+            time.sleep(1.0)
+            arr = _get_file_rows(cur_layout)
+            assert self.arr_equality(arr[:2], expected_ans.reshape(20,6,2)[:2]) and np.isnan(arr[2:]).all(), "Buffered packets were not flushed after buffer_time."
+            leFileW.push_datapkt(_get_pkt(2), sweep_arr)
+            time.sleep(1.0)
+            assert self.arr_equality(_get_file_rows(cur_layout)[:3], expected_ans.reshape(20,6,2)[:3]), "Buffered packets were not flushed after buffer_time."
+            leFileW.close()
+            os.remove('test_save_dir/test.h5')
+
+        self.cleanup()
+
+    def test_TimeStampFormats(self):
+        self.initialise()
+        VariableInternal('test_var1', self.lab, 0)
+        VariableInternal('test_var2', self.lab, 0)
+
+        sweep_arr = [(self.lab.VAR('test_var1'), np.arange(4)), (self.lab.VAR('test_var2'), np.arange(5))]
+        data_pkt = { 'parameters' : ['sample'], 'data' : { 'ch1' : np.arange(6), 'ch2' : -np.arange(6) } }
+        for cur_opts in [{'timestamp_format':'string'}, {'timestamp_format':'ns'}, {'timestamp_format':'ns_packet'},
+                         {'timestamp_format':'ns_packet', 'layout':'channels', 'buffer_packets':3}]:
+            leFileW = FileIOWriter('test_save_dir/test.h5', **cur_opts)
+            t_start = np.datetime64(datetime.now())
+            order = np.random.default_rng(1).permutation(19)
+            for m in order:
+                leFileW.push_datapkt(data_pkt, sweep_arr, dset_ind=m)
+                time.sleep(0.001)
+            leFileW.close()
+            leData = FileIOReader('test_save_dir/test.h5')
+            ts = leData.get_time_stamps()
+            assert ts.shape == (4,5,6), f"The time-stamps have the wrong shape for the options: {cur_opts}."
+            ts = ts.reshape(20,6)
+            assert np.isnat(ts[19]).all(), f"The unwritten time-stamps are not NaT for the options: {cur_opts}."
+            assert not np.isnat(ts[:19]).any(), f"The time-stamps were not written for the options: {cur_opts}."
+            assert (ts[:19] >= t_start).all() and (ts[:19] <= np.datetime64(datetime.now())).all(), f"The time-stamps are not the local time for the options: {cur_opts}."
+            assert (ts[:19] == ts[:19,0:1]).all(), f"The time-stamps differ within a data packet for the options: {cur_opts}."
+            assert self.arr_equality(np.argsort(ts[order,0]), np.arange(19)), f"The time-stamps do not match the storage order for the options: {cur_opts}."
+            if cur_opts['timestamp_format'] == 'ns_packet':
+                assert leData.dsetTS.shape == (20,), "The time-stamps were not stored per data packet."
+            leData.release()
+            os.remove('test_save_dir/test.h5')
+
+        #Check resizing with per-packet time-stamps
+        leFileW = FileIOWriter('test_save_dir/test.h5', timestamp_format='ns_packet')
+        for m in range(1,4):
+            sweep_arr = [(self.lab.VAR('test_var1'), np.arange(m)), (self.lab.VAR('test_var2'), np.arange(5))]
+            for n in range(5):
+                leFileW.push_datapkt(data_pkt, sweep_arr)
+        leFileW.close()
+        leData = FileIOReader('test_save_dir/test.h5')
+        ts = leData.get_time_stamps()
+        assert ts.shape == (3,5,6) and not np.isnat(ts).any(), "The per-packet time-stamps were not resized properly."
+        leData.release()
+        os.remove('test_save_dir/test.h5')
+
+        self.cleanup()
+
+    def test_LazyReader(self):
+        self.initialise()
+        VariableInternal('test_var1', self.lab, 0)
+        VariableInternal('test_var2', self.lab, 0)
+
+        sweep_arr = [(self.lab.VAR('test_var1'), np.arange(5)*0.5), (self.lab.VAR('test_var2'), np.arange(7)+10)]
+        expected_ans = np.random.rand(5,7,3,4,2)
+        for cur_layout in ['monolithic', 'channels']:
+            leFileW = FileIOWriter('test_save_dir/test.h5', layout=cur_layout)
+            for m in range(5):
+                for n in range(7):
+                    leFileW.push_datapkt({'parameters' : ['rep', 'sample'], 'data' : {'ch1' : expected_ans[m,n,:,:,0], 'ch2' : expected_ans[m,n,:,:,1]}}, sweep_arr)
+            leFileW.close()
+            leData = FileIOReader('test_save_dir/test.h5')
+            larr = leData.get_lazy_array()
+            assert larr.shape == expected_ans.shape, f"The lazy array has the wrong shape for the layout {cur_layout}."
+            for cur_key in [1, (1,2), (slice(1,4),[6,0,2]), (Ellipsis,0), (-1,slice(None,None,-2),1,slice(3,0,-2)), (slice(2,2),)]:
+                assert self.arr_equality(larr[cur_key], expected_ans[cur_key]), f"Indexing the lazy array with {cur_key} failed for the layout {cur_layout}."
+            assert self.arr_equality(larr[[4,0],:,[2,1]], expected_ans[[4,0]][:,:,[2,1]]), "Lists of indices were not applied independently along each axis."
+            #Coordinate selection
+            assert self.arr_equality(larr.sel({'test_var1':1.0, 'test_var2':slice(11,13)}, 'ch2'), expected_ans[2,1:4,...,1]), "Selecting via parameter values failed."
+            assert self.arr_equality(larr.sel({'test_var1':[2.0,0.4]}, ['ch2','ch1']), expected_ans[[4,1]][...,[1,0]]), "Selecting via lists of parameter values failed."
+            #Chunk iteration
+            num_chunks = 0
+            for cur_key, cur_data in larr.iter_chunks(axis=1, block_size=3):
+                assert self.arr_equality(cur_data, expected_ans[cur_key]), "The chunk iteration returned the wrong data."
+                num_chunks += 1
+            assert num_chunks == 5*3, "The chunk iteration did not cover the whole array."
+            #Lazy xarray
+            xarr = leData.get_xarray(lazy=True)
+            assert self.arr_equality(xarr['ch1'].sel(test_var1=1.0).values, expected_ans[2,...,0]), "The lazy xarray returned the wrong data."
+            leData.release()
+            os.remove('test_save_dir/test.h5')
+
+        self.cleanup()
+
 if __name__ == '__main__':
     temp = TestExpFileIO()
     temp.test_DataResizing()
@@ -19,6 +19,7 @@ from sqdtoolz.HAL.Processors.CPU.CPU_FIR import*
 from sqdtoolz.HAL.Processors.CPU.CPU_Mean import*
 
 from sqdtoolz.ExperimentSweeps import*
+from sqdtoolz.HaltSignal import HaltSignalInotify
 
 import numpy as np
 import shutil
@@ -26,6 +27,9 @@ import os.path
 import time
 
 import unittest
+import subprocess
+import threading
+import sys
 
 class TestColdReload(unittest.TestCase):
     def initialise(self):
@@ -615,6 +619,61 @@ class TestColdReload(unittest.TestCase):
         os.remove('UnitTests/laboratory_parameters.txt')
         self.cleanup()
 
+    def test_LazyImports(self):
+        #Analysis-only imports should not pull in QCoDeS or the HAL/ZI modules
+        code = "import sys; from sqdtoolz.Utilities.FileIO import FileIOReader; import sqdtoolz as stz; print([x for x in ['qcodes', 'laboneq', 'sqdtoolz.Laboratory', 'sqdtoolz.HAL.AWG'] if x in sys.modules])"
+        proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+        assert proc.returncode == 0, proc.stderr
+        assert proc.stdout.strip() == '[]', f"Analysis-only imports loaded the modules: {proc.stdout.strip()}"
+        #The package namespace is resolved on first use
+        code = "import sqdtoolz as stz; print(stz.Laboratory.__name__, stz.ExperimentConfiguration.__name__, stz.WFS_Gaussian.__name__, stz.CPU_Mean.__name__, stz.VariableInternal.__name__)"
+        proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+        assert proc.returncode == 0, proc.stderr
+        assert proc.stdout.split() == ['Laboratory', 'ExperimentConfiguration', 'WFS_Gaussian', 'CPU_Mean', 'VariableInternal'], f"Lazy package namespace returned: {proc.stdout}"
+        #Check the class registry
+        from sqdtoolz.ClassRegistry import get_class, register_class
+        assert get_class('GENsmu') is GENsmu, "ClassRegistry did not resolve GENsmu."
+        assert get_class('ProcessorCPU') is ProcessorCPU, "ClassRegistry did not resolve ProcessorCPU."
+        self.assertRaises(AssertionError, get_class, 'HALnotThere')
+        register_class('HALnotThere', ACQ)
+        assert get_class('HALnotThere') is ACQ, "ClassRegistry did not resolve a registered class."
+
+    def test_LoadInstruments(self):
+        os.makedirs('test_save_dir', exist_ok=True)
+        with open('test_save_dir/bulk_instruments.yaml', 'w') as outfile:
+            outfile.write("instruments:\n")
+            for cur_instr, cur_type, cur_delay in [('bulkACQ', 'dummyACQ.DummyACQ', 0.5), ('bulkDDG', 'dummyDDG.DummyDDG', 0.5), ('bulkAWG', 'dummyAWG.DummyAWG', 0.5),
+                                                   ('bulkMWS', 'dummyGENmwSource.DummyGENmwSrc', 0.5), ('bulkSMU', 'dummySMU.DummySMU', 0.5), ('bulkSlow', 'dummyDDG.DummyDDG', 2.0)]:
+                outfile.write(f"  {cur_instr}:\n    type: sqdtoolz.Drivers.{cur_type}\n    init:\n      init_delay: {cur_delay}\n")
+        lab = Laboratory('test_save_dir/bulk_instruments.yaml', 'test_save_dir/')
+        #
+        #Check that the instruments are loaded concurrently while respecting dependencies
+        t0 = time.time()
+        report = lab.load_instruments(['bulkACQ', 'bulkAWG', 'bulkMWS', 'bulkSMU'], max_workers=4, dependencies={'bulkACQ' : ['bulkDDG']}, print_report=False)
+        t_load = time.time() - t0
+        assert t_load < 1.8, f"Loading the instruments took {t_load}s; they were not loaded concurrently."
+        assert set(report.keys()) == set(['bulkACQ', 'bulkDDG', 'bulkAWG', 'bulkMWS', 'bulkSMU']), "The dependency bulkDDG was not loaded."
+        assert all(report[x]['Status'] == 'loaded' for x in report), "Not all instruments were loaded."
+        assert all(report[x]['Time'] >= 0.5 for x in report), "The initialisation times were not reported."
+        ACQ("acq", lab, 'bulkACQ')
+        DDG("ddg", lab, 'bulkDDG')
+        #Already loaded instruments are not reloaded
+        report = lab.load_instruments(['bulkAWG'], print_report=False)
+        assert report['bulkAWG']['Status'] == 'already loaded', "An already loaded instrument was reloaded."
+        #Check cyclic dependencies
+        self.assertRaises(AssertionError, lab.load_instruments, ['bulkSMU'], dependencies={'bulkSMU' : ['bulkSlow'], 'bulkSlow' : ['bulkSMU']}, print_report=False)
+        #Check time-outs
+        self.assertRaises(AssertionError, lab.load_instruments, ['bulkSlow'], timeout=0.5, print_report=False)
+        assert 'bulkSlow' not in lab._activated_instruments, "A timed-out instrument was registered as loaded."
+        time.sleep(2.0)    #Let the abandoned initialisation finish before releasing the instruments
+        assert 'bulkSlow' not in lab._station.components, "A timed-out instrument was registered in the station after its time-out."
+        assert 'bulkSlow' not in qc.Instrument._all_instruments, "A timed-out instrument was not closed after its time-out."
+        #The late instrument can be loaded again
+        report = lab.load_instruments(['bulkSlow'], print_report=False)
+        assert report['bulkSlow']['Status'] == 'loaded' and 'bulkSlow' in lab._station.components, "A timed-out instrument could not be reloaded."
+        lab.release_all_instruments()
+        shutil.rmtree('test_save_dir')
+
 
 class TestSweeps(unittest.TestCase):
     def initialise(self):
@@ -712,6 +771,173 @@ class TestSweeps(unittest.TestCase):
         shutil.rmtree('test_save_dir')
         self.cleanup()
 
+    def test_UpdateStateDebounce(self):
+        self.initialise()
+
+        def _read_state():
+            with open('test_save_dir/_last_vars.txt') as json_file:
+                return json.load(json_file), os.stat('test_save_dir/_last_vars.txt').st_mtime_ns
+        self.lab.update_state()
+        assert os.path.isfile('test_save_dir/_last_state.txt') and os.path.isfile('test_save_dir/_last_exp_configs.txt'), "The state files were not written."
+        assert not os.path.isfile('test_save_dir/_last_vars.txt.tmp'), "The temporary state file was not moved into place."
+        data, mtime = _read_state()
+        #Unchanged state must not rewrite the files
+        time.sleep(0.05)
+        self.lab.update_state()
+        assert _read_state()[1] == mtime, "The state files were rewritten without any changes."
+        #Debounced updates within UpdateStateInterval are skipped
+        self.lab.UpdateStateInterval = 100
+        self.lab.VAR('myDura1').Value = 7
+        self.lab.update_state(force=False)
+        assert _read_state()[0]['myDura1']['Value'] == 2016, "The state update was not debounced."
+        self.lab.update_state()
+        assert _read_state()[0]['myDura1']['Value'] == 7, "A forced state update was debounced."
+        #Debounced updates are written after UpdateStatePings pings
+        self.lab.UpdateStatePings = 3
+        self.lab.VAR('myDura1').Value = 8
+        self.lab.update_state(force=False)
+        self.lab.update_state(force=False)
+        assert _read_state()[0]['myDura1']['Value'] == 7, "The state update was not debounced."
+        self.lab.update_state(force=False)
+        assert _read_state()[0]['myDura1']['Value'] == 8, "The state update was not written after UpdateStatePings pings."
+        #The final state must be written at the end of an experiment
+        self.lab.VAR('myDura1').Value = 9
+        exp = Experiment("test", self.lab.CONFIG('testConf'))
+        leData = self.lab.run_single(exp, [(self.lab.VAR("myFreq"), np.arange(3))])
+        leData.release()
+        assert _read_state()[0]['myDura1']['Value'] == 9, "The state was not written at the end of the experiment."
+
+        shutil.rmtree('test_save_dir')
+        self.cleanup()
+
+    def test_RunIndex(self):
+        self.initialise()
+
+        t_start = datetime.now()
+        paths = []
+        for m, cur_name in enumerate(['testA', 'testB', 'testA']):
+            self.lab.VAR('myDura1').Value = 100+m
+            exp = Experiment(cur_name, self.lab.CONFIG('testConf'))
+            leData = self.lab.run_single(exp, [(self.lab.VAR("myFreq"), np.arange(3))])
+            paths += [os.path.dirname(leData.file_path) + '/']
+            leData.release()
+            if m == 0:
+                t_mid = datetime.now()
+            time.sleep(1)
+        #A failing experiment must be marked as failed
+        class failExp(Experiment):
+            def _run(self, file_path, sweep_vars=[], **kwargs):
+                raise ValueError('Failed!')
+        exp = failExp('testFail', self.lab.CONFIG('testConf'))
+        self.assertRaises(ValueError, self.lab.run_single, exp)
+        #So must an experiment failing after the acquisition (e.g. in the post-processing)
+        class failPostExp(Experiment):
+            def _post_process(self, data):
+                raise ValueError('Failed!')
+        exp = failPostExp('testFailPost', self.lab.CONFIG('testConf'))
+        self.assertRaises(ValueError, self.lab.run_single, exp, [(self.lab.VAR("myFreq"), np.arange(3))])
+        #Invalid arguments are rejected before the run is created or indexed
+        exp = Experiment('testInvalid', self.lab.CONFIG('testConf'))
+        self.assertRaises(AssertionError, self.lab.run_single, exp, rec_params=[(self.lab.VAR("myFreq"), 'NoSuchProperty')])
+
+        runs = self.lab.find_runs()
+        assert [x['Name'] for x in runs] == ['testA', 'testB', 'testA', 'testFail', 'testFailPost'], "The run index did not record the runs in order."
+        assert [x['Status'] for x in runs] == ['completed']*3 + ['failed']*2, "The run index recorded the wrong statuses."
+        assert [x['Path'] for x in runs[:3]] == paths, "The run index recorded the wrong paths."
+        assert [x['Path'] for x in self.lab.find_runs(name='testA')] == [paths[0], paths[2]], "Finding runs by name failed."
+        assert [x['Path'] for x in self.lab.find_runs(start=t_mid, status='completed')] == paths[1:], "Finding runs by time failed."
+        assert [x['Path'] for x in self.lab.find_runs(start=t_start, end=t_mid)] == paths[:1], "Finding runs by time failed."
+        assert self.lab._run_index.get_last_run('completed')['Path'] == paths[2], "The last run was not found."
+        #The variables must be taken from the last completed run
+        self.lab.VAR('myDura1').Value = 0
+        self.lab.update_variables_from_last_expt()
+        assert self.lab.VAR('myDura1').Value == 102, "The variables were not loaded from the last run."
+        #Rebuilding the index from the folders must give the same runs
+        os.remove('test_save_dir/_run_index.txt')
+        runs_rebuilt = self.lab.find_runs()
+        assert [(x['Name'], x['Path'], x['Status']) for x in runs_rebuilt] == [(x['Name'], x['Path'], x['Status']) for x in runs], "Rebuilding the run index failed."
+        #A new run in a save-directory with unindexed runs must not hide them
+        os.remove('test_save_dir/_run_index.txt')
+        time.sleep(1)    #The rebuilt index orders the runs by their folder time-stamps (in seconds)
+        exp = Experiment('testC', self.lab.CONFIG('testConf'))
+        leData = self.lab.run_single(exp, [(self.lab.VAR("myFreq"), np.arange(3))])
+        leData.release()
+        runs_new = self.lab.find_runs()
+        assert [(x['Name'], x['Path'], x['Status']) for x in runs_new[:-1]] == [(x['Name'], x['Path'], x['Status']) for x in runs], "The runs before the index was created were dropped."
+        assert runs_new[-1]['Name'] == 'testC' and runs_new[-1]['Status'] == 'completed', "The new run was not indexed."
+        self.lab.VAR('myDura1').Value = 0
+        self.lab.update_variables_from_last_expt()
+        assert self.lab.VAR('myDura1').Value == 102, "The variables were not loaded from the last run."
+
+        shutil.rmtree('test_save_dir')
+        self.cleanup()
+
+    def test_InstrumentSnapshotCache(self):
+        self.initialise()
+        #Using CH2 as the HALs query CH1 when retrieving their configuration
+        get_ts = lambda snap, instr, param: snap['instruments'][instr]['submodules']['CH2']['parameters'][param]['ts']
+        self.lab.InstrumentSnapshotCached = True
+        #The first snapshot is a full snapshot
+        snap1 = self.lab._get_instrument_snapshot()
+        time.sleep(1.1)  #The time-stamps in the snapshots have a resolution of 1s
+        #Untouched instruments are not re-queried
+        snap2 = self.lab._get_instrument_snapshot()
+        assert get_ts(snap2, 'virMWS', 'frequency') == get_ts(snap1, 'virMWS', 'frequency'), "Cached snapshot re-queried a parameter."
+        #Instruments of HALs with changed configurations are re-queried
+        self.lab.HAL('MW-Src').Power = 9
+        snap3 = self.lab._get_instrument_snapshot()
+        assert snap3['instruments']['virMWS']['submodules']['CH1']['parameters']['power']['value'] == 9, "Cached snapshot did not record the parameter written via the HAL."
+        assert get_ts(snap3, 'virMWS', 'frequency') != get_ts(snap1, 'virMWS', 'frequency'), "Cached snapshot did not re-query the instrument of a changed HAL."
+        assert get_ts(snap3, 'virMWS2', 'frequency') == get_ts(snap1, 'virMWS2', 'frequency'), "Cached snapshot re-queried a parameter."
+        #Volatile parameters are always re-queried
+        time.sleep(1.1)
+        self.lab.InstrumentSnapshotVolatile = ['virMWS2_CH2']
+        snap4 = self.lab._get_instrument_snapshot()
+        assert get_ts(snap4, 'virMWS2', 'frequency') != get_ts(snap3, 'virMWS2', 'frequency'), "Cached snapshot did not re-query a volatile parameter."
+        assert get_ts(snap4, 'virMWS', 'frequency') == get_ts(snap3, 'virMWS', 'frequency'), "Cached snapshot re-queried a parameter."
+        #Stale parameters are re-queried
+        time.sleep(1.1)
+        self.lab.InstrumentSnapshotVolatile = []
+        self.lab.InstrumentSnapshotMaxAge = 0.5
+        snap5 = self.lab._get_instrument_snapshot()
+        assert get_ts(snap5, 'virMWS', 'frequency') != get_ts(snap4, 'virMWS', 'frequency'), "Cached snapshot did not re-query a stale parameter."
+        #Check the full refresh interval
+        time.sleep(1.1)
+        self.lab.InstrumentSnapshotMaxAge = None
+        self.lab.InstrumentSnapshotRefreshInterval = 0
+        snap6 = self.lab._get_instrument_snapshot()
+        assert get_ts(snap6, 'virMWS', 'frequency') != get_ts(snap5, 'virMWS', 'frequency'), "A full snapshot was not taken after the refresh interval."
+        self.cleanup()
+
+    def test_HaltSignal(self):
+        self.initialise()
+        backends = ['flag', 'polling'] + (['inotify'] if HaltSignalInotify.is_available() else [])
+        for cur_backend in backends:
+            self.lab.HaltSignalBackend = cur_backend
+            self.lab.HaltSignalPollInterval = 0.05
+            #A stale HALT.txt is ignored
+            open('test_save_dir/HALT.txt', 'a').close()
+            exp = Experiment("test", self.lab.CONFIG('testConf'))
+            if cur_backend == 'flag':
+                halt_timer = threading.Timer(0.5, self.lab.halt)
+            else:
+                halt_timer = threading.Timer(0.5, lambda: open('test_save_dir/HALT.txt', 'a').close())
+            halt_timer.start()
+            t0 = time.time()
+            res = self.lab.run_single(exp, [(self.lab.VAR("myFreq"), np.arange(100))], delay=0.05, disable_progress_bar=True)
+            t_run = time.time() - t0
+            halt_timer.join()
+            res.release()
+            exp.close_all_read_files()
+            assert t_run < 4.0, f"The {cur_backend} halt signal did not halt the experiment."
+            cur_run = self.lab.find_runs()[-1]
+            assert cur_run['Status'] == 'halted', f"The {cur_backend} halt signal did not halt the experiment."
+            assert os.path.exists(cur_run['Path'] + 'EXPERIMENT MANUALLY HALTED.txt'), "The halted experiment was not marked as manually halted."
+            assert not os.path.exists('test_save_dir/HALT.txt'), "HALT.txt was not removed after halting."
+            time.sleep(1)   #Otherwise it writes to the same folder as the previous run...
+        shutil.rmtree('test_save_dir')
+        self.cleanup()
+
     def test_Exp(self):
         self.initialise()
         
@@ -796,6 +1022,82 @@ class TestSweeps(unittest.TestCase):
         self.cleanup()
 
 
+    def test_ExpPipelined(self):
+        self.initialise()
+
+        #Check that the pipelined mode stores the same data as the serial mode
+        sweeps = [(self.lab.VAR("testAmpl"), np.arange(0,3,1)), (self.lab.VAR('test RepTime'), np.linspace(9,12,4))]
+        exp = Experiment("test", self.lab.CONFIG('testConf'))
+        res_serial = self.lab.run_single(exp, sweeps, rec_params=[self.lab.VAR('testAmpl'), self.lab.VAR('test RepTime')])
+        arr_serial = res_serial.get_numpy_array()
+        arr_rec_serial = exp.last_rec_params.get_numpy_array()
+        res_serial.release()
+        exp.close_all_read_files()
+        time.sleep(1)   #Otherwise it writes to the same file as the previous test...
+        for cur_depth in [1, 3]:
+            exp = Experiment("test", self.lab.CONFIG('testConf'))
+            res = self.lab.run_single(exp, sweeps, rec_params=[self.lab.VAR('testAmpl'), self.lab.VAR('test RepTime')], pipeline_depth=cur_depth)
+            assert self.arr_equality(np.array(res.get_numpy_array().shape), np.array(arr_serial.shape)), "Pipelined mode did not store the same data shape as the serial mode."
+            #The dummy ACQ returns random data - so just check that every sweeping point got committed
+            assert not np.isnan(res.get_numpy_array()).any(), "Pipelined mode did not store every sweeping point."
+            #The recorded parameters must be sampled at acquisition time - not when being stored in the background
+            assert self.arr_equality(exp.last_rec_params.get_numpy_array(), arr_rec_serial), "Pipelined mode did not record the parameters at acquisition time."
+            res.release()
+            exp.close_all_read_files()
+            time.sleep(1)
+        #
+        #Check that the progress (and thus, the laboratory state) is reported on the main thread
+        class threadExp(Experiment):
+            def _update_progress_bar(self, pct_complete):
+                self.ping_threads = getattr(self, 'ping_threads', []) + [threading.current_thread()]
+                super()._update_progress_bar(pct_complete)
+        exp = threadExp("test", self.lab.CONFIG('testConf'))
+        res = self.lab.run_single(exp, sweeps, pipeline_depth=2)
+        assert len(exp.ping_threads) == 12 and all(x is threading.main_thread() for x in exp.ping_threads), "Pipelined mode did not report the progress on the main thread."
+        res.release()
+        exp.close_all_read_files()
+        time.sleep(1)
+        #Experiments overriding _mid_process cannot be pipelined
+        class midExp(Experiment):
+            def _mid_process(self):
+                pass
+        exp = midExp("test", self.lab.CONFIG('testConf'))
+        self.assertRaises(AssertionError, self.lab.run_single, exp, sweeps, pipeline_depth=2)
+        time.sleep(1)
+        #Check that errors in the background worker are propagated to the caller
+        class failExp(Experiment):
+            def _store_datapkt(self, data_pkt, sweep_vars2, sweepEx, rev_ind, ind_coord, primary_file, aux_file, aux_sweep):
+                if ind_coord == 2:
+                    raise ValueError("Intentional failure")
+                super()._store_datapkt(data_pkt, sweep_vars2, sweepEx, rev_ind, ind_coord, primary_file, aux_file, aux_sweep)
+        exp = failExp("test", self.lab.CONFIG('testConf'))
+        assert_found = False
+        try:
+            self.lab.run_single(exp, sweeps, pipeline_depth=2)
+        except ValueError:
+            assert_found = True
+        assert assert_found, "Pipelined mode did not propagate an error raised while committing a sweeping point."
+        for cur_file in exp._cur_filewriters:
+            exp._cur_filewriters[cur_file].close()
+        #Check that an error in the background worker does not replace an error raised in the sweeping loop
+        class failLoopExp(failExp):
+            def _store_datapkt(self, data_pkt, sweep_vars2, sweepEx, rev_ind, ind_coord, primary_file, aux_file, aux_sweep):
+                raise ValueError("Intentional failure")
+            def _prepare_rec_params(self, rec_params, rec_params_extra):
+                self.num_rec_calls = getattr(self, 'num_rec_calls', 0) + 1
+                if self.num_rec_calls == 2:
+                    raise RuntimeError("Intentional failure in the sweeping loop")
+                return super()._prepare_rec_params(rec_params, rec_params_extra)
+        time.sleep(1)
+        exp = failLoopExp("test", self.lab.CONFIG('testConf'))
+        with self.assertWarns(UserWarning):
+            self.assertRaises(RuntimeError, self.lab.run_single, exp, sweeps, rec_params=[self.lab.VAR('testAmpl')], pipeline_depth=2)
+        for cur_file in exp._cur_filewriters:
+            exp._cur_filewriters[cur_file].close()
+
+        shutil.rmtree('test_save_dir')
+        self.cleanup()
+
     def test_ExpReverseSweep(self):
         self.initialise()
         
@@ -1412,6 +1714,37 @@ class TestExpSweeps(unittest.TestCase):
         _test((5,10,5),0)
         _test((5,10,5),2)
         _test((5,7,10,5),1)
+
+    def test_SweepGridLazy(self):
+        #Check lazy grid against the materialised meshgrid (C-ordered with the last sweeping variable innermost)
+        arrs = [np.arange(3), np.linspace(9,12,4), np.array([1.5,2.5]), np.arange(5)*0.1]
+        grid = ExperimentSweepGrid(arrs)
+        mesh = np.array(np.meshgrid(*arrs, indexing='ij')).reshape(len(arrs),-1).T
+        assert len(grid) == mesh.shape[0], "ExperimentSweepGrid has the wrong number of sweeping points."
+        for m, (ind_coord, cur_coord) in enumerate(grid):
+            assert ind_coord == m, "ExperimentSweepGrid did not traverse the indices in order."
+            assert self.arr_equality(cur_coord, mesh[m]), "ExperimentSweepGrid returned incorrect sweeping values."
+        #
+        #Check lazy permutations match the materialised permutations
+        for cur_shape in [(5,10,5), (5,7,10,5), (4,)]:
+            for cur_ind in range(len(cur_shape)):
+                exp_inds = ExSwpSnake(cur_ind).get_sweep_indices(np.arange(np.prod(cur_shape)), cur_shape)
+                grid = ExperimentSweepGrid([np.arange(x) for x in cur_shape], [ExSwpSnake(cur_ind)])
+                assert self.arr_equality(np.array([x[0] for x in grid]), exp_inds), "Lazy ExSwpSnake did not permute the indices correctly."
+                #
+                grid = ExperimentSweepGrid([np.arange(x) for x in cur_shape], [ExSwpRandom(cur_ind)])
+                rnd_inds = np.array([x[0] for x in grid])
+                assert self.arr_equality(np.sort(rnd_inds), np.arange(np.prod(cur_shape))), "Lazy ExSwpRandom is not a permutation."
+                block_size = int(np.prod(cur_shape[cur_ind:]))
+                assert self.arr_equality(rnd_inds // block_size, np.arange(np.prod(cur_shape)) // block_size), "Lazy ExSwpRandom did not preserve the outer sweeping order."
+        #
+        #Check composition of multiple orderings
+        cur_shape = (4,3,5)
+        exp_inds = np.arange(np.prod(cur_shape))
+        for cur_order in [ExSwpSnake(1), ExSwpSnake(2)]:
+            exp_inds = cur_order.get_sweep_indices(exp_inds, cur_shape)
+        grid = ExperimentSweepGrid([np.arange(x) for x in cur_shape], [ExSwpSnake(1), ExSwpSnake(2)])
+        assert self.arr_equality(np.array([x[0] for x in grid]), exp_inds), "Lazy composition of sweep orderings is incorrect."
     
     def test_SnakeExp(self):
         self.initialise()
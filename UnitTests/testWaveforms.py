@@ -11,6 +11,7 @@ from sqdtoolz.HAL.GENmwSource import*
 
 from sqdtoolz.HAL.WaveformGeneric import*
 from sqdtoolz.HAL.WaveformMapper import*
+from sqdtoolz.HAL.WaveformCache import WaveformCache
 
 
 from sqdtoolz.HAL.Processors.ProcessorCPU import*
@@ -926,6 +927,229 @@ class TestAWGChecks(unittest.TestCase):
         shutil.rmtree('test_save_dir')
         self.cleanup()
 
+    def test_Assembly(self):
+        self.initialise()
+        WFMT_ModulationIQ('IQmod', self.lab, 47e7)
+        def concat_segs(wfm_segs, fs, ch_index):
+            ret_wfm = np.array([])
+            for cur_seg in wfm_segs:
+                if cur_seg.NumPts(fs) > 0:
+                    ret_wfm = np.concatenate((ret_wfm, cur_seg.get_waveform(self.lab, fs, ret_wfm.size, ch_index)))
+            return ret_wfm
+        #Groups whose individual segments round to fewer (4.5 => 4 points each) or more (2.6 => 3 points each) points than the group
+        wfm_segs = [WFS_Gaussian("init", self.lab.WFMT('IQmod').apply(), 20e-9, 0.4),
+                    WFS_Group("grpShort", [WFS_Constant("c1", None, 4.5e-9, 0.1), WFS_Gaussian("g1", None, 4.5e-9, 0.3)], num_repeats=3),
+                    WFS_Constant("zero", None, 0.0, 0.2),
+                    WFS_Group("grpLong", [WFS_Constant("c2", None, 2.6e-9, 0.5), WFS_Cosine("cs", None, 2.6e-9, 0.3, 1e8)], num_repeats=2),
+                    WFS_Gaussian("init2", self.lab.WFMT('IQmod').apply(), 20e-9, 0.4)]
+        for ch in range(2):
+            wfm_ref = concat_segs(wfm_segs, 1e9, ch)
+            wfm_new = assemble_waveform_segments(wfm_segs, self.lab, 1e9, 0, ch)
+            assert wfm_new.dtype == wfm_ref.dtype and np.array_equal(wfm_ref, wfm_new), "Preallocated waveform assembly does not match the concatenated waveform."
+        #Long sequences on the AWG
+        awg_wfm = self.lab.HAL("Wfm1")
+        awg_wfm.clear_segments()
+        for m in range(200):
+            awg_wfm.add_waveform_segment(WFS_Gaussian(f"pulse{m}", self.lab.WFMT('IQmod').apply(), 20e-9, 0.1 + 0.001*m))
+            awg_wfm.add_waveform_segment(WFS_Constant(f"idle{m}", None, 4e-9 * (m % 3), 0.0))
+        wfms = awg_wfm.get_raw_waveforms()
+        for ch in range(2):
+            for cur_seg in awg_wfm._wfm_segment_list:
+                cur_seg.reset_waveform_transforms(self.lab)
+            assert np.array_equal(concat_segs(awg_wfm._wfm_segment_list, 1e9, ch), wfms[ch]), "Preallocated waveform assembly does not match the concatenated waveform on the AWG."
+        self.cleanup()
+
+    def test_AutoCompression(self):
+        self.initialise()
+        awg_wfm = self.lab.HAL("Wfm1")
+        awg_wfm.clear_segments()
+        #Repeated pulses (the dummy AWG chunks are 8 points) with NaN chunks that cannot match anything (as per np.array_equal)
+        for m in range(20):
+            awg_wfm.add_waveform_segment(WFS_Gaussian(f"pulse{m}", None, 16e-9, 0.1*(m%3)))
+            awg_wfm.add_waveform_segment(WFS_Constant(f"idle{m}", None, 8e-9, 0.0))
+        awg_wfm.add_waveform_segment(WFS_Constant("nan1", None, 8e-9, np.nan))
+        awg_wfm.add_waveform_segment(WFS_Constant("nan2", None, 8e-9, np.nan))
+        awg_wfm.get_output_channel(0).marker(0).set_markers_to_segments(["pulse3"])
+        final_wfms = awg_wfm.get_raw_waveforms()
+        for linked in [False, True]:
+            awg_wfm.AutoCompression = 'Basic'
+            awg_wfm.AutoCompressionLinkChannels = linked
+            awg_wfm.prepare_initial()
+            seq_datas = awg_wfm.cur_wfms_to_commit
+            for ch, dict_wfm_data in enumerate(seq_datas):
+                seq_ids = dict_wfm_data['seq_ids']
+                assert np.array_equal(np.concatenate([dict_wfm_data['waveforms'][x] for x in seq_ids]), final_wfms[ch], equal_nan=True), "Auto-compressed waveform does not reproduce the original waveform."
+                #Unique segments are numbered in order of their first appearance
+                first_ids = [x for ind, x in enumerate(seq_ids) if x not in seq_ids[:ind]]
+                assert first_ids == list(range(len(dict_wfm_data['waveforms']))), "Unique segments are not indexed in order of appearance."
+            #The unique segments (waveforms and markers across the linked channels) must be distinct (NaNs never match)
+            for ch in range(len(seq_datas) if not linked else 1):
+                cur_chs = range(len(seq_datas)) if linked else [ch]
+                num_segs = len(seq_datas[ch]['waveforms'])
+                for m in range(num_segs):
+                    for n in range(m+1, num_segs):
+                        seg_equal = all([np.array_equal(seq_datas[c]['waveforms'][m], seq_datas[c]['waveforms'][n]) for c in cur_chs])
+                        mkrs_equal = all([np.array_equal(x, y) for c in cur_chs for x, y in zip(seq_datas[c]['markers'][m], seq_datas[c]['markers'][n])])
+                        assert not (seg_equal and mkrs_equal), "Unique segments are repeated in the auto-compressed sequence."
+                assert sum([np.isnan(x).any() for x in seq_datas[ch]['waveforms']]) == 2, "NaN segments were matched."
+                assert num_segs < 16, "Auto-compression did not find the repeated segments."
+        #-0.0 chunks must match 0.0 chunks (as per np.array_equal)
+        test_wfm = np.concatenate([np.zeros(8), np.ones(8), -np.zeros(8), np.full(8, np.nan), np.full(8, np.nan)])
+        dict_wfm_data = awg_wfm._program_auto_comp_basic(awg_wfm._awg_chan_list[0], test_wfm, [np.array([])])
+        assert dict_wfm_data['seq_ids'] == [0, 1, 0, 2, 3], "Auto-compression did not match the -0.0 and 0.0 chunks."
+        dict_wfm_datas = awg_wfm._program_auto_comp_basic_linked(8, [test_wfm, test_wfm*1.0], [[np.array([])], [np.array([])]])
+        assert dict_wfm_datas[1]['seq_ids'] == [0, 1, 0, 2, 3], "Linked auto-compression did not match the -0.0 and 0.0 chunks."
+        self.cleanup()
+
+    def test_WaveformCache(self):
+        self.initialise()
+        WFMT_ModulationIQ('IQmod', self.lab, 47e7)
+        awg_wfm = self.lab.HAL("Wfm1")
+        awg_wfm.clear_segments()
+        #Phase offsets accumulate in the WFMT state - so it must be restored on cache hits
+        for m in range(6):
+            awg_wfm.add_waveform_segment(WFS_Gaussian(f"pulse{m}", self.lab.WFMT('IQmod').apply(phase_offset=0.1*m), 20e-9, 0.5))
+            awg_wfm.add_waveform_segment(WFS_Constant(f"idle{m}", None, 8e-9, 0.0))
+        awg_wfm.add_waveform_segment(WFS_Cosine("cos", self.lab.WFMT('IQmod').apply(phase=0.2), 16e-9, 0.3, 1e8))
+        awg_wfm.add_waveform_segment(WFS_RandomGaussian("noise", None, 16e-9, 0.1))
+        wfm_cache = self.lab.WaveformCache
+        def get_reference():
+            self.lab._waveform_cache = WaveformCache(0)
+            ret_wfms = awg_wfm.get_raw_waveforms()
+            self.lab._waveform_cache = wfm_cache
+            return ret_wfms
+        wfm_cache.clear()
+        wfms_ref = get_reference()
+        wfm_cache.reset_stats()
+        wfms = awg_wfm.get_raw_waveforms()
+        assert all(np.array_equal(x, y) for x, y in zip(wfms, wfms_ref)), "Waveforms assembled via the cache do not match the uncached waveforms."
+        #The identical idle and pulse envelopes are shared across positions and channels
+        stats = wfm_cache.get_stats()
+        assert stats['Misses'] == 4 + 2*7, f"Unexpected number of cache misses: {stats}."
+        wfm_cache.reset_stats()
+        wfms = awg_wfm.get_raw_waveforms()
+        assert all(np.array_equal(x, y) for x, y in zip(wfms, wfms_ref)), "Waveforms assembled from the cache do not match the uncached waveforms."
+        assert wfm_cache.get_stats()['Misses'] == 0, "Unchanged waveform segments were not reused from the cache."
+        #Only the changed pulse is recomputed
+        wfm_cache.reset_stats()
+        awg_wfm.get_waveform_segment('pulse2').Amplitude = 0.25
+        wfms = awg_wfm.get_raw_waveforms()
+        assert wfm_cache.get_stats()['Misses'] == 1 + 2, "More than the changed waveform segment was recomputed."
+        assert all(np.array_equal(x, y) for x, y in zip(wfms, get_reference())), "Waveforms assembled via the cache do not match the uncached waveforms."
+        #Changing the WFMT recomputes all the transformed segments
+        wfm_cache.reset_stats()
+        self.lab.WFMT('IQmod').IQFrequency = 50e6
+        wfms = awg_wfm.get_raw_waveforms()
+        assert wfm_cache.get_stats()['Misses'] == 2*7, "The transformed segments were not recomputed when changing the WFMT."
+        assert all(np.array_equal(x, y) for x, y in zip(wfms, get_reference())), "Waveforms assembled via the cache do not match the uncached waveforms."
+        #Returned segment waveforms are writable copies while the cached arrays are read-only
+        seg_wfm = awg_wfm.get_waveform_segment('pulse0').get_waveform(self.lab, 1e9, 0, 0)
+        seg_wfm *= 2
+        assert all(np.array_equal(x, y) for x, y in zip(awg_wfm.get_raw_waveforms(), wfms)), "The cached waveform segments were modified."
+        #Unseeded noise must not be cached
+        awg_wfm.get_waveform_segment('noise').Seed = None
+        wfms = awg_wfm.get_raw_waveforms()
+        assert not np.array_equal(wfms[0], awg_wfm.get_raw_waveforms()[0]), "Unseeded noise was reused from the cache."
+        awg_wfm.get_waveform_segment('noise').Seed = 42
+        wfms = awg_wfm.get_raw_waveforms()
+        #Memory budget
+        wfm_cache.MaxBytes = 1000
+        stats = wfm_cache.get_stats()
+        assert stats['Bytes'] <= 1000 and stats['Evictions'] > 0, "The waveform cache exceeds its memory budget."
+        assert all(np.array_equal(x, y) for x, y in zip(awg_wfm.get_raw_waveforms(), wfms)), "Waveforms assembled via a small cache do not match the uncached waveforms."
+        wfm_cache.MaxBytes = 128e6
+        self.cleanup()
+
+    def test_IQCarrierCache(self):
+        self.initialise()
+        def modulate_ref(wfmt, wfm_pts, fs, t0_ind, ch_index, cur_t0, t_off):
+            #Direct evaluation of the carrier over the time vector
+            t_vals = np.arange(wfm_pts.size) / fs + t0_ind / fs - cur_t0 - t_off
+            if ch_index == 0:
+                return wfm_pts * wfmt.IQAmplitude * np.cos(2 * np.pi * wfmt.IQFrequency * t_vals) + wfmt.IQdcOffset[0]
+            return wfm_pts * wfmt.IQAmplitude * wfmt.IQAmplitudeFactor * np.sin(2 * np.pi * wfmt.IQFrequency * t_vals + wfmt.IQPhaseOffset) + wfmt.IQdcOffset[1]
+        def arr_equality(arr1, arr2):
+            #The carrier phase grows with t0 - so the tolerance is larger than ERR_TOL
+            return arr1.size == arr2.size and np.max(np.abs(arr1 - arr2)) < 1e-10
+        wfmt = WFMT_ModulationIQ('IQmod', self.lab, 47e7, iq_amplitude=0.8, iq_amplitude_factor=0.9, iq_phase_offset=0.3, iq_dc_offsets=(0.01, -0.02))
+        wfm_pts = np.random.rand(40)
+        for upper_sb in [True, False]:
+            wfmt.IQUpperSideband = upper_sb
+            sgn = 1 if upper_sb else -1
+            for t0_ind in [0, 40, 123456]:
+                for ch in range(2):
+                    wfmt.initialise_for_new_waveform()
+                    assert arr_equality(wfmt.modify_waveform(wfm_pts, 1e9, t0_ind, ch), modulate_ref(wfmt, wfm_pts, 1e9, t0_ind, ch, 0.0, 0.0)), "IQ modulation via the cached carrier is incorrect."
+                    wfmt.initialise_for_new_waveform()
+                    cur_t0 = t0_ind/1e9 + sgn*0.7/(2*np.pi*47e7)
+                    t_off = sgn*0.4/(2*np.pi*47e7)
+                    assert arr_equality(wfmt.modify_waveform(wfm_pts, 1e9, t0_ind, ch, phase=0.7, phase_segment=0.4), modulate_ref(wfmt, wfm_pts, 1e9, t0_ind, ch, cur_t0, t_off)), "IQ modulation with phases via the cached carrier is incorrect."
+                    cur_t0 += sgn*0.2/(2*np.pi*47e7)
+                    assert arr_equality(wfmt.modify_waveform(wfm_pts, 1e9, t0_ind, ch, phase_offset=0.2), modulate_ref(wfmt, wfm_pts, 1e9, t0_ind, ch, cur_t0, 0.0)), "IQ modulation with phase offsets via the cached carrier is incorrect."
+        #Changing the frequency must not reuse the previous carrier
+        wfmt.IQUpperSideband = True
+        wfmt.IQFrequency = 13e6
+        wfmt.initialise_for_new_waveform()
+        assert arr_equality(wfmt.modify_waveform(wfm_pts, 1e9, 80, 1), modulate_ref(wfmt, wfm_pts, 1e9, 80, 1, 0.0, 0.0)), "IQ modulation used a stale carrier."
+        #Single precision
+        wfmt.IQSinglePrecision = True
+        wfmt.initialise_for_new_waveform()
+        cur_wfm = wfmt.modify_waveform(wfm_pts, 1e9, 80, 0)
+        assert cur_wfm.dtype == np.float32, "Single precision IQ modulation did not return float32 waveforms."
+        assert np.max(np.abs(cur_wfm - modulate_ref(wfmt, wfm_pts, 1e9, 80, 0, 0.0, 0.0))) < 1e-6, "Single precision IQ modulation is incorrect."
+        self.lab.HAL("Wfm1").add_waveform_segment(WFS_Gaussian("pulse", wfmt.apply(), 40e-9, 0.5))
+        wfms = self.lab.HAL("Wfm1").get_raw_waveforms()
+        assert wfms[0].dtype == np.float64, "The assembled waveform should remain in double precision."
+        assert WFMT_ModulationIQ.fromConfigDict(wfmt._get_current_config(), self.lab).IQSinglePrecision, "IQSinglePrecision was not saved in the WFMT configuration."
+        wfmt.IQSinglePrecision = False
+        self.cleanup()
+
+    def test_PartialReprogramming(self):
+        self.initialise()
+        awg_wfm = self.lab.HAL("Wfm1")
+        instr_awg = awg_wfm._awg_chan_list[0]._instr_awg
+        #Repeated pulses (the dummy AWG chunks are 8 points) with a unique probe pulse
+        for m in range(6):
+            awg_wfm.add_waveform_segment(WFS_Gaussian(f"pulse{m}", None, 16e-9, 0.5))
+            awg_wfm.add_waveform_segment(WFS_Constant(f"idle{m}", None, 8e-9, 0.0))
+        awg_wfm.add_waveform_segment(WFS_Constant("probe", None, 16e-9, 0.7))
+        awg_wfm.add_waveform_segment(WFS_Constant("pad", None, 8e-9, 0.0))
+        def program():
+            awg_wfm.prepare_initial()
+            awg_wfm.prepare_final()
+            return [instr_awg._last_prog_segments.get(x, 'None') for x in ['CH1', 'CH2']]
+        for comp in ['None', 'Basic']:
+            awg_wfm.AutoCompression = comp
+            awg_wfm.get_waveform_segment('probe').Value = 0.7
+            awg_wfm.get_waveform_segment('pulse1').Amplitude = 0.5
+            instr_awg._last_prog_segments = {}
+            #Initial programming is always done in full
+            assert program() == [None, None], "The initial programming of the AWG channels was not done in full."
+            #Nothing is programmed if nothing has changed
+            instr_awg._last_prog_segments = {}
+            assert program() == ['None', 'None'], "Unchanged waveforms were reprogrammed."
+            #Only the changed memory segments are programmed
+            awg_wfm.get_waveform_segment('probe').Value = 0.6
+            if comp == 'None':
+                assert program() == [([0], []), ([0], [])], "The changed uncompressed waveform was not programmed as a single segment."
+            else:
+                probe_ind = awg_wfm.cur_wfms_to_commit[0]['seq_ids'][18]
+                assert program() == [([probe_ind], []), ([probe_ind], [])], "Only the changed memory segments should be programmed."
+                #Changing the memory layout (i.e. a new unique segment) reprograms all channels in full
+                awg_wfm.get_waveform_segment('pulse1').Amplitude = 0.4
+                assert program() == [None, None], "The AWG channels were not reprogrammed in full when changing the memory layout."
+            #The programmed waveforms match the current waveforms
+            final_wfms = awg_wfm.get_raw_waveforms()
+            for ch, dict_wfm_data in enumerate(awg_wfm._cur_prog_waveforms):
+                assert np.array_equal(np.concatenate([dict_wfm_data['waveforms'][x] for x in dict_wfm_data['seq_ids']]), final_wfms[ch]), "The programmed waveform does not match the current waveform."
+        #Changed sequences (with the same memory layout) only update the changed task-table entries
+        awg_wfm.get_waveform_segment('pulse1').Amplitude = 0.5
+        program()
+        awg_wfm.get_waveform_segment('idle2').Value = 0.6
+        seg_inds, task_inds = program()[0]
+        assert task_inds == [8] and seg_inds == [], "Only the changed task-table entries should be programmed."
+        self.cleanup()
+
 
 if __name__ == '__main__':
     TestSegments().test_SaveReload()
@@ -0,0 +1,70 @@
+import importlib
+
+#Maps the class names (i.e. the 'Type' entries in the configuration files) onto the modules in which they are defined. The
+#modules are only imported when the class is first requested so that the heavy HAL, ZI and processor dependencies (e.g.
+#LabOne Q, scipy or cupy) are not loaded unless they are actually used.
+CLASS_MODULES = {
+    #HALs
+    'ACQ'               : 'sqdtoolz.HAL.ACQ',
+    'ACQdso'            : 'sqdtoolz.HAL.ACQdso',
+    'ACQsa'             : 'sqdtoolz.HAL.ACQsa',
+    'ACQvna'            : 'sqdtoolz.HAL.ACQvna',
+    'WaveformAWG'       : 'sqdtoolz.HAL.AWG',
+    'DDG'               : 'sqdtoolz.HAL.DDG',
+    'GENatten'          : 'sqdtoolz.HAL.GENatten',
+    'GENfuncGen'        : 'sqdtoolz.HAL.GENfuncGen',
+    'GENmwSource'       : 'sqdtoolz.HAL.GENmwSource',
+    'GENmwSrcAWG'       : 'sqdtoolz.HAL.GENmwSrcAWG',
+    'GENsmu'            : 'sqdtoolz.HAL.GENsmu',
+    'GENswitch'         : 'sqdtoolz.HAL.GENswitch',
+    'GENswitchTrig'     : 'sqdtoolz.HAL.GENswitchTrig',
+    'GENtherm'          : 'sqdtoolz.HAL.GENtherm',
+    'GENvoltSource'     : 'sqdtoolz.HAL.GENvoltSource',
+    'MultiACQ'          : 'sqdtoolz.HAL.MultiACQ',
+    'SOFTpid'           : 'sqdtoolz.HAL.SOFTpid',
+    'SOFTqpu'           : 'sqdtoolz.HAL.SOFTqpu',
+    'ZIACQ'             : 'sqdtoolz.HAL.ZI.ZIACQ',
+    'ZIQubit'           : 'sqdtoolz.HAL.ZI.ZIQubit',
+    'ZIQuantumElement'  : 'sqdtoolz.HAL.ZI.ZIQuantumElement',
+    #Processors
+    'ProcessorCPU'      : 'sqdtoolz.HAL.Processors.ProcessorCPU',
+    'ProcessorFPGA'     : 'sqdtoolz.HAL.Processors.ProcessorFPGA',
+    'ProcessorGPU'      : 'sqdtoolz.HAL.Processors.ProcessorGPU',
+    #Waveform transformations
+    'WFMT_ModulationIQ' : 'sqdtoolz.HAL.WaveformTransformations',
+    #Variables
+    'VariableInternal'                  : 'sqdtoolz.Variable',
+    'VariableProperty'                  : 'sqdtoolz.Variable',
+    'VariableInternalTransient'         : 'sqdtoolz.Variable',
+    'VariablePropertyTransient'         : 'sqdtoolz.Variable',
+    'VariablePropertyOneManyTransient'  : 'sqdtoolz.Variable',
+    'VariableSpaced'                    : 'sqdtoolz.Variable',
+    'VariableDifferential'              : 'sqdtoolz.Variable',
+    'VariableMappedProperty'            : 'sqdtoolz.Variable',
+}
+
+_loaded_classes = {}
+
+def register_class(class_name, module_name):
+    '''
+    Registers a class (e.g. a custom HAL defined outside sqdtoolz) so that it can be cold-reloaded from the configuration
+    files via its 'Type' entry.
+
+    Inputs:
+        - class_name  - Name of the class as given in the 'Type' entry of its configuration dictionary.
+        - module_name - Either the full name of the module in which the class is defined (e.g. 'myPackage.myHAL') or the
+                        class itself.
+    '''
+    if isinstance(module_name, type):
+        _loaded_classes[class_name] = module_name
+        CLASS_MODULES[class_name] = module_name.__module__
+    else:
+        _loaded_classes.pop(class_name, None)
+        CLASS_MODULES[class_name] = module_name
+
+def get_class(class_name):
+    #Imports the module of the class on first use; raises an ImportError if its (optional) dependencies are missing
+    if class_name not in _loaded_classes:
+        assert class_name in CLASS_MODULES, f"The class {class_name} is not registered. Register it via sqdtoolz.ClassRegistry.register_class."
+        _loaded_classes[class_name] = getattr(importlib.import_module(CLASS_MODULES[class_name]), class_name)
+    return _loaded_classes[class_name]
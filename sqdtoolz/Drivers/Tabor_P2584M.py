@@ -249,6 +249,9 @@ class TaborP2584M_AWG(InstrumentChannel):
 
         self._sequence_lens = [None]*4
         self._cur_internal_trigs = [False]*4
+        #(Amplitude, Offset, trigger source, internal triggers) of each channel when last programmed (used to check if partial
+        #programming is valid); None if the channel must be fully reprogrammed (e.g. its memory bank was reset)
+        self._prog_chan_states = [None]*4
 
     @property
     def SampleRate(self):
@@ -364,6 +367,10 @@ class TaborP2584M_AWG(InstrumentChannel):
             self._parent._chk_err('after setting up memory banks.')
 
             if reset_banks:
+                #The redefined segments lose their data and so both channels sharing the bank must be fully reprogrammed (they may
+                #be driven by different HALs)
+                self._prog_chan_states[bank*2] = None
+                self._prog_chan_states[bank*2+1] = None
                 # self._parent._send_cmd(':TRAC:DEL:ALL')
                 if self._sequence_lens[bank*2] != None:
                     for m, cur_len in enumerate(self._sequence_lens[bank*2]):
@@ -389,12 +396,7 @@ class TaborP2584M_AWG(InstrumentChannel):
         self._setup_memory_banks()
 
         # Setup segment offsets
-        if chan_ind == 1:
-            seg_offset = self._seg_off_ch2
-        elif chan_ind == 3:
-            seg_offset = self._seg_off_ch4
-        else:
-            seg_offset = 0
+        seg_offset = self._get_segment_offset(chan_ind)
 
         #Select channel
         self._parent._set_cmd(':INST:CHAN', chan_ind+1)
@@ -438,20 +440,11 @@ class TaborP2584M_AWG(InstrumentChannel):
         else:
             self._parent.ACQ.trigger1Source('EXT')
             self._parent.ACQ.trigger2Source('EXT')
-            task_list = []
-            for m, seg_id in enumerate(dict_wfm_data['seq_ids']):
-                task_list += [AWG_TaborP2584M_task(seg_id+1 + seg_offset, 1, (m+1)+1)]
-            task_list[0].trig_src = cur_chnl.trig_src()     #First task is triggered off the TRIG source
-            task_list[-1].next_task_ind = 1                 #Last task maps back onto the first task
+            task_list = self._get_sequence_task_list(cur_chnl, dict_wfm_data, seg_offset)
 
         #Program the memory banks
         for m in range(len(dict_wfm_data['waveforms'])):
-            cur_data = dict_wfm_data['waveforms'][m]
-            cur_amp = cur_chnl.Amplitude/2
-            cur_off = cur_chnl.Offset   #Don't compensate for offset... # NOTE: this used to be multiplied by 0
-            cur_data = (cur_data - cur_off)/cur_amp
-            assert (max(cur_data) < np.abs(cur_chnl.Amplitude + cur_chnl.Offset)), "The Amplitude and Offset are too large, output will be saturated"
-            self._send_data_to_memory(m+1 + seg_offset, cur_data, dict_wfm_data['markers'][m])
+            self._send_segment_to_memory(cur_chnl, m+1 + seg_offset, dict_wfm_data['waveforms'][m], dict_wfm_data['markers'][m])
         #Program the task table...            
         self._program_task_table(chan_ind+1, task_list)
         
@@ -459,6 +452,63 @@ class TaborP2584M_AWG(InstrumentChannel):
         # Ensure all previous commands have been executed
         while not self._parent._get_cmd('*OPC?'):
             pass
+        self._prog_chan_states[chan_ind] = (cur_chnl.Amplitude, cur_chnl.Offset, cur_chnl.trig_src(), self._cur_internal_trigs[chan_ind])
+
+    def program_channel_segments(self, chan_id, dict_wfm_data, seg_inds, task_inds):
+        """
+        Method to program only the changed memory segments of a channel. The memory layout (i.e. segment lengths) must be the same
+        as the one last programmed on all channels. If any task-table entries changed, the entire task table of the channel is
+        rewritten as the task composer is shared between the channels (i.e. it may hold the table of another channel).
+        @param chan_id: Id of channel to be programmed
+        @param dict_wfm_data: wfm data to be programmed
+        @param seg_inds: indices of the memory segments (in dict_wfm_data['waveforms']) to upload
+        @param task_inds: indices of the changed task-table entries (None if the entire task table must be reprogrammed)
+        """
+        chan_ind = self._ch_list.index(chan_id)
+        cur_chnl = self._get_channel_output(chan_id)
+        #Setting up the memory banks may reset the bank of this channel (e.g. if the other channel sharing it changed its layout)
+        self._setup_memory_banks()
+        #The internally triggered task tables are rebuilt from the markers, the uploaded data is normalised by the channel amplitude
+        #and offset, and the trigger source is set in the first task - so reprogram everything in these cases
+        if self._cur_internal_trigs[chan_ind] or self._prog_chan_states[chan_ind] != (cur_chnl.Amplitude, cur_chnl.Offset, cur_chnl.trig_src(), False):
+            self.program_channel(chan_id, dict_wfm_data)
+            return
+
+        seg_offset = self._get_segment_offset(chan_ind)
+        self._parent._set_cmd(':INST:CHAN', chan_ind+1)
+        for m in seg_inds:
+            self._send_segment_to_memory(cur_chnl, m+1 + seg_offset, dict_wfm_data['waveforms'][m], dict_wfm_data['markers'][m])
+        if task_inds is None or len(task_inds) > 0:
+            self._program_task_table(chan_ind+1, self._get_sequence_task_list(cur_chnl, dict_wfm_data, seg_offset))
+
+        self._parent._set_cmd('FUNC:MODE', 'TASK')
+        # Ensure all previous commands have been executed
+        while not self._parent._get_cmd('*OPC?'):
+            pass
+
+    def _get_segment_offset(self, chan_ind):
+        #CH2 and CH4 store their segments after those of CH1 and CH3 respectively in the shared memory banks
+        if chan_ind == 1:
+            return self._seg_off_ch2
+        elif chan_ind == 3:
+            return self._seg_off_ch4
+        else:
+            return 0
+
+    def _get_sequence_task_list(self, cur_chnl, dict_wfm_data, seg_offset):
+        task_list = []
+        for m, seg_id in enumerate(dict_wfm_data['seq_ids']):
+            task_list += [AWG_TaborP2584M_task(seg_id+1 + seg_offset, 1, (m+1)+1)]
+        task_list[0].trig_src = cur_chnl.trig_src()     #First task is triggered off the TRIG source
+        task_list[-1].next_task_ind = 1                 #Last task maps back onto the first task
+        return task_list
+
+    def _send_segment_to_memory(self, cur_chnl, seg_ind, cur_data, mkr_data):
+        cur_amp = cur_chnl.Amplitude/2
+        cur_off = cur_chnl.Offset   #Don't compensate for offset... # NOTE: this used to be multiplied by 0
+        cur_data = (cur_data - cur_off)/cur_amp
+        assert (max(cur_data) < np.abs(cur_chnl.Amplitude + cur_chnl.Offset)), "The Amplitude and Offset are too large, output will be saturated"
+        self._send_data_to_memory(seg_ind, cur_data, mkr_data)
 
     def _program_task_table(self, channel_index, tasks):
         #Select current channel
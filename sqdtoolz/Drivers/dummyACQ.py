@@ -1,12 +1,14 @@
 from qcodes import Instrument
+from sqdtoolz.Drivers.dummyLatency import DummyLatency
 import numpy as np
 
-class DummyACQ(Instrument):
+class DummyACQ(DummyLatency, Instrument):
     '''
     Dummy driver to emulate an ACQ instrument.
     '''
-    def __init__(self, name, blow_up_path='', **kwargs):
+    def __init__(self, name, blow_up_path='', init_delay=0, **kwargs):
         super().__init__(name, **kwargs) #No address...
+        self._init_latency(init_delay)
 
         # #A 10ns output SYNC
         # self.add_submodule('SYNC', SyncTriggerPulse(10e-9, lambda : True, lambda x:x))
@@ -1,4 +1,5 @@
 from qcodes import Instrument, InstrumentChannel
+from sqdtoolz.Drivers.dummyLatency import DummyLatency
 import numpy as np
 
 class DummyAWGchannel(InstrumentChannel):
@@ -54,12 +55,13 @@ class DummyAWGchannel(InstrumentChannel):
     def Output(self, boolVal):
         self.output(boolVal)
 
-class DummyAWG(Instrument):
+class DummyAWG(DummyLatency, Instrument):
     '''
     Dummy driver to emulate an AWG instrument.
     '''
-    def __init__(self, name, **kwargs):
+    def __init__(self, name, init_delay=0, **kwargs):
         super().__init__(name, **kwargs) #No address...
+        self._init_latency(init_delay)
 
         # #A 10ns output SYNC
         # self.add_submodule('SYNC', SyncTriggerPulse(10e-9, lambda : True, lambda x:x))
@@ -67,6 +69,8 @@ class DummyAWG(Instrument):
         self._num_samples = 10
         self._sample_rate = 10e9
         self._trigger_edge = 1
+        #Memory segments and task indices uploaded in the last programming of each channel (None if fully programmed)
+        self._last_prog_segments = {}
 
         # Output channels added to both the module for snapshots and internal Trigger Sources for the DDG HAL...
         for ch_name in ['CH1', 'CH2', 'CH3', 'CH4']:
@@ -109,8 +113,13 @@ class DummyAWG(Instrument):
 
     def program_channel(self, chan_id, dict_wfm_data):
         # print(dict_wfm_data['waveforms'][0])
+        self._last_prog_segments[chan_id] = None
         print("Programmed Dummy AWG!")
-        pass
+
+    def program_channel_segments(self, chan_id, dict_wfm_data, seg_inds, task_inds):
+        #Only the memory segments seg_inds and the sequence/task-table entries task_inds (None implies all) are uploaded
+        self._last_prog_segments[chan_id] = (seg_inds, task_inds)
+        print(f"Programmed Dummy AWG segments {seg_inds}!")
 
     def get_idn(self):
         return {
@@ -1,4 +1,5 @@
 from qcodes import Instrument, InstrumentChannel
+from sqdtoolz.Drivers.dummyLatency import DummyLatency
 
 class DummyDDGchannel(InstrumentChannel):
     def __init__(self, parent:Instrument, name:str) -> None:
@@ -59,12 +60,13 @@ class DummyDDGchannel(InstrumentChannel):
 
 
   
-class DummyDDG(Instrument):
+class DummyDDG(DummyLatency, Instrument):
     '''
     Dummy driver to emulate a DDG instrument.
     '''
-    def __init__(self, name, **kwargs):
+    def __init__(self, name, init_delay=0, **kwargs):
         super().__init__(name, **kwargs) #No address...
+        self._init_latency(init_delay)
 
         # #A 10ns output SYNC
         # self.add_submodule('SYNC', SyncTriggerPulse(10e-9, lambda : True, lambda x:x))
@@ -1,4 +1,5 @@
 from qcodes import Instrument, InstrumentChannel
+from sqdtoolz.Drivers.dummyLatency import DummyLatency
 
 class DummyGENmwSrcChannel(InstrumentChannel):
     def __init__(self, parent:Instrument, name:str) -> None:
@@ -34,6 +35,7 @@ class DummyGENmwSrcChannel(InstrumentChannel):
         return self._outputEnable
     @Output.setter
     def Output(self, val):
+        self.root_instrument._emulate_io()
         self._outputEnable = val
         
     @property
@@ -95,12 +97,13 @@ class DummyGENmwSrcChannel(InstrumentChannel):
         #Perform mode settings
 
 
-class DummyGENmwSrc(Instrument):
+class DummyGENmwSrc(DummyLatency, Instrument):
     '''
     Dummy driver to emulate a Generic Microwave Source instrument.
     '''
-    def __init__(self, name, **kwargs):
+    def __init__(self, name, init_delay=0, output_delay=0, **kwargs):
         super().__init__(name, **kwargs) #No address...
+        self._init_latency(init_delay, output_delay)
 
         # Output channels added to both the module for snapshots and internal output sources for use in queries
         self._source_outputs = {}
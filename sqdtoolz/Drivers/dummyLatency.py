@@ -0,0 +1,16 @@
+import time
+
+class DummyLatency:
+    '''
+    Mixin for the dummy drivers to emulate the latencies of a real instrument (e.g. to exercise the concurrent loading and
+    preparation of instruments without hardware). The delays are given as keyword arguments of the driver (e.g. in the YAML file):
+        - init_delay   - Seconds taken to connect to and initialise the instrument (i.e. in the constructor).
+        - output_delay - Seconds taken by each I/O call that changes the output state (e.g. enabling an output). Only used by
+                         the drivers that call _emulate_io.
+    '''
+    def _init_latency(self, init_delay=0, output_delay=0):
+        self._output_delay = output_delay
+        time.sleep(init_delay)
+
+    def _emulate_io(self):
+        time.sleep(self._output_delay)
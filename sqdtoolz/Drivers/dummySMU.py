@@ -1,11 +1,13 @@
 from qcodes import Instrument, InstrumentChannel, VisaInstrument, validators as vals
+from sqdtoolz.Drivers.dummyLatency import DummyLatency
   
-class DummySMU(Instrument):
+class DummySMU(DummyLatency, Instrument):
     '''
     Dummy driver to emulate a SMU instrument.
     '''
-    def __init__(self, name, **kwargs):
+    def __init__(self, name, init_delay=0, output_delay=0, **kwargs):
         super().__init__(name, **kwargs)
+        self._init_latency(init_delay, output_delay)
         self.increment_voltage = kwargs.get('increment_voltage', True)
         self.increment_voltage_step = kwargs.get('increment_voltage_step', 1)
         self._voltage = kwargs.get('increment_voltage_start', 0) - self.increment_voltage_step
@@ -43,6 +45,7 @@ class DummySMU(Instrument):
         return self._output
     @Output.setter
     def Output(self, val):
+        self._emulate_io()
         self._output = val
 
     @property
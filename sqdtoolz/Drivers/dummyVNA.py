@@ -0,0 +1,97 @@
+from qcodes import Instrument
+from sqdtoolz.Drivers.dummyLatency import DummyLatency
+import numpy as np
+
+class DummyVNA(DummyLatency, Instrument):
+    '''
+    Dummy driver to emulate a VNA instrument. Like a real VNA, setting up the segments drops it out of segmented mode (the
+    segments are cleared first) and segmented mode can only be entered once segments exist.
+    '''
+    def __init__(self, name, init_delay=0, **kwargs):
+        super().__init__(name, **kwargs) #No address...
+        self._init_latency(init_delay)
+        self._sweep_mode = 'Linear'
+        self._freq_start = 1e9
+        self._freq_end = 2e9
+        self._segment_freqs = []
+        self.Power = 0
+        self.SweepPoints = 101
+        self.AveragesNum = 1
+        self.AveragesEnable = False
+        self.Bandwidth = 1e3
+        self.NumRepetitions = 1
+        self.FrequencySingle = 1e9
+        self.PowerStart = -10
+        self.PowerEnd = 0
+        self.ElecDelayTime = 0
+        self.Output = True
+        self._meas_params = [(2,1)]
+
+    @property
+    def SupportedSweepModes(self):
+        return ['Linear', 'Power-1f', 'Time-1f', 'Segmented']
+
+    @property
+    def SweepMode(self):
+        return self._sweep_mode
+    @SweepMode.setter
+    def SweepMode(self, new_mode):
+        assert new_mode in self.SupportedSweepModes, f"Mode {new_mode} is invalid for this VNA."
+        if new_mode == 'Segmented' and len(self._segment_freqs) == 0:
+            return
+        self._sweep_mode = new_mode
+
+    @property
+    def FrequencyStart(self):
+        return self._freq_start
+    @FrequencyStart.setter
+    def FrequencyStart(self, val):
+        self._freq_start = val
+    @property
+    def FrequencyEnd(self):
+        return self._freq_end
+    @FrequencyEnd.setter
+    def FrequencyEnd(self, val):
+        self._freq_end = val
+    @property
+    def FrequencyCentre(self):
+        return 0.5*(self._freq_start + self._freq_end)
+    @FrequencyCentre.setter
+    def FrequencyCentre(self, val):
+        span = self.FrequencySpan
+        self._freq_start, self._freq_end = val - 0.5*span, val + 0.5*span
+    @property
+    def FrequencySpan(self):
+        return self._freq_end - self._freq_start
+    @FrequencySpan.setter
+    def FrequencySpan(self, val):
+        centre = self.FrequencyCentre
+        self._freq_start, self._freq_end = centre - 0.5*val, centre + 0.5*val
+
+    def setup_segmented(self, segment_freqs):
+        #Clearing the segments drops the VNA out of segmented mode
+        self._segment_freqs = []
+        if self._sweep_mode == 'Segmented':
+            self._sweep_mode = 'Linear'
+        self._segment_freqs = segment_freqs[:]
+
+    def get_frequency_segments(self):
+        return self._segment_freqs[:]
+
+    def setup_measurements(self, ports_meas_src_tuples):
+        self._meas_params = ports_meas_src_tuples[:]
+
+    def get_data(self, **kwargs):
+        if self._sweep_mode == 'Segmented':
+            freqs = np.concatenate([np.linspace(*x) for x in self._segment_freqs])
+        else:
+            freqs = np.linspace(self._freq_start, self._freq_end, self.SweepPoints)
+        ret_data = {
+            'parameters' : ['repetition', 'frequency'],
+            'data' : {},
+            'misc' : {'frequency' : freqs}
+        }
+        for cur_meas in self._meas_params:
+            ret_data['data'][f'S{cur_meas[0]}{cur_meas[1]}_real'] = np.ones((self.NumRepetitions, freqs.size))
+            ret_data['data'][f'S{cur_meas[0]}{cur_meas[1]}_imag'] = np.zeros((self.NumRepetitions, freqs.size))
+        return ret_data
@@ -2,8 +2,10 @@ from typing import List
 import numpy as np
 import time
 import json
+import warnings
 from sqdtoolz.Variable import VariablePropertyOneManyTransient
-from sqdtoolz.ExperimentSweeps import ExperimentSweepBase
+from sqdtoolz.ExperimentSweeps import ExperimentSweepBase, ExperimentSweepGrid
+from sqdtoolz.ExperimentPipeline import ExperimentPipeline
 
 import matplotlib.pyplot as plt
 
@@ -22,6 +24,7 @@ class Experiment:
         self._cur_fileread_paths = {}
         self._file_readers = {}
         self._file_path = None
+        self._data_file_options = {}
 
     @property
     def Name(self):
@@ -38,7 +41,7 @@ class Experiment:
             data_file_name = filename
         if data_file_name in self._cur_filewriters:
             return
-        data_file = FileIOWriter(self._file_path + data_file_name + '.h5', store_timestamps=self._store_timestamps, **fileio_options)
+        data_file = FileIOWriter(self._file_path + data_file_name + '.h5', store_timestamps=self._store_timestamps, **{**self._data_file_options, **fileio_options})
         self._cur_filewriters[data_file_name] = data_file
         self._cur_fileread_paths[data_file_name] = self._file_path + data_file_name + '.h5'
         return data_file, data_file_name + '.h5'
@@ -94,12 +97,18 @@ class Experiment:
         delay = kwargs.get('delay', 0.0)
         kill_signal = kwargs.get('kill_signal')
         self._abort_gracefully = kwargs.get('kill_signal_send')     #Used in mid_process to abort...
+        #In pipelined mode, _mid_process would run on the background worker while the next sweeping point is being prepared
+        pipeline_depth = kwargs.get('pipeline_depth', 0)
+        assert pipeline_depth == 0 or type(self)._mid_process is Experiment._mid_process, "Pipelined mode (pipeline_depth > 0) cannot be used with an experiment that overrides _mid_process."
         self._setup_progress_bar(**kwargs)
 
         self._data_file_index = kwargs.get('data_file_index', -1)
         self._store_timestamps = kwargs.get('store_timestamps', True)
+        #Storage options passed onto every FileIOWriter (e.g. layout, compression, compression_opts, shuffle)
+        self._data_file_options = kwargs.get('data_file_options', {})
 
         init_data_file_options = {}
+        rec_param_aux_file_name = None
         rev_ind = kwargs.get('reverse_index', -1)
         rev_suffix = kwargs.get('reverse_variable_suffix', '_reverse')
         assert not (len(sweep_vars) == 0 and rev_ind >= 0), "Cannot reverse indices when no sweeping variables are given."  #Although the one below covers this, it's nicer to have a more specific error message...
@@ -131,7 +140,7 @@ class Experiment:
         self._init_aux_datafiles()
 
         if not kwargs.get('skip_init_instruments', False):
-            self._expt_config.init_instruments(data_file_path=file_path, data_file_index=self._data_file_index)
+            self._expt_config.init_instruments(data_file_path=file_path, data_file_index=self._data_file_index, force_refresh=kwargs.get('force_refresh', False))
 
         waveform_updates = kwargs.get('update_waveforms', None)
         if waveform_updates != None:
@@ -187,49 +196,23 @@ class Experiment:
                     sweep_arrays[rev_ind] = np.concatenate([sweep_arrays[rev_ind], sweep_arrays[rev_ind][::-1]])
                 if len(aux_sweep) > 0:
                     sweep_arrays[aux_sweep[1]] = np.concatenate([sweep_arrays[aux_sweep[1]], aux_sweep[2]])
-                self._sweep_shape = [x.size for x in sweep_arrays]
-                self._sweep_grids = np.meshgrid(*sweep_arrays)
-                self._sweep_grids = np.array(self._sweep_grids)
-                axes = np.arange(len(self._sweep_grids.shape))
-                try:
-                    axes[2] = 1
-                    axes[1] = 2
-                except IndexError:
-                    pass
-                self._sweep_grids = np.transpose(self._sweep_grids, axes=axes).reshape(len(sweep_arrays),-1).T
-                
-                #Setup permutations on the sweeping orders:        
+                #Setup permutations on the sweeping orders:
                 sweep_orders = kwargs.get('sweep_orders', [])
                 assert not (len(sweep_orders) > 0 and rev_ind >= 0), "Cannot supply reverse_index and sweep_orders simultaneously."
                 assert not (len(sweep_orders) > 0 and len(aux_sweep) > 0), "Cannot supply aux_sweep and sweep_orders simultaneously."
-                swp_order = np.arange(self._sweep_grids.shape[0])
-                for cur_order in sweep_orders:
-                    assert isinstance(cur_order, ExperimentSweepBase), "The argument sweep_orders must be specified as a list of ExpSwp* (i.e. ExperimentSweepBase) objects."
-                    swp_order = cur_order.get_sweep_indices(swp_order, self._sweep_shape)
+                #The sweeping points are generated lazily rather than materialising the full Cartesian product of sweep_arrays
+                self._sweep_grids = ExperimentSweepGrid(sweep_arrays, sweep_orders)
+                self._sweep_shape = list(self._sweep_grids.Shape)
 
                 #sweep_vars2 is given as a list of tuples formatted as (parameter, sweep-values in an numpy-array)
-                for m in range(self._sweep_grids.shape[0]):
-                    ind_coord = swp_order[m]
-                    cur_coord = self._sweep_grids[swp_order[m]]
+                #In pipelined mode, storing a sweeping point is run on a background worker while the next sweeping point is prepared
+                #and acquired. The worker commits the points in order.
+                pipeline = ExperimentPipeline(pipeline_depth) if pipeline_depth > 0 else None
+                rec_aux_file = None
 
+                def commit_sweep_point(ind_coord, cur_raw_data, cur_rec_data):
+                    nonlocal rec_param_aux_file_name, rec_aux_file
                     self._cur_ind_coord = ind_coord
-                    #Set the values
-                    for ind, cur_val in enumerate(cur_coord):
-                        sweep_vars2[ind][0].set_raw(cur_val)
-
-                    if kill_signal():
-                        break
-                    
-                    #Now prepare the instrument
-                    # self._expt_config.check_conformance() #TODO: Write this
-                    self._expt_config.prepare_instruments()
-                    time.sleep(delay)
-
-                    if kill_signal():
-                        break
-
-                    #TODO: Consider letting other datasets also be temporarily accessible to mid_proces?
-                    cur_raw_data = self._expt_config.get_data()
                     self._data = cur_raw_data.pop('data')
                     for x in cur_raw_data:
                         self._init_data_file(x, init_data_file_options)
@@ -238,18 +221,58 @@ class Experiment:
                     #
                     self._store_datapkt(self._data, sweep_vars2, sweepEx, rev_ind, ind_coord, data_file, None, aux_sweep)
                     #
-                    if len(rec_params) > 0:
+                    if cur_rec_data != None:
                         if len(aux_sweep) > 0:
                             ret_val = self._init_data_file('rec_params_'+aux_sweep[0], init_data_file_options)
                             if isinstance(ret_val, (list, tuple)):
-                                aux_file, rec_param_aux_file_name = ret_val
-                        else:
-                            aux_file = None
-                        self._store_datapkt(self._prepare_rec_params(rec_params, rec_params_extra), sweep_vars2, sweepEx, rev_ind, ind_coord, rec_data_file, aux_file, aux_sweep)
+                                rec_aux_file, rec_param_aux_file_name = ret_val
+                        self._store_datapkt(cur_rec_data, sweep_vars2, sweepEx, rev_ind, ind_coord, rec_data_file, rec_aux_file, aux_sweep)
                     self._sweep_vars = sweep_vars2
-                    self._mid_process()
+                    if pipeline == None:
+                        self._mid_process()
                     self._data = None
-                    self._update_progress_bar((ind_coord+1)/self._sweep_grids.shape[0])
+
+                try:
+                    for ind_coord, cur_coord in self._sweep_grids:
+                        if pipeline == None:
+                            self._cur_ind_coord = ind_coord
+                        #Set the values
+                        for ind, cur_val in enumerate(cur_coord):
+                            sweep_vars2[ind][0].set_raw(cur_val)
+
+                        if kill_signal():
+                            break
+                        
+                        #Now prepare the instrument
+                        # self._expt_config.check_conformance() #TODO: Write this
+                        self._expt_config.prepare_instruments()
+                        time.sleep(delay)
+
+                        if kill_signal():
+                            break
+
+                        #TODO: Consider letting other datasets also be temporarily accessible to mid_proces?
+                        cur_raw_data = self._expt_config.get_data()
+                        #The recorded parameters must be sampled now (i.e. before the next sweeping point is set)
+                        cur_rec_data = self._prepare_rec_params(rec_params, rec_params_extra) if len(rec_params) > 0 else None
+                        if pipeline == None:
+                            commit_sweep_point(ind_coord, cur_raw_data, cur_rec_data)
+                            self._update_progress_bar((ind_coord+1)/len(self._sweep_grids))
+                        else:
+                            #The progress is reported (and thus, the laboratory state is saved) on this thread before the next
+                            #sweeping point is set so that the state is that of the acquired point
+                            self._update_progress_bar((ind_coord+1)/len(self._sweep_grids))
+                            pipeline.submit(commit_sweep_point, ind_coord, cur_raw_data, cur_rec_data)
+                except BaseException:
+                    if pipeline != None:
+                        #An error raised by a submitted job must not replace the error raised in the sweeping loop
+                        try:
+                            pipeline.close()
+                        except BaseException as pipeline_err:
+                            warnings.warn(f"Storing a sweeping point in the pipeline also failed: {pipeline_err!r}")
+                    raise
+                if pipeline != None:
+                    pipeline.close()
 
         #Close all data files
         self._file_readers = {}
@@ -387,7 +410,7 @@ class Experiment:
             assert False, 'The parameter \'last_sweep_var\' must be given as a string or None.'
 
     def _retrieve_current_sweep_values(self):
-        if not isinstance(self._sweep_grids, np.ndarray):
+        if not isinstance(self._sweep_grids, ExperimentSweepGrid):
             return {}
         return {x : self._sweep_grids[self._cur_ind_coord][ind] for ind, x in enumerate(self._cur_names)}
 
@@ -2,9 +2,13 @@ from sqdtoolz.HAL.TriggerPulse import*
 from sqdtoolz.Utilities.TimingPlots import*
 from sqdtoolz.Variable import*
 from sqdtoolz.HAL.WaveformGeneric import WaveformGeneric
+from sqdtoolz.HAL.LockableProperties import WriteCacheSession
+from sqdtoolz.HAL.HALbase import HALbase
 import numpy as np
 import json
 import copy
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 class ExperimentConfiguration:
     def __init__(self, name, lab, duration, list_HALs, hal_ACQ = None, list_spec_names = [], **kwargs):
@@ -13,8 +17,18 @@ class ExperimentConfiguration:
         #to the new configuration anyway...
         lab._register_CONFIG(self)
 
+        #Concurrent preparation of the HALs (see prepare_instruments)
+        self._concurrent_prep = False
+        self._concurrent_prep_workers = 8
+        self._prep_groups = None
+        self._prep_times = {}
+        #Numbers of HAL property writes issued and skipped (see update_config)
+        self._write_stats = {'Issued' : 0, 'Skipped' : 0}
+
         prev_config = kwargs.get('_hidden_config', None)
         if prev_config != None:
+            self._concurrent_prep = prev_config._concurrent_prep
+            self._concurrent_prep_workers = prev_config._concurrent_prep_workers
             self._total_time = prev_config._total_time
             self._lab = lab
             self._list_HALs = prev_config._list_HALs[:]
@@ -85,6 +99,23 @@ class ExperimentConfiguration:
     def RepetitionTime(self, len_seconds):
         self._total_time = len_seconds
 
+    @property
+    def ConcurrentPreparation(self):
+        #If True, each preparation phase (activate, prepare_initial, prepare_final) is run across the HALs concurrently
+        return self._concurrent_prep
+    @ConcurrentPreparation.setter
+    def ConcurrentPreparation(self, val):
+        self._concurrent_prep = val
+
+    @property
+    def ConcurrentPreparationWorkers(self):
+        #Maximum number of HALs (or groups of HALs sharing an instrument) prepared simultaneously
+        return self._concurrent_prep_workers
+    @ConcurrentPreparationWorkers.setter
+    def ConcurrentPreparationWorkers(self, val):
+        assert isinstance(val, int) and val > 0, "The number of preparation workers must be a positive integer."
+        self._concurrent_prep_workers = val
+
     def __str__(self):
         cur_str = f"Name: {self.Name}\n"
         cur_str += f"RepetitionTime: {self.RepetitionTime}\n"
@@ -148,24 +179,29 @@ class ExperimentConfiguration:
         self._init_config = cur_config
         return cur_config
 
-    def update_config(self, conf, commit_changes_to_HALsPROCs=True, **kwargs):
-        #TODO: Check if these checks here are probably overkill and possibly obsolete?
-        for cur_dict in conf['HALs']:
-            found_hal = False
-            list_hals = self._list_HALs[:]
-            if self._hal_ACQ is not None:
-                list_hals += [self._hal_ACQ]
-            for cur_hal in list_hals:
-                if cur_hal == None:
-                    continue
-                if cur_hal.Name == cur_dict['Name']:
-                    found_hal = True
-                    if commit_changes_to_HALsPROCs:
-                        for cur_key in kwargs:
-                            cur_dict[cur_key] = kwargs[cur_key]
-                        cur_hal._set_current_config(cur_dict, self._lab)
-                    break
-            assert found_hal, f"HAL object {cur_dict['Name']} does not exist in the current ExperimentConfiguration object."
+    def update_config(self, conf, commit_changes_to_HALsPROCs=True, force_refresh=False, **kwargs):
+        #If the Laboratory has HALWriteCache enabled, HAL properties already set to the given values are not rewritten unless
+        #force_refresh is True
+        with WriteCacheSession(self._lab.HALWriteCache and not force_refresh) as write_session:
+            #TODO: Check if these checks here are probably overkill and possibly obsolete?
+            for cur_dict in conf['HALs']:
+                found_hal = False
+                list_hals = self._list_HALs[:]
+                if self._hal_ACQ is not None:
+                    list_hals += [self._hal_ACQ]
+                for cur_hal in list_hals:
+                    if cur_hal == None:
+                        continue
+                    if cur_hal.Name == cur_dict['Name']:
+                        found_hal = True
+                        if commit_changes_to_HALsPROCs:
+                            for cur_key in kwargs:
+                                cur_dict[cur_key] = kwargs[cur_key]
+                            cur_hal._set_current_config(cur_dict, self._lab)
+                        break
+                assert found_hal, f"HAL object {cur_dict['Name']} does not exist in the current ExperimentConfiguration object."
+        self._write_stats['Issued'] += write_session.Issued
+        self._write_stats['Skipped'] += write_session.Skipped
         self._settle_currently_used_processors(conf)
         for cur_dict in conf['PROCs']:
             found_proc = False
@@ -299,22 +335,94 @@ class ExperimentConfiguration:
     def commit(self):
         self.save_config()
 
+    def _prepare_HALs(self, list_hals, phase):
+        #Runs the given preparation phase (i.e. method name) over the HALs in order and records the start and end times of each
+        for cur_hal in list_hals:
+            t0 = time.time()
+            getattr(cur_hal, phase)()
+            self._prep_times.setdefault(cur_hal.Name, {})[phase] = (t0, time.time())
+
+    def _get_preparation_groups(self, list_hals):
+        #HALs that share an instrument (e.g. WaveformAWGs on different channels of one AWG) are prepared sequentially within a
+        #group as the drivers are not assumed to be thread-safe. The groups are cached as the HAL configurations may query the
+        #instruments. The cache is keyed on the identities of the loaded instruments (i.e. a reloaded instrument) and the HAL
+        #binding generation (i.e. a HAL reinitialised onto another instrument) as well.
+        hal_names = [x.Name for x in list_hals if x.ConcurrentPreparation]
+        cur_key = (hal_names, HALbase._binding_generation, [(x, id(y)) for x, y in self._lab._station.components.items()])
+        if self._prep_groups is None or self._prep_groups[0] != cur_key:
+            groups = []
+            for cur_hal in list_hals:
+                if not cur_hal.ConcurrentPreparation:
+                    continue
+                cur_instrs = self._lab._get_hal_instruments(cur_hal._get_current_config())
+                cur_group = (set(cur_instrs), [])
+                for prev_group in [x for x in groups if x[0] & cur_instrs]:
+                    cur_group[0].update(prev_group[0])
+                    cur_group[1].extend(prev_group[1])
+                    groups.remove(prev_group)
+                cur_group[1].append(cur_hal.Name)
+                groups.append(cur_group)
+            self._prep_groups = (cur_key, [sorted(x[1], key=hal_names.index) for x in groups])
+        return self._prep_groups[1]
+
+    def get_write_stats(self, reset=False):
+        '''
+        Returns a dictionary with the total numbers of HAL property writes that were 'Issued' and 'Skipped' (i.e. the value was
+        already set as per the Laboratory's HALWriteCache) when applying this configuration onto the HALs. If reset is True, the
+        counters are zeroed afterwards.
+        '''
+        ret_dict = self._write_stats.copy()
+        if reset:
+            self._write_stats = {'Issued' : 0, 'Skipped' : 0}
+        return ret_dict
+
+    def get_preparation_times(self, intervals=False):
+        '''
+        Returns a dictionary (keyed by the HAL names) of dictionaries (keyed by the phases) with the time (in seconds) taken
+        by each HAL in the phases of the last call to prepare_instruments. If intervals is True, the tuples of the start and
+        end times (as per time.time) are given instead (e.g. to check which HALs were prepared simultaneously).
+        '''
+        if intervals:
+            return copy.deepcopy(self._prep_times)
+        return {x : {y : z[1] - z[0] for y, z in self._prep_times[x].items()} for x in self._prep_times}
+
     def prepare_instruments(self):
         #TODO: Write rest of this with error checking
 
         list_hals = self._list_HALs[:]
         if self._hal_ACQ is not None:
             list_hals += [self._hal_ACQ]
-
-        for cur_hal in list_hals:
-            if cur_hal is not None and not cur_hal.ManualActivation:
-                cur_hal.activate()
-        
-        for cur_hal in list_hals:
-            #TODO: Write concurrence/change checks to better optimise AWG...
-            cur_hal.prepare_initial()
-        for cur_hal in list_hals:
-            cur_hal.prepare_final()
+        list_hals = [x for x in list_hals if x is not None]
+        self._prep_times = {}
+
+        #The worker threads are only started on submission and are joined at the end of this call (i.e. none are left running)
+        with ThreadPoolExecutor(max_workers=self._concurrent_prep_workers) as prep_executor:
+            for cur_phase in ['activate', 'prepare_initial', 'prepare_final']:
+                #TODO: Write concurrence/change checks to better optimise AWG...
+                if cur_phase == 'activate':
+                    cur_hals = [x for x in list_hals if not x.ManualActivation]
+                else:
+                    cur_hals = list_hals
+                if not self._concurrent_prep:
+                    self._prepare_HALs(cur_hals, cur_phase)
+                    continue
+                #Each phase is completed across all HALs before the next phase begins
+                hal_dict = {x.Name : x for x in cur_hals}
+                cur_futures = []
+                for cur_group in self._get_preparation_groups(list_hals):
+                    cur_group = [hal_dict[x] for x in cur_group if x in hal_dict]
+                    if len(cur_group) > 0:
+                        cur_futures += [prep_executor.submit(self._prepare_HALs, cur_group, cur_phase)]
+                cur_errors = []
+                for cur_future in cur_futures:
+                    try:
+                        cur_future.result()
+                    except Exception as e:
+                        cur_errors += [e]
+                if len(cur_errors) > 0:
+                    raise cur_errors[0]
+                #The HALs that opted out are run afterwards (i.e. without any other HALs being prepared simultaneously)
+                self._prepare_HALs([x for x in cur_hals if not x.ConcurrentPreparation], cur_phase)
 
     def makesafe_instruments(self):
         list_hals = self._list_HALs[:]
@@ -0,0 +1,59 @@
+import queue
+import threading
+
+class ExperimentPipeline:
+    '''
+    Runs submitted jobs in order on a single background worker thread. Used by Experiment._run (when pipeline_depth > 0)
+    to store sweep-point N while sweep-point N+1 is being prepared and acquired.
+
+    Inputs:
+        - max_pending - Maximum number of jobs that may be queued before submit() blocks (i.e. the backpressure on the
+                        acquisition loop). Must be at least 1.
+    '''
+    def __init__(self, max_pending=1):
+        assert isinstance(max_pending, int) and max_pending > 0, "The pipeline depth must be a positive integer."
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def _worker(self):
+        while True:
+            cur_job = self._queue.get()
+            try:
+                if cur_job is None:
+                    return
+                #Once a job fails, the remaining jobs are drained (but not run) so that the commit order is never broken
+                if self._error is None:
+                    cur_job[0](*cur_job[1])
+            except BaseException as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            err = self._error
+            self._error = None
+            raise err
+
+    def submit(self, func, *args):
+        #Blocks if max_pending jobs are already queued. Errors raised by previous jobs are re-raised here.
+        self._raise_error()
+        self._queue.put((func, args))
+
+    def wait(self):
+        #Blocks until all submitted jobs have been run. Errors raised by any job are re-raised here.
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        #Finishes all submitted jobs before stopping the worker thread. Errors raised by any job are re-raised here.
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._raise_error()
+
+    @property
+    def HasError(self):
+        return self._error is not None
@@ -4,6 +4,29 @@ class ExperimentSweepBase:
     def get_sweep_indices(self, array_indices, array_shape):
         raise NotImplementedError()
 
+    def prepare_sweep(self, array_shape):
+        #Called once at the start of every sweep (e.g. to clear caches or to reseed random orderings)
+        self._cache_shape = None
+        self._cache_indices = None
+
+    def get_sweep_index(self, array_index, array_shape):
+        #Lazy variant of get_sweep_indices returning the permuted flat-index at a given flat-index. Subclasses should
+        #override this with an O(1) mapping; this fallback materialises the permutation once via get_sweep_indices.
+        array_shape = tuple(array_shape)
+        if getattr(self, '_cache_shape', None) != array_shape:
+            self._cache_indices = self.get_sweep_indices(np.arange(int(np.prod(array_shape))), array_shape)
+            self._cache_shape = array_shape
+        return int(self._cache_indices[array_index])
+
+    def _get_block_params(self, array_shape):
+        #Returns (jump, snake_size, snake_offset) for the sweeping dimension self._snake_ind
+        if self._snake_ind == len(array_shape)-1:
+            jump = 1
+        else:
+            jump = int(np.prod(array_shape[self._snake_ind+1:]))
+        snake_size = array_shape[self._snake_ind]
+        return jump, snake_size, snake_size*jump
+
 
 class ExSwpSnake(ExperimentSweepBase):
     def __init__(self, snake_ind):
@@ -34,6 +57,17 @@ class ExSwpSnake(ExperimentSweepBase):
         
         return ret_indices
 
+    def get_sweep_index(self, array_index, array_shape):
+        if self._snake_ind == 0:
+            return array_index
+        assert self._snake_ind <= len(array_shape), f"Index {self._snake_ind} exceeds the number of sweeping dimensions ({len(array_shape)} in this case)."
+        jump, snake_size, snake_offset = self._get_block_params(array_shape)
+        m, rem = divmod(array_index, snake_offset)
+        if m % 2 == 0:
+            return array_index
+        v, r = divmod(rem, jump)
+        return m*snake_offset + (snake_size-v-1)*jump + r
+
 class ExSwpRandom(ExperimentSweepBase):
     def __init__(self, snake_ind):
         self._snake_ind = snake_ind
@@ -65,6 +99,71 @@ class ExSwpRandom(ExperimentSweepBase):
         
         return ret_indices
 
+    def prepare_sweep(self, array_shape):
+        #Each block's permutation is regenerated from (seed, block-index) so that only the current block is held in memory
+        self._seed = np.random.SeedSequence().entropy
+        self._cur_block = (-1, None)
+
+    def get_sweep_index(self, array_index, array_shape):
+        assert self._snake_ind <= len(array_shape), f"Index {self._snake_ind} exceeds the number of sweeping dimensions ({len(array_shape)} in this case)."
+        if not hasattr(self, '_seed'):
+            self.prepare_sweep(array_shape)
+        jump, snake_size, snake_offset = self._get_block_params(array_shape)
+        m, rem = divmod(array_index, snake_offset)
+        if self._cur_block[0] != m:
+            ord1 = np.arange(snake_size)
+            np.random.default_rng([self._seed, m]).shuffle(ord1)
+            self._cur_block = (m, ord1)
+        v, r = divmod(rem, jump)
+        return m*snake_offset + int(self._cur_block[1][v])*jump + r
+
+
+class ExperimentSweepGrid:
+    '''
+    Lazily evaluated Cartesian product of the sweeping arrays. Points are generated on demand from their flat (C-ordered)
+    index, so that memory usage is independent of the total number of sweeping points.
+
+    Inputs:
+        - sweep_arrays - List of 1D numpy arrays giving the values of each sweeping variable (outermost first).
+        - sweep_orders - List of ExperimentSweepBase objects applied (in order) to permute the sampling order.
+    '''
+    def __init__(self, sweep_arrays, sweep_orders=[]):
+        self._sweep_arrays = sweep_arrays
+        self._shape = tuple(x.size for x in sweep_arrays)
+        self._num_points = int(np.prod(self._shape))
+        #Matches the upcasting previously done when stacking all the meshgrids into a single array
+        self._dtype = np.result_type(*sweep_arrays)
+        self._sweep_orders = sweep_orders[:]
+        for cur_order in self._sweep_orders:
+            assert isinstance(cur_order, ExperimentSweepBase), "The argument sweep_orders must be specified as a list of ExpSwp* (i.e. ExperimentSweepBase) objects."
+            cur_order.prepare_sweep(self._shape)
+
+    @property
+    def Shape(self):
+        return self._shape
+
+    def __len__(self):
+        return self._num_points
+
+    def __getitem__(self, ind_coord):
+        #Returns the values of the sweeping variables at the given flat-index
+        inds = np.unravel_index(ind_coord, self._shape)
+        return np.array([self._sweep_arrays[m][x] for m, x in enumerate(inds)], dtype=self._dtype)
+
+    def get_sweep_index(self, sweep_step):
+        #Returns the flat-index sampled on the given step of the sweep after applying the sweep orderings.
+        #Applying the orderings one after another, composes as: inds_k[m] = inds_{k-1}[perm_k[m]]
+        ind_coord = sweep_step
+        for cur_order in self._sweep_orders[::-1]:
+            ind_coord = cur_order.get_sweep_index(ind_coord, self._shape)
+        return int(ind_coord)
+
+    def __iter__(self):
+        #Yields (flat-index, values of sweeping variables) in the order they are to be sampled
+        for m in range(self._num_points):
+            ind_coord = self.get_sweep_index(m)
+            yield ind_coord, self[ind_coord]
+
 if __name__ == '__main__':
     ExSwpRandom(0).get_sweep_indices(np.arange(10), (10,))
     ExSwpRandom(0).get_sweep_indices(np.arange(3*10*5), (3,10,5))
@@ -110,6 +110,8 @@ class ACQdso(HALbase):
         
 
 class ACQdsoChannel(LockableProperties):
+    _write_cached = True
+
     def __init__(self, chan_name, cur_instr_chan, ch_index):
         self._channel_name = chan_name
         self._instr_dso_chan = cur_instr_chan
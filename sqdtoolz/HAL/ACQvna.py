@@ -1,6 +1,10 @@
 from sqdtoolz.HAL.HALbase import*
 
 class ACQvna(HALbase):
+    #The sweep mode depends on the segments (set via setup_segmented_sweep) while FrequencyStart/FrequencyEnd are coupled
+    #with FrequencyCentre/FrequencySpan (and SweepPoints with the segments) - so these are always written
+    _write_cache_exclude = ['SweepMode', 'FrequencyStart', 'FrequencyEnd', 'FrequencyCentre', 'FrequencySpan', 'SweepPoints']
+
     def __init__(self, hal_name, lab, instr_vna):
         #NOTE: the driver is presumed to be a single-pole many-throw switch (i.e. only one circuit route at a time).
         HALbase.__init__(self, hal_name)
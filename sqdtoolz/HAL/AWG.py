@@ -5,6 +5,7 @@ import matplotlib.patches as patches
 import matplotlib.pyplot as plt
 from sqdtoolz.HAL.WaveformSegments import*
 import scipy.signal
+import hashlib
 
 class AWGBase(HALbase):
     def __init__(self, hal_name,sample_rate, total_time, global_factor):
@@ -17,6 +18,8 @@ class AWGBase(HALbase):
         self._global_factor = global_factor
         if not hasattr(self, '_awg_chan_list'):
             self._awg_chan_list = []
+        #Segment lengths, digests and sequence indices of the waveform data last programmed on each channel (by channel index)
+        self._cur_prog_segments = {}
 
     @property
     def AutoCompression(self):
@@ -99,23 +102,60 @@ class AWGBase(HALbase):
             else:
                 cur_mkrs += [ mkr_list_overall[sub_mkr][:] ]    #Copy over the empty array...
         return cur_mkrs
+    def _get_segment_digest(self, list_wfms, list_mkrs):
+        #Hash of the waveform and marker arrays of a segment (across channels if linked) used to find repeated segments in O(1).
+        #Note that -0.0 is mapped onto 0.0 as np.array_equal treats them as equal. Matches must still be verified via np.array_equal
+        #(i.e. on hash collisions and as NaNs never match).
+        cur_hash = hashlib.blake2b(digest_size=16)
+        for cur_wfm in list_wfms:
+            cur_hash.update(cur_wfm.size.to_bytes(8, 'little'))
+            cur_hash.update((cur_wfm + 0.0).tobytes())
+        for cur_mkrs in list_mkrs:
+            for cur_mkr in cur_mkrs:
+                cur_hash.update(cur_mkr.size.to_bytes(8, 'little'))
+                cur_hash.update(np.ascontiguousarray(cur_mkr).tobytes())
+        return cur_hash.digest()
+
+    def _get_programmed_segments_info(self, dict_wfm_data):
+        return {'seg_lens' : [x.size for x in dict_wfm_data['waveforms']],
+                'digests' : [self._get_segment_digest([x], [y]) for x, y in zip(dict_wfm_data['waveforms'], dict_wfm_data['markers'])],
+                'seq_ids' : list(dict_wfm_data['seq_ids'])}
+
+    def _get_segment_changes(self, list_seg_infos):
+        #Returns a list (per channel) of tuples (memory segment indices, sequence/task indices) that differ from the waveform data
+        #already programmed on the channels. Returns None if the channels must be fully reprogrammed - i.e. if the memory layout
+        #(number and lengths of the memory segments) changed on any channel as the drivers may share memory across channels.
+        ret_changes = []
+        for ind, cur_info in enumerate(list_seg_infos):
+            prev_info = self._cur_prog_segments.get(ind, None)
+            if self._cur_prog_waveforms[ind] is None or prev_info is None or prev_info['seg_lens'] != cur_info['seg_lens']:
+                return None
+            seg_inds = [m for m, (x, y) in enumerate(zip(prev_info['digests'], cur_info['digests'])) if x != y]
+            if len(prev_info['seq_ids']) == len(cur_info['seq_ids']):
+                task_inds = [m for m, (x, y) in enumerate(zip(prev_info['seq_ids'], cur_info['seq_ids'])) if x != y]
+            else:
+                task_inds = None    #i.e. the entire sequence/task table must be reprogrammed
+            ret_changes += [(seg_inds, task_inds)]
+        return ret_changes
 
     def _program_auto_comp_basic(self, cur_awg_chan, final_wfm_for_chan, mkr_list):
         #TODO: Add flags for changed/requires-update to ensure that segments in sequence are not unnecessary programmed repeatedly...
-        #TODO: Improve algorithm (a winter research project for a Winter Student!)
         dict_auto_comp = cur_awg_chan._instr_awg.AutoCompressionSupport
         dS = dict_auto_comp['MinSize']
         num_main_secs = int(np.floor(final_wfm_for_chan.size / dS))
         seq_segs = [final_wfm_for_chan[0:dS]]
         seq_mkrs = [self._extract_marker_segments(mkr_list, 0, dS)]
         seq_ids  = [0]
+        #Table of the unique segments found so far: digest => list of indices in seq_segs
+        seg_table = {self._get_segment_digest([seq_segs[0]], [seq_mkrs[0]]) : [0]}
         for m in range(1,num_main_secs):
             cur_seg = final_wfm_for_chan[(m*dS):((m+1)*dS)]
             cur_mkrs = self._extract_marker_segments(mkr_list, m*dS, (m+1)*dS)
+            cur_digest = self._get_segment_digest([cur_seg], [cur_mkrs])
             found_match = False
-            for ind, cur_seq_seg in enumerate(seq_segs):
+            for ind in seg_table.get(cur_digest, []):
                 #Check main waveform array
-                if np.array_equal(cur_seg, cur_seq_seg):
+                if np.array_equal(cur_seg, seq_segs[ind]):
                     #Check the sub-markers
                     mkrs_match = True
                     for mkr in range(len(cur_mkrs)):
@@ -127,6 +167,7 @@ class AWGBase(HALbase):
                         found_match = True
                         break
             if not found_match:
+                seg_table.setdefault(cur_digest, []).append(len(seq_segs))
                 seq_ids += [len(seq_segs)]
                 seq_segs += [cur_seg]
                 seq_mkrs += [cur_mkrs]
@@ -145,7 +186,6 @@ class AWGBase(HALbase):
 
     def _program_auto_comp_basic_linked(self, minSize, final_wfms, final_mkrs):
         #TODO: Add flags for changed/requires-update to ensure that segments in sequence are not unnecessary programmed repeatedly...
-        #TODO: Improve algorithm (a winter research project for a Winter Student!)
         num_channels = len(final_wfms)
         dS = minSize
         num_main_secs = int(np.floor(final_wfms[0].size / dS))
@@ -153,12 +193,16 @@ class AWGBase(HALbase):
         seq_segs = [[final_wfm_for_chan[0:dS]] for final_wfm_for_chan in final_wfms]                #Slice: channel, waveform-segment, waveform-pts
         seq_mkrs = [[self._extract_marker_segments(mkr_list, 0, dS)] for mkr_list in final_mkrs]    #Slice: channel, marker-segment, marker-index, marker-pts
         seq_ids  = [0]
+        #Table of the unique segments (across all channels) found so far: digest => list of segment indices
+        seg_table = {self._get_segment_digest([x[0] for x in seq_segs], [x[0] for x in seq_mkrs]) : [0]}
         for m in range(1,num_main_secs):
             #Extract current dS slice of the final waveforms and markers across all channels
             cur_seg = [final_wfm_for_chan[(m*dS):((m+1)*dS)] for final_wfm_for_chan in final_wfms]
             cur_mkrs = [self._extract_marker_segments(mkr_list, m*dS, (m+1)*dS) for mkr_list in final_mkrs]
+            cur_digest = self._get_segment_digest(cur_seg, cur_mkrs)
+            found_match = False
             #Check for a match in a previous segment
-            for seg_ind in range(len(seq_segs[0])):     #Loop through all previous segments
+            for seg_ind in seg_table.get(cur_digest, []):     #Loop through all previous segments with the same digest
                 found_match = True
                 for cur_ch in range(num_channels):   #For each segment to check, check across all channels
                     #Check main waveform array
@@ -180,6 +224,7 @@ class AWGBase(HALbase):
                     seq_ids += [seg_ind]
                     break
             if not found_match:
+                seg_table.setdefault(cur_digest, []).append(len(seq_segs[0]))
                 seq_ids += [len(seq_segs[0])]
                 for cur_ch in range(num_channels):
                     seq_segs[cur_ch] += [cur_seg[cur_ch]]
@@ -279,15 +324,25 @@ class AWGBase(HALbase):
                 cur_awg_chan._instr_awg.prepare_waveform_memory(cur_awg_chan._instr_awg_chan.short_name, seg_lens, raw_data=dict_wfm_data)
                 self.cur_wfms_to_commit.append(dict_wfm_data)
 
+        #Find the memory segments that have changed so that drivers supporting it only upload said segments
+        self._cur_segs_to_commit = [self._get_programmed_segments_info(x) for x in self.cur_wfms_to_commit]
+        self._cur_seg_changes = self._get_segment_changes(self._cur_segs_to_commit)
+
     def prepare_final(self):
         """
         Method that programs waveform onto channel
         """
         if not self._dont_reprogram:
             for ind, cur_awg_chan in enumerate(self._awg_chan_list):
-                cur_awg_chan._instr_awg.program_channel(cur_awg_chan._instr_awg_chan.short_name, self.cur_wfms_to_commit[ind])
+                cur_instr = cur_awg_chan._instr_awg
+                if self._cur_seg_changes is not None and hasattr(cur_instr, 'program_channel_segments'):
+                    seg_inds, task_inds = self._cur_seg_changes[ind]
+                    cur_instr.program_channel_segments(cur_awg_chan._instr_awg_chan.short_name, self.cur_wfms_to_commit[ind], seg_inds, task_inds)
+                else:
+                    cur_instr.program_channel(cur_awg_chan._instr_awg_chan.short_name, self.cur_wfms_to_commit[ind])
                 #Set it AFTER the programming in case there is an error etc...
                 self._cur_prog_waveforms[ind] = self.cur_wfms_to_commit[ind]
+                self._cur_prog_segments[ind] = self._cur_segs_to_commit[ind]
 
 
 class WaveformAWG(AWGBase, HALbase, TriggerOutputCompatible, TriggerInputCompatible):
@@ -604,19 +659,15 @@ class WaveformAWG(AWGBase, HALbase, TriggerOutputCompatible, TriggerInputCompati
 
         num_chnls = len(self._awg_chan_list)
         final_wfms = [np.array([])]*num_chnls
+        #The segment lengths are the same for all channels
+        seg_pts = [x.NumPts(self.SampleRate) for x in self._wfm_segment_list]
         #Assemble each channel separately
         for cur_ch in range(len(self._awg_chan_list)):
             #Reset any waveform modulation commands for a new sequence construction...
             for cur_wfm_seg in self._wfm_segment_list:
                 cur_wfm_seg.reset_waveform_transforms(self._lab)
-            t0 = 0
             #Concatenate the individual waveform segments
-            for cur_wfm_seg in self._wfm_segment_list:
-                if cur_wfm_seg.NumPts(self.SampleRate) == 0:
-                    continue
-                #TODO: Preallocate - this is a bit inefficient...
-                final_wfms[cur_ch] = np.concatenate((final_wfms[cur_ch], cur_wfm_seg.get_waveform(self._lab, self._sample_rate, t0, cur_ch)))
-                t0 = final_wfms[cur_ch].size
+            final_wfms[cur_ch] = assemble_waveform_segments(self._wfm_segment_list, self._lab, self._sample_rate, 0, cur_ch, seg_pts=seg_pts)
             #Scale the waveform via the global scale-factor...
             final_wfms[cur_ch] *= self._global_factor
             assert self.NumPts == final_wfms[cur_ch].size, "The sample-rate and segment-lengths yield segment points that exceed the total waveform size. Ensure that there is sufficient freedom in the elastic segment size to compensate."
@@ -629,6 +680,8 @@ class WaveformAWG(AWGBase, HALbase, TriggerOutputCompatible, TriggerInputCompati
 
 
 class AWGOutputChannel(TriggerInput, LockableProperties):
+    _write_cached = True
+
     def __init__(self, lab, instr_awg_name, channel_name, ch_index, parent_awg_waveform, sample_rate):
         self._instr_awg_name = instr_awg_name
         self._channel_name = channel_name
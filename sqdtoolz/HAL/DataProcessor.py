@@ -38,6 +38,10 @@ class DataProcessor:
     def ready(self):
         raise NotImplementedError()
 
+    def release(self):
+        #Frees any resources held by the processor (e.g. worker threads)
+        pass
+
     def _get_current_config(self):
         raise NotImplementedError()
 
@@ -1,9 +1,17 @@
 from sqdtoolz.HAL.LockableProperties import LockableProperties
 
 class HALbase(LockableProperties):
+    _write_cached = True
+    #Incremented whenever a HAL is (re)initialised - i.e. whenever a HAL may have been bound onto different instruments
+    _binding_generation = 0
+
     def __init__(self, HAL_Name):
         self._name = HAL_Name
         self._man_activation = False
+        self._concurrent_prep = True
+        #(Re)initialising the HAL may bind it to a newly loaded instrument
+        self.invalidate_write_cache()
+        HALbase._binding_generation += 1
 
     def __new__(cls, *args, **kwargs):
         if len(args) == 0:
@@ -55,6 +63,14 @@ class HALbase(LockableProperties):
     def ManualActivation(self, val):
         self._man_activation = val
 
+    @property
+    def ConcurrentPreparation(self):
+        #If False, this HAL is never prepared concurrently with other HALs (e.g. for drivers that are not thread-safe)
+        return self._concurrent_prep
+    @ConcurrentPreparation.setter
+    def ConcurrentPreparation(self, val):
+        self._concurrent_prep = val
+
     def _get_current_config(self):
         raise NotImplementedError()
 
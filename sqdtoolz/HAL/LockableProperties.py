@@ -1,13 +1,85 @@
+import copy
+import threading
+
+#Write-through cache of the property values last written on the objects that talk to instruments (i.e. with _write_cached
+#set to True). Every write is recorded, but a write is only skipped (if it is identical to the value cached before the session)
+#within a WriteCacheSession - i.e. when ExperimentConfiguration applies a configuration. Only the first write of a property
+#within a session can be skipped (i.e. a HAL deliberately rewriting a property is always written). Properties set explicitly
+#by the user are therefore always written to the instrument.
+_write_cache_state = threading.local()
+_write_cache_generation = 0
+
+def invalidate_write_caches():
+    #Forces the next write of every property on every object to be issued (e.g. after an instrument has been reloaded)
+    global _write_cache_generation
+    _write_cache_generation += 1
+
+def _write_cache_matches(cache_entry, value):
+    if cache_entry is None or cache_entry[0] != _write_cache_generation or type(cache_entry[1]) is not type(value):
+        return False
+    try:
+        return bool(cache_entry[1] == value)
+    except (ValueError, TypeError):
+        #e.g. numpy arrays - just write them
+        return False
+
+class WriteCacheSession:
+    '''
+    Context manager within which setting a write-cached property to the value last written onto it (before the session) is
+    skipped. Any further writes of the same property within the session are always issued. The numbers of writes issued and
+    skipped within the session are given by Issued and Skipped.
+
+    Inputs:
+        - enabled - If False, every write is issued (but still recorded in the cache).
+    '''
+    def __init__(self, enabled=True):
+        self.Enabled = enabled
+        self.Issued = 0
+        self.Skipped = 0
+        self._prev_session = None
+        #(id of object, property) of every write-cached property set within the session
+        self._props_set = set()
+
+    def __enter__(self):
+        self._prev_session = getattr(_write_cache_state, 'session', None)
+        _write_cache_state.session = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _write_cache_state.session = self._prev_session
+        return False
+
 class LockableProperties:
+    _write_cached = False
+    #Properties that are never skipped by the write cache (e.g. coupled properties where writing one changes another)
+    _write_cache_exclude = []
+
     def __init__(self):
         self._locked_props = []
 
     def __setattr__(self, prop, value):
-        if not hasattr(self, '_locked_props'):
+        if prop in getattr(self, '_locked_props', []):
+            return
+        if self._write_cached and prop[0] != '_' and prop not in self._write_cache_exclude and isinstance(getattr(type(self), prop, None), property):
+            cur_cache = self.__dict__.setdefault('_write_cache', {})
+            cur_session = getattr(_write_cache_state, 'session', None)
+            if cur_session is not None:
+                first_write = (id(self), prop) not in cur_session._props_set
+                cur_session._props_set.add((id(self), prop))
+                if first_write and cur_session.Enabled and _write_cache_matches(cur_cache.get(prop), value):
+                    cur_session.Skipped += 1
+                    return
             super().__setattr__(prop, value)
-        elif not prop in self._locked_props:
-            super().__setattr__(prop, value)
-    
+            cur_cache[prop] = (_write_cache_generation, copy.deepcopy(value) if isinstance(value, (list, dict)) else value)
+            if cur_session is not None:
+                cur_session.Issued += 1
+            return
+        super().__setattr__(prop, value)
+
+    def invalidate_write_cache(self):
+        #Forces the next write of every property on this object to be issued
+        self.__dict__.pop('_write_cache', None)
+
     def _property_lock(self, prop):
         if not hasattr(self, '_locked_props'):
             self._locked_props = []
@@ -30,14 +30,18 @@ class CPU_DDC(ProcNodeCPU):
             sample_rate = init_sample_rates[ch_ind]
 
             if ddc_frequency != None and ddc_frequency != 0:
-                if self._ddc_cossin_arrays[ch_ind][0] != num_samples or self._ddc_cossin_arrays[ch_ind][1] != sample_rate or self._ddc_cossin_arrays[ch_ind][2] != ddc_frequency:
+                #Use a local reference to the arrays as the processor may run this stage over multiple threads
+                cur_cossin = self._ddc_cossin_arrays[ch_ind]
+                #The arrays are stored in the precision of the data (e.g. float32 to avoid promoting float32 data to float64)
+                carr_dtype = np.finfo(data_pkt['data'][cur_ch].dtype).dtype if np.issubdtype(data_pkt['data'][cur_ch].dtype, np.inexact) else np.float64
+                if cur_cossin[0] != num_samples or cur_cossin[1] != sample_rate or cur_cossin[2] != ddc_frequency or cur_cossin[3].dtype != carr_dtype:
                     omega = 2*np.pi*ddc_frequency/sample_rate
-                    self._ddc_cossin_arrays[ch_ind] = (
-                        num_samples, sample_rate, ddc_frequency, 2.0*np.cos(omega*np.arange(num_samples)), -2.0*np.sin(omega*np.arange(num_samples)) )
+                    cur_cossin = (num_samples, sample_rate, ddc_frequency, (2.0*np.cos(omega*np.arange(num_samples))).astype(carr_dtype), (-2.0*np.sin(omega*np.arange(num_samples))).astype(carr_dtype) )
+                    self._ddc_cossin_arrays[ch_ind] = cur_cossin
                 #Perform the actual DDC...
                 cur_data_cpu = data_pkt['data'].pop(cur_ch)
-                data_pkt['data'][f'{cur_ch}_I'] = np.multiply(cur_data_cpu, self._ddc_cossin_arrays[ch_ind][3])
-                data_pkt['data'][f'{cur_ch}_Q'] = np.multiply(cur_data_cpu, self._ddc_cossin_arrays[ch_ind][4])
+                data_pkt['data'][f'{cur_ch}_I'] = np.multiply(cur_data_cpu, cur_cossin[3])
+                data_pkt['data'][f'{cur_ch}_Q'] = np.multiply(cur_data_cpu, cur_cossin[4])
                 final_sample_rates += [sample_rate]*2
                 del cur_data_cpu    #Perhaps necessary - well it's no time for caution...
             else:
@@ -0,0 +1,229 @@
+from sqdtoolz.HAL.Processors.ProcessorCPU import*
+from sqdtoolz.HAL.Processors.CPU.CPU_FIR import CPU_FIR
+import numpy as np
+import scipy.ndimage
+import scipy.signal
+from numpy.lib.stride_tricks import sliding_window_view
+
+class CPU_DDCFIRDecimation(ProcNodeCPU):
+    #Maximum size of the intermediate products when calculating the polyphase sums on a chunk of rows
+    _MAX_CHUNK_BYTES = 4e6
+
+    def __init__(self, ddc_freqs, fir_specs, param_name, deci_fac):
+        '''
+        Fused equivalent of the stages CPU_DDC(ddc_freqs), CPU_FIR(fir_specs) and CPU_Decimation(param_name, deci_fac) run in
+        succession. The mixing is folded into the FIR coefficients so that only the retained (i.e. decimated) output samples are
+        calculated in a single pass over the input data. The output channels, their ordering and the SampleRates are identical to
+        those of the unfused stages.
+
+        Inputs:
+            - ddc_freqs  - Per-channel list of DDC frequencies (None or 0 to skip the DDC on a given channel) as in CPU_DDC. If
+                           None, the DDC is skipped on all channels.
+            - fir_specs  - Per-channel list of FIR filter specifications (indexed by the channels after the DDC) as in CPU_FIR.
+                           If None, every channel uses an anti-aliasing low-pass filter with the cutoff at the decimated Nyquist
+                           frequency (designed like in scipy.signal.resample_poly: 20*deci_fac+1 taps and a Kaiser window).
+            - param_name - Name of the parameter in which to decimate. It must be the last parameter (i.e. the samples).
+            - deci_fac   - Decimation factor - i.e. number of samples to skip across
+        '''
+        self._ddc_freqs = ddc_freqs
+        self._fir = CPU_FIR(fir_specs) if fir_specs is not None else None
+        #Anti-aliasing FIR coefficients used when fir_specs is None
+        self._aa_coeffs = None
+        self._param_name = param_name
+        self._deci_fac = int(deci_fac)
+        #A data store of the current filtering kernels with each entry formatted as: (num-samples, omega, fir-coefficients, dtype, kernel)
+        self._kernels = []
+
+    @classmethod
+    def fromConfigDict(cls, config_dict):
+        return cls(config_dict['Frequencies'], config_dict['FIRspecs'], config_dict['Parameter'], config_dict['DecimationFactor'])
+
+    def process_data(self, data_pkt, **kwargs):
+        assert 'misc' in data_pkt, "The data packet does not have miscellaneous data under the key 'misc'"
+        assert 'SampleRates' in data_pkt['misc'], "The data packet does not have SampleRate under the entry 'misc'"
+        assert self._param_name in data_pkt['parameters'], f"The indexing parameter '{self._param_name}' is not in the current dataset."
+        assert data_pkt['parameters'].index(self._param_name) == len(data_pkt['parameters'])-1, f"The decimation parameter '{self._param_name}' must be the last parameter (i.e. the one along which the DDC and FIR filter are applied)."
+
+        assert self._ddc_freqs is None or len(self._ddc_freqs) >= len(data_pkt['data'].keys()), f"The dataset has more channels ({len(data_pkt['data'].keys())}) than specified number of DDC frequencies ({len(self._ddc_freqs)})."
+
+        #Channels after the DDC (in the same order as CPU_DDC) with entries: (source channel, DDC angular frequency, 'I'/'Q'/None)
+        init_keys = [x for x in data_pkt['data'].keys()]
+        init_sample_rates = data_pkt['misc'].pop('SampleRates', None)
+        ddc_chans = {x : (x, None, None) for x in init_keys}
+        final_sample_rates = []
+        for ch_ind, cur_ch in enumerate(init_keys):
+            ddc_frequency = None if self._ddc_freqs is None else self._ddc_freqs[ch_ind]
+            sample_rate = init_sample_rates[ch_ind]
+            if ddc_frequency != None and ddc_frequency != 0:
+                omega = 2*np.pi*ddc_frequency/sample_rate
+                ddc_chans.pop(cur_ch)
+                ddc_chans[f'{cur_ch}_I'] = (cur_ch, omega, 'I')
+                ddc_chans[f'{cur_ch}_Q'] = (cur_ch, omega, 'Q')
+                final_sample_rates += [sample_rate]*2
+            else:
+                final_sample_rates.append(sample_rate)
+        ddc_keys = [x for x in ddc_chans.keys()]
+        assert self._fir is None or len(self._fir._fir_specs) >= len(ddc_keys), f"The dataset has more channels ({len(ddc_keys)}) than specified number of FIR filters ({len(self._fir._fir_specs)})."
+
+        #Process the mixing, filtering and decimation on a per-channel basis (an I/Q pair with the same filter is done together)
+        fin_data = {}
+        for ch_ind, cur_ch in enumerate(ddc_keys):
+            if cur_ch in fin_data:
+                continue
+            src_ch, omega, cur_comp = ddc_chans[cur_ch]
+            cur_data = data_pkt['data'][src_ch]
+            fir_coeffs = self._get_fir_coeffs(ch_ind, final_sample_rates[ch_ind], cur_data.shape[-1])
+            cur_comps = [cur_comp]
+            if cur_comp == 'I':
+                fir_coeffs_Q = self._get_fir_coeffs(ch_ind+1, final_sample_rates[ch_ind+1], cur_data.shape[-1])
+                if np.array_equal(fir_coeffs, fir_coeffs_Q):
+                    cur_comps = ['I', 'Q']
+            cur_res = self._mix_fir_decimate(ch_ind, cur_data, omega, fir_coeffs, cur_comps)
+            for m, cur_res_data in enumerate(cur_res):
+                fin_data[ddc_keys[ch_ind+m]] = cur_res_data
+        data_pkt['data'].clear()
+        for cur_ch in ddc_keys:
+            data_pkt['data'][cur_ch] = fin_data[cur_ch]
+
+        data_pkt['misc']['SampleRates'] = [x / float(self._deci_fac) for x in final_sample_rates]
+        return data_pkt
+
+    def _get_fir_coeffs(self, ch_ind, sample_rate, num_samples):
+        if self._fir is not None:
+            return self._fir._get_fir_coeffs(ch_ind, sample_rate, num_samples)
+        #The anti-aliasing filter only depends on the decimation factor
+        if self._aa_coeffs is None:
+            if self._deci_fac == 1:
+                self._aa_coeffs = np.array([1.0])
+            else:
+                self._aa_coeffs = scipy.signal.firwin(20*self._deci_fac+1, 1.0/self._deci_fac, window=('kaiser', 5.0))
+        return self._aa_coeffs
+
+    def _mix_fir_decimate(self, ch_ind, data, omega, fir_coeffs, comps):
+        #Returns the list of the decimated outputs of the given components ('I', 'Q' or None if there is no DDC)
+        num_samples = data.shape[-1]
+        num_taps = fir_coeffs.size
+        #The kernel is stored in the precision of the data (e.g. float32 to avoid promoting float32 data to float64)
+        kern_dtype = np.finfo(data.dtype).dtype if np.issubdtype(data.dtype, np.inexact) else np.dtype(np.float64)
+        #Use a local reference to the kernel as the processor may run this stage over multiple threads
+        if len(self._kernels) <= ch_ind:
+            self._kernels = self._kernels + [(0, None, None, None, None)]*(ch_ind+1-len(self._kernels))
+        cur_kernel = self._kernels[ch_ind]
+        if cur_kernel[0] != num_samples or cur_kernel[1] != omega or cur_kernel[2] is not fir_coeffs or cur_kernel[3] != kern_dtype:
+            cur_kernel = (num_samples, omega, fir_coeffs, kern_dtype, self._get_kernel(num_samples, omega, fir_coeffs, kern_dtype))
+            self._kernels[ch_ind] = cur_kernel
+        cur_kernel = cur_kernel[4]
+
+        if cur_kernel is None or np.iscomplexobj(data):
+            #Filter at the full rate (e.g. when not decimating or when the filter is so long that most outputs touch the edges)
+            ret_data = []
+            for cur_comp in comps:
+                if cur_comp == 'I':
+                    cur_data = np.multiply(data, (2.0*np.cos(omega*np.arange(num_samples))).astype(kern_dtype))
+                elif cur_comp == 'Q':
+                    cur_data = np.multiply(data, (-2.0*np.sin(omega*np.arange(num_samples))).astype(kern_dtype))
+                else:
+                    cur_data = data
+                ret_data += [scipy.ndimage.convolve1d(cur_data, fir_coeffs)[..., ::self._deci_fac]]
+            return ret_data
+
+        #The interior outputs are sums over windows of the raw data (with the carrier folded into the coefficients) rotated by the
+        #carrier at the output sample, while the outputs touching the edges are summed over the (reflected) mixed data
+        num_outputs = cur_kernel['NumOutputs']
+        m_lo, m_hi = cur_kernel['Interior']
+        cur_sums = self._polyphase_sums(data, cur_kernel)
+        ret_data = []
+        for cur_comp in comps:
+            cur_res = np.empty(data.shape[:-1] + (num_outputs,), dtype=cur_sums[0].dtype)
+            if cur_comp is None:
+                cur_res[..., m_lo:m_hi] = cur_sums[0]
+            else:
+                carr_cos, carr_sin = cur_kernel['Carrier']
+                if cur_comp == 'I':
+                    cur_res[..., m_lo:m_hi] = cur_sums[0]*carr_cos - cur_sums[1]*carr_sin
+                else:
+                    cur_res[..., m_lo:m_hi] = cur_sums[1]*carr_cos + cur_sums[0]*carr_sin
+            #The edge outputs are filtered (at the decimated rate) from the short span of the reflected mixed data on either side
+            for m_a, m_b, edge_samples, edge_mix in cur_kernel['Edges']:
+                edge_data = data[..., edge_samples] * (edge_mix.imag if cur_comp == 'Q' else edge_mix.real)
+                cur_res[..., m_a:m_b] = sliding_window_view(edge_data, num_taps, axis=-1)[..., ::self._deci_fac, :] @ cur_kernel['EdgeCoeffs']
+            ret_data += [cur_res]
+        return ret_data
+
+    def _polyphase_sums(self, data, kernel):
+        #Returns the list of the window sums (for every column of the coefficients) of the interior outputs. The samples from the
+        #first window are split into blocks of deci_fac samples, so that each polyphase component of the coefficients multiplies
+        #every block (as a matrix product) and the window sums are the sums of the diagonals of said products
+        m_lo, m_hi = kernel['Interior']
+        num_interior = m_hi - m_lo
+        poly_coeffs = kernel['PolyCoeffs']
+        num_phases = kernel['NumPhases']
+        num_cols = poly_coeffs.shape[0] // num_phases
+        num_blocks = num_interior + num_phases - 1
+        win_start = kernel['WindowStart']
+        data_rows = data.reshape(-1, data.shape[-1])
+        ret_sums = [np.empty((data_rows.shape[0], num_interior), dtype=np.result_type(data, poly_coeffs)) for m in range(num_cols)]
+        if num_interior == 0:
+            return [x.reshape(data.shape[:-1] + (0,)) for x in ret_sums]
+        #Process the rows in chunks to keep the matrix products small (i.e. in the cache)
+        rows_per_chunk = max(1, int(self._MAX_CHUNK_BYTES // (poly_coeffs.shape[0]*num_blocks*poly_coeffs.itemsize)))
+        for r in range(0, data_rows.shape[0], rows_per_chunk):
+            cur_blocks = data_rows[r:r+rows_per_chunk, win_start:win_start+num_blocks*self._deci_fac].reshape(-1, num_blocks, self._deci_fac)
+            cur_prods = poly_coeffs @ np.swapaxes(cur_blocks, -1, -2)
+            for c in range(num_cols):
+                cur_sums = ret_sums[c][r:r+rows_per_chunk]
+                np.copyto(cur_sums, cur_prods[:, c*num_phases, :num_interior])
+                for q in range(1, num_phases):
+                    cur_sums += cur_prods[:, c*num_phases+q, q:q+num_interior]
+        return [x.reshape(data.shape[:-1] + (num_interior,)) for x in ret_sums]
+
+    def _get_kernel(self, num_samples, omega, fir_coeffs, kern_dtype):
+        #Returns the arrays required to calculate the decimated outputs or None if it is better to filter at the full rate
+        num_taps = fir_coeffs.size
+        ctr = num_taps-1-num_taps//2
+        num_outputs = int(np.ceil(num_samples / self._deci_fac))
+        #Outputs whose windows (i.e. samples m*deci_fac-ctr to m*deci_fac-ctr+num_taps-1) lie within the data
+        m_lo = min(int(np.ceil(ctr / self._deci_fac)), num_outputs)
+        m_hi = max(min((num_samples - num_taps + ctr) // self._deci_fac + 1, num_outputs), m_lo)
+        #The polyphase blocks (of deci_fac samples) spanning the interior windows must lie within the data
+        num_phases = int(np.ceil(num_taps / self._deci_fac))
+        win_start = m_lo*self._deci_fac - ctr
+        m_hi = max(min(m_hi, m_lo + (num_samples - win_start) // self._deci_fac - num_phases + 1), m_lo)
+        num_edges = m_lo + num_outputs - m_hi
+        #Without decimation, the polyphase blocks are single samples and so it is faster to filter at the full rate
+        if self._deci_fac == 1 or num_edges*num_taps > 4*num_samples:
+            return None
+        #The convolution uses the reversed coefficients; the mixing scales the data by 2 (as done in CPU_DDC)
+        fir_coeffs = fir_coeffs[::-1]
+        scale = 1.0 if omega is None else 2.0
+        omega = 0.0 if omega is None else omega
+        ret_kernel = {'NumOutputs' : num_outputs, 'Interior' : (m_lo, m_hi), 'WindowStart' : win_start, 'NumPhases' : num_phases}
+        cur_coeffs = scale * fir_coeffs * np.exp(-1j*omega*(np.arange(num_taps) - ctr))
+        cur_coeffs = [cur_coeffs.real] if omega == 0.0 else [cur_coeffs.real, cur_coeffs.imag]
+        #Polyphase components (zero-padded to whole blocks) of every column with the entries: [column*num_phases + block, phase]
+        poly_coeffs = np.zeros((len(cur_coeffs), num_phases*self._deci_fac))
+        for c, cur_col in enumerate(cur_coeffs):
+            poly_coeffs[c, :num_taps] = cur_col
+        ret_kernel['PolyCoeffs'] = poly_coeffs.reshape(len(cur_coeffs)*num_phases, self._deci_fac).astype(kern_dtype)
+        cur_phases = omega*np.arange(m_lo, m_hi)*self._deci_fac
+        ret_kernel['Carrier'] = (np.cos(cur_phases).astype(kern_dtype), (-np.sin(cur_phases)).astype(kern_dtype))
+        #The edges are padded via reflection (like scipy.ndimage.convolve1d) of the mixed data
+        ret_kernel['Edges'] = []
+        for m_a, m_b in [(0, m_lo), (m_hi, num_outputs)]:
+            if m_b <= m_a:
+                continue
+            edge_samples = m_a*self._deci_fac - ctr + np.arange((m_b-m_a-1)*self._deci_fac + num_taps)
+            edge_samples = np.mod(edge_samples, 2*num_samples)
+            edge_samples = np.where(edge_samples >= num_samples, 2*num_samples-1-edge_samples, edge_samples)
+            ret_kernel['Edges'] += [(m_a, m_b, edge_samples, (scale * np.exp(-1j*omega*edge_samples)).astype(np.result_type(kern_dtype, np.complex64)))]
+        ret_kernel['EdgeCoeffs'] = fir_coeffs.astype(kern_dtype)
+        return ret_kernel
+
+    def _get_current_config(self):
+        return {
+            'Type'  : self.__class__.__name__,
+            'Frequencies' : None if self._ddc_freqs is None else self._ddc_freqs[:],
+            'FIRspecs' : None if self._fir is None else self._fir._fir_specs,
+            'Parameter' : self._param_name,
+            'DecimationFactor' : self._deci_fac
+        }
@@ -30,33 +30,39 @@ class CPU_FIR(ProcNodeCPU):
 
         #Process FIR on a per-channel basis
         init_keys = [x for x in data_pkt['data'].keys()]
-        if len(self._fir_arrays) == 0:
-            self._fir_arrays = [(None, None, None, None, None, None) for x in init_keys]
         for ch_ind, cur_ch in enumerate(init_keys):
             cur_data_gpu = data_pkt['data'][cur_ch]
-            sample_rate = data_pkt['misc']['SampleRates'][ch_ind]
-            filter_type = self._fir_specs[ch_ind]['Type']
-            taps = self._fir_specs[ch_ind]['Taps']
-            if taps is None:
-                taps = cur_data_gpu.shape[-1]
-            window = self._fir_specs[ch_ind]['Win']
-            cutoff = self._fir_specs[ch_ind]['fc']
-            if cutoff is None:
-                cutoff = 1/cur_data_gpu.shape[-1]
-            if self._fir_arrays[ch_ind][0] != sample_rate or self._fir_arrays[ch_ind][1] != filter_type or \
-               self._fir_arrays[ch_ind][2] != taps or self._fir_arrays[ch_ind][3] != window or self._fir_arrays[ch_ind][4] != cutoff:
-                nyq_rate = sample_rate*0.5
-                freq_cutoff_norm = cutoff/nyq_rate
-                if filter_type == 'low':
-                    fir_coeffs = np.array(scipy.signal.firwin(taps, freq_cutoff_norm, window=window))
-                else:
-                    fir_coeffs = 1.0 - np.array(scipy.signal.firwin(taps, freq_cutoff_norm, window=window))
-                self._fir_arrays[ch_ind] = (sample_rate,filter_type,taps,window,cutoff, fir_coeffs)
-            data_pkt['data'][cur_ch] = self.apply_fir(cur_data_gpu, self._fir_arrays[ch_ind][5])
+            fir_coeffs = self._get_fir_coeffs(ch_ind, data_pkt['misc']['SampleRates'][ch_ind], cur_data_gpu.shape[-1])
+            data_pkt['data'][cur_ch] = self.apply_fir(cur_data_gpu, fir_coeffs)
             del cur_data_gpu #Perhaps necessary - well it's no time for caution...
 
         return data_pkt
 
+    def _get_fir_coeffs(self, ch_ind, sample_rate, num_samples):
+        #Returns the (cached) FIR coefficients for the given channel index
+        if len(self._fir_arrays) <= ch_ind:
+            self._fir_arrays = self._fir_arrays + [(None, None, None, None, None, None)]*(ch_ind+1-len(self._fir_arrays))
+        filter_type = self._fir_specs[ch_ind]['Type']
+        taps = self._fir_specs[ch_ind]['Taps']
+        if taps is None:
+            taps = num_samples
+        window = self._fir_specs[ch_ind]['Win']
+        cutoff = self._fir_specs[ch_ind]['fc']
+        if cutoff is None:
+            cutoff = 1/num_samples
+        #Use a local reference to the coefficients as the processor may run this stage over multiple threads
+        cur_fir = self._fir_arrays[ch_ind]
+        if cur_fir[0] != sample_rate or cur_fir[1] != filter_type or cur_fir[2] != taps or cur_fir[3] != window or cur_fir[4] != cutoff:
+            nyq_rate = sample_rate*0.5
+            freq_cutoff_norm = cutoff/nyq_rate
+            if filter_type == 'low':
+                fir_coeffs = np.array(scipy.signal.firwin(taps, freq_cutoff_norm, window=window))
+            else:
+                fir_coeffs = 1.0 - np.array(scipy.signal.firwin(taps, freq_cutoff_norm, window=window))
+            cur_fir = (sample_rate,filter_type,taps,window,cutoff, fir_coeffs)
+            self._fir_arrays[ch_ind] = cur_fir
+        return cur_fir[5]
+
     def apply_fir(self, data, fir_coeffs):
         return scipy.ndimage.convolve1d(data, fir_coeffs)
 
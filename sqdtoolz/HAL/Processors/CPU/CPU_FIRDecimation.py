@@ -0,0 +1,30 @@
+from sqdtoolz.HAL.Processors.ProcessorCPU import*
+from sqdtoolz.HAL.Processors.CPU.CPU_DDCFIRDecimation import CPU_DDCFIRDecimation
+import numpy as np
+
+class CPU_FIRDecimation(CPU_DDCFIRDecimation):
+    def __init__(self, param_name, deci_fac, fir_specs = None):
+        '''
+        Anti-aliased decimation via a polyphase FIR filter. That is, only every deci_fac'th filtered sample is calculated (as
+        opposed to running CPU_FIR followed by CPU_Decimation, which filters every sample only to discard most of them). The
+        parameters and SampleRates are the same as those given by CPU_Decimation.
+
+        Inputs:
+            - param_name - Name of the parameter in which to decimate. It must be the last parameter (i.e. the samples).
+            - deci_fac   - Decimation factor - i.e. number of samples to skip across
+            - fir_specs  - Per-channel list of FIR filter specifications as in CPU_FIR. If None, every channel uses a low-pass
+                           filter with the cutoff at the decimated Nyquist frequency (designed like in scipy.signal.resample_poly).
+        '''
+        super().__init__(None, fir_specs, param_name, deci_fac)
+
+    @classmethod
+    def fromConfigDict(cls, config_dict):
+        return cls(config_dict['Parameter'], config_dict['DecimationFactor'], config_dict.get('FIRspecs', None))
+
+    def _get_current_config(self):
+        return {
+            'Type'  : self.__class__.__name__,
+            'Parameter' : self._param_name,
+            'DecimationFactor' : self._deci_fac,
+            'FIRspecs' : None if self._fir is None else self._fir._fir_specs
+        }
@@ -1,7 +1,9 @@
 from sqdtoolz.HAL.Processors.ProcessorCPU import*
 import numpy as np
 
-class CPU_Integrate(ProcNodeCPU):
+class CPU_Integrate(ProcNodeCPUReduction):
+    _online_stats = ('sum',)
+
     def __init__(self, index_parameter_name):
         '''
         General function that adds all values in each channel across some parameter - e.g. over repetition or over all the samples. 
@@ -25,7 +27,8 @@ class CPU_Integrate(ProcNodeCPU):
 
         #Process sums on a per-channel basis
         for ch_ind, cur_ch in enumerate(data_pkt['data'].keys()):
-            data_pkt['data'][cur_ch] = np.sum(data_pkt['data'][cur_ch], axis=axis_num)
+            cur_arr = data_pkt['data'][cur_ch]
+            data_pkt['data'][cur_ch] = self._cast_to_data_dtype(np.sum(cur_arr, axis=axis_num, dtype=self._get_accumulator_dtype(data_pkt, cur_arr)), cur_arr.dtype)
 
         #Remove the parameter as it no longer exists after the averaging...
         data_pkt['parameters'].pop(axis_num)
@@ -37,3 +40,6 @@ class CPU_Integrate(ProcNodeCPU):
             'Type'  : self.__class__.__name__,
             'Parameter' : self._param_name
         }
+
+    def _online_output(self, ch_name, ch_stats):
+        return [(ch_name, ch_stats['sum'])]
@@ -34,7 +34,8 @@ class CPU_MeanBlock(ProcNodeCPU):
             slice_inds = [np.s_[:] for x in data_pkt['data'][cur_ch].shape]
             slice_inds[axis_num] = np.s_[:temp[axis_num]*self._block_fac]
 
-            data_pkt['data'][cur_ch] = np.mean(data_pkt['data'][cur_ch][tuple(slice_inds)].reshape(tuple(temp)), axis_num+1)
+            cur_arr = data_pkt['data'][cur_ch]
+            data_pkt['data'][cur_ch] = self._cast_to_data_dtype(np.mean(cur_arr[tuple(slice_inds)].reshape(tuple(temp)), axis_num+1, dtype=self._get_accumulator_dtype(data_pkt, cur_arr)), cur_arr.dtype)
 
         return data_pkt
 
@@ -1,7 +1,9 @@
 from sqdtoolz.HAL.Processors.ProcessorCPU import*
 import numpy as np
 
-class CPU_MeanVariance(ProcNodeCPU):
+class CPU_MeanVariance(ProcNodeCPUReduction):
+    _online_stats = ('mean', 'var')
+
     def __init__(self, index_parameter_name):
         '''
         General function that calculates the mean and variance of each channel across some parameter - e.g. over repetition or over all the samples. 
@@ -26,8 +28,10 @@ class CPU_MeanVariance(ProcNodeCPU):
         #Process means on a per-channel basis
         orig_keys = list(data_pkt['data'].keys())
         for cur_ch in orig_keys:
-            data_pkt['data'][f'{cur_ch}_{self._param_name}_Mean'] = np.mean(data_pkt['data'][cur_ch], axis=axis_num)
-            data_pkt['data'][f'{cur_ch}_{self._param_name}_Var'] = np.var(data_pkt['data'][cur_ch], axis=axis_num)
+            cur_arr = data_pkt['data'][cur_ch]
+            acc_dtype = self._get_accumulator_dtype(data_pkt, cur_arr)
+            data_pkt['data'][f'{cur_ch}_{self._param_name}_Mean'] = self._cast_to_data_dtype(np.mean(cur_arr, axis=axis_num, dtype=acc_dtype), cur_arr.dtype)
+            data_pkt['data'][f'{cur_ch}_{self._param_name}_Var'] = self._cast_to_data_dtype(np.real(np.var(cur_arr, axis=axis_num, dtype=acc_dtype)), cur_arr.dtype)
         for cur_ch in orig_keys:
             data_pkt['data'].pop(cur_ch)
 
@@ -41,3 +45,6 @@ class CPU_MeanVariance(ProcNodeCPU):
             'Type'  : self.__class__.__name__,
             'Parameter' : self._param_name
         }
+
+    def _online_output(self, ch_name, ch_stats):
+        return [(f'{ch_name}_{self._param_name}_Mean', ch_stats['mean']), (f'{ch_name}_{self._param_name}_Var', ch_stats['var'])]
@@ -1,7 +1,9 @@
 from sqdtoolz.HAL.Processors.ProcessorCPU import*
 import numpy as np
 
-class CPU_Variance(ProcNodeCPU):
+class CPU_Variance(ProcNodeCPUReduction):
+    _online_stats = ('mean', 'var')
+
     def __init__(self, index_parameter_name):
         '''
         General function that calculates the variance each channel across some parameter - e.g. over repetition or over all the samples. 
@@ -25,7 +27,8 @@ class CPU_Variance(ProcNodeCPU):
 
         #Process means on a per-channel basis
         for ch_ind, cur_ch in enumerate(data_pkt['data'].keys()):
-            data_pkt['data'][cur_ch] = np.std(data_pkt['data'][cur_ch], axis=axis_num)
+            cur_arr = data_pkt['data'][cur_ch]
+            data_pkt['data'][cur_ch] = self._cast_to_data_dtype(np.real(np.std(cur_arr, axis=axis_num, dtype=self._get_accumulator_dtype(data_pkt, cur_arr))), cur_arr.dtype)
 
         #Remove the parameter as it no longer exists after the averaging...
         data_pkt['parameters'].pop(axis_num)
@@ -37,3 +40,6 @@ class CPU_Variance(ProcNodeCPU):
             'Type'  : self.__class__.__name__,
             'Parameter' : self._param_name
         }
+
+    def _online_output(self, ch_name, ch_stats):
+        return [(ch_name, np.sqrt(ch_stats['var']))]
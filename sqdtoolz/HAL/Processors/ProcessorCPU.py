@@ -1,5 +1,5 @@
 from  sqdtoolz.HAL.DataProcessor import DataProcessor
-from multiprocessing.pool import ThreadPool
+import threading
 import queue
 import numpy as np
 
@@ -13,6 +13,84 @@ class ProcNodeCPU:
     def _get_current_config(self):
         raise NotImplementedError()
 
+    def _get_accumulator_dtype(self, data_pkt, cur_arr):
+        #Returns the dtype in which to accumulate the array in reductions (as given by ProcessorCPU in the packet) or None to use
+        #that of numpy (e.g. when the stage is used outside a processor or on integer data)
+        acc_type = data_pkt.get('misc', {}).get('AccumulatorType', None)
+        if acc_type is None or not np.issubdtype(cur_arr.dtype, np.inexact):
+            return None
+        acc_dtype = np.result_type(acc_type, cur_arr.dtype)
+        return None if acc_dtype == cur_arr.dtype else acc_dtype
+
+    def _cast_to_data_dtype(self, cur_arr, data_dtype):
+        #Casts a reduction (accumulated in a wider dtype) back into the precision of the input data
+        if not np.issubdtype(data_dtype, np.inexact):
+            return cur_arr
+        if not np.iscomplexobj(cur_arr):
+            data_dtype = np.finfo(data_dtype).dtype
+        return cur_arr.astype(data_dtype, copy=False)
+
+class ProcNodeCPUReduction(ProcNodeCPU):
+    '''
+    Base class of the stages reducing each channel across some parameter. When such a stage is the first end-stage and reduces
+    across the first parameter (e.g. repetition), ProcessorCPU folds every data packet into the running statistics (i.e. merging
+    the per-packet moments via Welford's/Chan's algorithm) as it is processed instead of concatenating all the packets. Thus, the
+    memory used is that of the output rather than that of all the acquired data.
+
+    The subclasses set _online_stats to the statistics to track ('sum', 'mean' and/or 'var') and implement _online_output.
+    '''
+    _online_stats = ()
+
+    def _can_fold_online(self, data_pkt):
+        return len(data_pkt['parameters']) > 0 and data_pkt['parameters'][0] == self._param_name and \
+               all(isinstance(x, np.ndarray) and x.ndim > 0 for x in data_pkt['data'].values())
+
+    def _fold_online(self, state, data_pkt):
+        #The state holds the number of folded entries, the first data packet (returned with the results like the other stages) and
+        #the running statistics of each channel
+        if state is None:
+            state = {'count' : 0, 'data' : {}, 'dtypes' : {}, 'pkt' : data_pkt}
+        num_a = state['count']
+        for cur_ch, cur_arr in data_pkt['data'].items():
+            num_b = cur_arr.shape[0]
+            #The running statistics are kept in the accumulator dtype until they are finalised
+            acc_dtype = self._get_accumulator_dtype(data_pkt, cur_arr)
+            cur_stats = {}
+            if 'sum' in self._online_stats:
+                cur_stats['sum'] = np.sum(cur_arr, axis=0, dtype=acc_dtype)
+            if 'mean' in self._online_stats:
+                cur_stats['mean'] = np.mean(cur_arr, axis=0, dtype=acc_dtype)
+            if 'var' in self._online_stats:
+                cur_stats['var'] = np.real(np.var(cur_arr, axis=0, dtype=acc_dtype))
+            if num_a == 0:
+                state['data'][cur_ch] = cur_stats
+                state['dtypes'][cur_ch] = cur_arr.dtype
+                continue
+            prev_stats = state['data'][cur_ch]
+            num_tot = num_a + num_b
+            if 'sum' in self._online_stats:
+                prev_stats['sum'] = prev_stats['sum'] + cur_stats['sum']
+            if 'mean' in self._online_stats:
+                delta = cur_stats['mean'] - prev_stats['mean']
+                prev_stats['mean'] = prev_stats['mean'] + delta * (num_b / num_tot)
+                if 'var' in self._online_stats:
+                    prev_stats['var'] = (num_a * prev_stats['var'] + num_b * cur_stats['var'] + np.abs(delta)**2 * (num_a * num_b / num_tot)) / num_tot
+        state['count'] = num_a + data_pkt['data'][next(iter(data_pkt['data']))].shape[0]
+        return state
+
+    def _finalise_online(self, state):
+        ret_data = state['pkt']
+        ret_data['parameters'].pop(0)
+        ret_data['data'].clear()
+        for cur_ch, cur_stats in state['data'].items():
+            for cur_name, cur_arr in self._online_output(cur_ch, cur_stats):
+                ret_data['data'][cur_name] = self._cast_to_data_dtype(cur_arr, state['dtypes'][cur_ch])
+        return ret_data
+
+    def _online_output(self, ch_name, ch_stats):
+        #Returns a list of tuples (channel name, array) given the channel's statistics
+        raise NotImplementedError()
+
 from sqdtoolz.HAL.Processors.CPU.CPU_AmpPhs import*
 from sqdtoolz.HAL.Processors.CPU.CPU_DDC import*
 from sqdtoolz.HAL.Processors.CPU.CPU_FIR import*
@@ -29,21 +107,55 @@ from sqdtoolz.HAL.Processors.CPU.CPU_ConstantArithmetic import*
 from sqdtoolz.HAL.Processors.CPU.CPU_MeanBlock import*
 from sqdtoolz.HAL.Processors.CPU.CPU_kMeans import*
 from sqdtoolz.HAL.Processors.CPU.CPU_Decimation import*
+from sqdtoolz.HAL.Processors.CPU.CPU_DDCFIRDecimation import*
+from sqdtoolz.HAL.Processors.CPU.CPU_FIRDecimation import*
 
 from sqdtoolz.HAL.Processors.CPU.CPU_FFT import*
 from sqdtoolz.HAL.Processors.CPU.CPU_ESD import*
 
 
 class ProcessorCPU(DataProcessor):
-    def __init__(self, proc_name, lab, pipeline_main = [], pipeline_end = []):
+    def __init__(self, proc_name, lab, pipeline_main = [], pipeline_end = [], **kwargs):
+        '''
+        Processor running the processing stages on the CPU.
+
+        Inputs:
+            - pipeline_main, pipeline_end - Lists of the processing stages run on every data packet (as pushed via push_data) and
+                                            on the collated data (in get_all_data) respectively.
+            - streaming        - If True, the data packets are processed by worker threads as they are pushed (i.e. processing
+                                 overlaps the acquisition) instead of all at once in get_all_data.
+            - num_workers      - Number of worker threads used when streaming. The order of the processed packets is always
+                                 the order in which they were pushed. Note that the stages must be thread-safe if more than 1.
+            - max_queued_packets - Maximum number of data packets waiting to be processed when streaming before push_data
+                                   blocks (i.e. backpressure on the acquisition). If 0, there is no limit.
+            - data_type        - Either 'float64' (default; the data is processed in the dtype given by the ACQ driver) or
+                                 'float32' in which the data is cast into float32/complex64 before the main pipeline.
+            - accumulate_float64 - If True (default), the reductions (e.g. CPU_Mean) accumulate float32 data in float64 before
+                                   casting the result back into float32.
+        '''
         super().__init__(proc_name, lab)
-        self.tp_CPU = ThreadPool(processes=1)
-        self.cur_async_handle = None
+        #Stop the workers if the processor is being recreated
+        if hasattr(self, '_workers'):
+            self._stop_workers()
+        self._workers = []
+        self._streaming = kwargs.get('streaming', False)
+        self._num_workers = kwargs.get('num_workers', 1)
+        self._max_queued_pkts = kwargs.get('max_queued_packets', 4)
+        self.DataType = kwargs.get('data_type', 'float64')
+        self.AccumulateFloat64 = kwargs.get('accumulate_float64', True)
 
         self.pipeline = pipeline_main
         self.pipeline_end = pipeline_end
         self.cur_data_queue = queue.Queue()
         self.cur_data_processed = []
+        #Processed packets and exceptions (when streaming) indexed by the order in which the packets were pushed
+        self._cur_pkt_index = 0
+        self._cur_data_processed_inds = {}
+        self._cur_errors = {}
+        self._results_lock = threading.Lock()
+        #State of the first end-stage when folding the processed packets into it as they arrive (in the pushed order)
+        self._online_state = None
+        self._online_next_index = 0
 
     @classmethod
     def fromConfigDict(cls, config_dict, lab):
@@ -61,23 +173,94 @@ class ProcessorCPU(DataProcessor):
             cur_proc_type = globals()[cur_proc_type]
             new_proc = cur_proc_type.fromConfigDict(cur_proc)
             pipeline_end.append(new_proc)
-        return cls(config_dict['Name'], lab, pipeline_main, pipeline_end)
+        return cls(config_dict['Name'], lab, pipeline_main, pipeline_end, streaming = config_dict.get('Streaming', False),
+                   num_workers = config_dict.get('NumWorkers', 1), max_queued_packets = config_dict.get('MaxQueuedPackets', 4),
+                   data_type = config_dict.get('DataType', 'float64'), accumulate_float64 = config_dict.get('AccumulateFloat64', True))
+
+    @property
+    def Streaming(self):
+        return self._streaming
+    @Streaming.setter
+    def Streaming(self, boolVal):
+        #The workers are only restarted on an actual change (e.g. not when reapplying the same configuration)
+        if boolVal == self._streaming:
+            return
+        self._wait_for_workers()
+        self._stop_workers()
+        self._streaming = boolVal
+
+    @property
+    def NumWorkers(self):
+        return self._num_workers
+    @NumWorkers.setter
+    def NumWorkers(self, val):
+        assert val >= 1, "The number of worker threads must be at least 1."
+        if int(val) == self._num_workers:
+            return
+        self._wait_for_workers()
+        self._stop_workers()
+        self._num_workers = int(val)
+
+    @property
+    def MaxQueuedPackets(self):
+        return self._max_queued_pkts
+    @MaxQueuedPackets.setter
+    def MaxQueuedPackets(self, val):
+        assert val >= 0, "The maximum number of queued packets must be non-negative (0 for no limit)."
+        if int(val) == self._max_queued_pkts:
+            return
+        self._wait_for_workers()
+        self._stop_workers()
+        self._max_queued_pkts = int(val)
+
+    @property
+    def DataType(self):
+        return self._data_type
+    @DataType.setter
+    def DataType(self, val):
+        assert val in ['float64', 'float32'], "The data type must be 'float64' or 'float32'."
+        self._data_type = val
+
+    @property
+    def AccumulateFloat64(self):
+        return self._acc_float64
+    @AccumulateFloat64.setter
+    def AccumulateFloat64(self, boolVal):
+        self._acc_float64 = boolVal
 
     def push_data(self, data_pkt):
-        self.cur_data_queue.put(data_pkt)
-        #Start a new thread - otherwise, the thread will automatically check and pop the new array for processing
-        # if self.cur_async_handle == None:
-        #     self.cur_async_handle = self.tp_CPU.apply_async(self._process_all)
-        # elif self.cur_async_handle.ready():
-        #     self.cur_async_handle = self.tp_CPU.apply_async(self._process_all)
-        # self._process_all()
+        if self._streaming and len(self._workers) == 0:
+            self._start_workers()
+        #If streaming, this blocks while MaxQueuedPackets packets are still waiting to be processed
+        self.cur_data_queue.put((self._cur_pkt_index, data_pkt))
+        self._cur_pkt_index += 1
 
     def get_all_data(self):
-        #Wait until ready
-        # while not self.ready():
-        #     continue
-        #Empty the queue just in case...
+        #Wait until all pushed packets have been processed (by the workers if streaming) and collate them in the pushed order
+        self._wait_for_workers()
         self._process_all()
+        with self._results_lock:
+            cur_errors = self._cur_errors
+            cur_inds = sorted(self._cur_data_processed_inds.keys())
+            self.cur_data_processed = [self._cur_data_processed_inds[x] for x in cur_inds]
+            online_state = self._online_state
+            self._cur_data_processed_inds = {}
+            self._cur_errors = {}
+            self._cur_pkt_index = 0
+            self._online_state = None
+            self._online_next_index = 0
+        #Raise the exception of the earliest failing data packet
+        if len(cur_errors) > 0:
+            self.cur_data_processed = []
+            raise cur_errors[min(cur_errors.keys())]
+
+        if online_state is not None:
+            #All packets have been folded into the first end-stage
+            assert len(self.cur_data_processed) == 0, "Some processed data packets could not be folded into the first end-stage."
+            ret_data = self.pipeline_end[0]._finalise_online(online_state)
+            for cur_proc in self.pipeline_end[1:]:
+                ret_data = cur_proc.process_data(ret_data, end_stage=True)
+            return ret_data
 
         if len(self.cur_data_processed) == 0:
             return None
@@ -108,20 +291,91 @@ class ProcessorCPU(DataProcessor):
         return ret_data
 
     def ready(self):
-        if self.cur_async_handle == None:
-            return True
-        return self.cur_async_handle.ready()
+        return len(self._workers) == 0 or self.cur_data_queue.unfinished_tasks == 0
 
-    def _process_all(self):
-        while not self.cur_data_queue.empty():
-            cur_data = self.cur_data_queue.get()
-            
-            #Run the processes
+    def release(self):
+        #Stops the worker threads after the pushed packets are processed (they are restarted on the next push_data if streaming)
+        self._wait_for_workers()
+        self._stop_workers()
+
+    def _process_packet(self, pkt_index, cur_data):
+        #Run the processes
+        try:
+            self._apply_data_type(cur_data)
             for cur_proc in self.pipeline:
                 cur_data = cur_proc.process_data(cur_data)
-            
-            self.cur_data_processed.append(cur_data)
+        except Exception as e:
+            with self._results_lock:
+                self._cur_errors[pkt_index] = e
+            return
+        with self._results_lock:
+            self._cur_data_processed_inds[pkt_index] = cur_data
+            self._fold_processed_packets()
+
+    def _apply_data_type(self, data_pkt):
+        #Casts the data into the processing precision and notes it (and the accumulator precision) for the stages in the packet
+        if self._data_type == 'float32':
+            for cur_ch in data_pkt['data']:
+                cur_arr = data_pkt['data'][cur_ch]
+                if isinstance(cur_arr, np.ndarray):
+                    data_pkt['data'][cur_ch] = cur_arr.astype(np.complex64 if np.iscomplexobj(cur_arr) else np.float32, copy=False)
+        if 'misc' not in data_pkt:
+            data_pkt['misc'] = {}
+        data_pkt['misc']['DataType'] = self._data_type
+        data_pkt['misc']['AccumulatorType'] = 'float64' if self._acc_float64 else self._data_type
 
+    def _fold_processed_packets(self):
+        #Folds the processed packets (in the pushed order) into the first end-stage if it supports online reduction
+        if len(self.pipeline_end) == 0 or not isinstance(self.pipeline_end[0], ProcNodeCPUReduction):
+            return
+        cur_stage = self.pipeline_end[0]
+        while self._online_next_index in self._cur_data_processed_inds:
+            cur_data = self._cur_data_processed_inds[self._online_next_index]
+            #Decided on the first packet - otherwise, the packets are concatenated as usual in get_all_data
+            if self._online_state is None and (self._online_next_index > 0 or not cur_stage._can_fold_online(cur_data)):
+                return
+            self._online_state = cur_stage._fold_online(self._online_state, cur_data)
+            del self._cur_data_processed_inds[self._online_next_index]
+            self._online_next_index += 1
+
+    def _process_all(self):
+        while not self.cur_data_queue.empty():
+            pkt_index, cur_data = self.cur_data_queue.get()
+            self._process_packet(pkt_index, cur_data)
+            self.cur_data_queue.task_done()
+
+    def _worker_loop(self, data_queue):
+        while True:
+            cur_item = data_queue.get()
+            if cur_item is None:
+                data_queue.task_done()
+                return
+            #Skip the remaining packets once a packet fails (the exception is raised in get_all_data)
+            if len(self._cur_errors) == 0:
+                self._process_packet(*cur_item)
+            data_queue.task_done()
+
+    def _start_workers(self):
+        #Process any packets pushed before streaming was enabled
+        self._process_all()
+        self.cur_data_queue = queue.Queue(maxsize=self._max_queued_pkts)
+        self._workers = [threading.Thread(target=self._worker_loop, args=(self.cur_data_queue,), daemon=True) for m in range(self._num_workers)]
+        for cur_worker in self._workers:
+            cur_worker.start()
+
+    def _wait_for_workers(self):
+        if len(self._workers) > 0:
+            self.cur_data_queue.join()
+
+    def _stop_workers(self):
+        if len(self._workers) == 0:
+            return
+        for m in range(len(self._workers)):
+            self.cur_data_queue.put(None)
+        for cur_worker in self._workers:
+            cur_worker.join()
+        self._workers = []
+        self.cur_data_queue = queue.Queue()
 
     def reset_pipeline(self):
         self.pipeline.clear()
@@ -155,13 +409,23 @@ class ProcessorCPU(DataProcessor):
             'Name' : self.Name,
             'Type'  : self.__class__.__name__,
             'Pipeline' : [x._get_current_config() for x in self.pipeline],
-            'PipelineEnd' : [x._get_current_config() for x in self.pipeline_end]
+            'PipelineEnd' : [x._get_current_config() for x in self.pipeline_end],
+            'Streaming' : self._streaming,
+            'NumWorkers' : self._num_workers,
+            'MaxQueuedPackets' : self._max_queued_pkts,
+            'DataType' : self._data_type,
+            'AccumulateFloat64' : self._acc_float64
         }
 
     def _set_current_config(self, dict_config, lab):
         assert dict_config['Type'] == self.__class__.__name__, f"Dictionary specifies wrong processor class type ({self.__class__.__name__})."
         #Delete everything...
         self.reset_pipeline()
+        self.Streaming = dict_config.get('Streaming', False)
+        self.NumWorkers = dict_config.get('NumWorkers', 1)
+        self.MaxQueuedPackets = dict_config.get('MaxQueuedPackets', 4)
+        self.DataType = dict_config.get('DataType', 'float64')
+        self.AccumulateFloat64 = dict_config.get('AccumulateFloat64', True)
         for cur_proc in dict_config['Pipeline']:
             cur_proc_type = cur_proc['Type']
             assert cur_proc_type in globals(), cur_proc_type + " is not in the current namespace. Need to perhaps include this class in this file..."
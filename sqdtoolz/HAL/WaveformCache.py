@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+class WaveformCache:
+    '''
+    Memoisation cache of the waveform segment arrays (see WaveformSegmentBase.get_waveform) shared by all AWG HALs in a
+    Laboratory. The least recently used arrays are evicted once the total size of the cached arrays exceeds MaxBytes. The
+    cached arrays are read-only as they may be returned again.
+
+    Inputs:
+        - max_bytes - Memory budget in bytes. If 0, the cache is disabled.
+    '''
+    def __init__(self, max_bytes=128e6):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_bytes = max_bytes
+        self._num_bytes = 0
+        self.reset_stats()
+
+    @property
+    def MaxBytes(self):
+        return self._max_bytes
+    @MaxBytes.setter
+    def MaxBytes(self, val):
+        assert val >= 0, "The waveform cache memory budget must be a non-negative number of bytes."
+        self._max_bytes = val
+        with self._lock:
+            self._evict()
+
+    @property
+    def Enabled(self):
+        return self._max_bytes > 0
+
+    def get(self, key):
+        #Returns the tuple (array, extra data) stored for the key or None
+        with self._lock:
+            cur_entry = self._entries.get(key, None)
+            if cur_entry is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+                self._entries.move_to_end(key)
+            return cur_entry
+
+    def put(self, key, wfm_arr, extra=None):
+        #Stores a read-only view of the array (and any extra data such as the WFMT state after generating it); returns said view
+        wfm_arr = wfm_arr.view()
+        wfm_arr.flags.writeable = False
+        if wfm_arr.nbytes > self._max_bytes:
+            return wfm_arr
+        with self._lock:
+            prev_entry = self._entries.pop(key, None)
+            if prev_entry is not None:
+                self._num_bytes -= prev_entry[0].nbytes
+            self._entries[key] = (wfm_arr, extra)
+            self._num_bytes += wfm_arr.nbytes
+            self._evict()
+        return wfm_arr
+
+    def _evict(self):
+        while self._num_bytes > self._max_bytes and len(self._entries) > 0:
+            _, cur_entry = self._entries.popitem(last=False)
+            self._num_bytes -= cur_entry[0].nbytes
+            self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._num_bytes = 0
+
+    def reset_stats(self):
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get_stats(self):
+        '''
+        Returns a dictionary with the numbers of cache 'Hits', 'Misses' and 'Evictions' (since the last reset_stats) and the
+        current number of 'Entries' and their total size in 'Bytes'.
+        '''
+        with self._lock:
+            return {'Hits' : self._hits, 'Misses' : self._misses, 'Evictions' : self._evictions, 'Entries' : len(self._entries), 'Bytes' : self._num_bytes}
+
+def get_hashable_key(val):
+    #Converts lists and numpy arrays (e.g. the amplitudes of a WFS_Multiplex) into tuples so that they can be used in cache keys
+    if isinstance(val, np.ndarray):
+        return (val.dtype.str, val.shape, val.tobytes())
+    if isinstance(val, (list, tuple)):
+        return tuple(get_hashable_key(x) for x in val)
+    if isinstance(val, dict):
+        return tuple((k, get_hashable_key(val[k])) for k in sorted(val))
+    return val
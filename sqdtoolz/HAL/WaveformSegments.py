@@ -2,6 +2,40 @@ from optparse import AmbiguousOptionError
 import numpy as np
 from sqdtoolz.HAL.WaveformTransformations import*
 from sqdtoolz.HAL.HALbase import LockableProperties
+from sqdtoolz.HAL.WaveformCache import get_hashable_key
+
+def assemble_waveform_segments(wfm_segs, lab, fs, t0_ind, ch_index, num_repeats=1, seg_pts=None):
+    '''
+    Concatenates the waveforms of the given segments (skipping those with no points) by writing them into a preallocated array.
+
+    Inputs:
+        - wfm_segs    - List of waveform segments (i.e. daughters of WaveformSegmentBase).
+        - lab, fs, ch_index - As given to get_waveform.
+        - t0_ind      - Point index (in the overall waveform) of the first point of the first segment.
+        - num_repeats - Number of times the list of segments is repeated.
+        - seg_pts     - List of the number of points in each segment (i.e. NumPts(fs)) if already calculated.
+
+    Returns a numpy array of points representing the concatenated waveform.
+    '''
+    if seg_pts is None:
+        seg_pts = [x.NumPts(fs) for x in wfm_segs]
+    final_wfm = np.empty(sum(seg_pts) * num_repeats)
+    t0 = 0
+    for m in range(num_repeats):
+        for cur_wfm_seg, cur_pts in zip(wfm_segs, seg_pts):
+            if cur_pts == 0:
+                continue
+            cur_wfm = np.asarray(cur_wfm_seg._get_waveform_cached(lab, fs, t0_ind + t0, ch_index))
+            #A segment may not yield exactly NumPts points (e.g. a WFS_Group rounds its individual segments) - so grow if required
+            if t0 + cur_wfm.size > final_wfm.size:
+                final_wfm = np.concatenate((final_wfm, np.empty(t0 + cur_wfm.size - final_wfm.size)))
+            if not np.can_cast(cur_wfm.dtype, final_wfm.dtype):
+                final_wfm = final_wfm.astype(np.result_type(final_wfm, cur_wfm))
+            final_wfm[t0:t0+cur_wfm.size] = cur_wfm
+            t0 += cur_wfm.size
+    if t0 < final_wfm.size:
+        return final_wfm[:t0].copy()
+    return final_wfm
 
 class WaveformSegmentBase(LockableProperties):
     def __init__(self, name, transform_func, duration):
@@ -17,7 +51,8 @@ class WaveformSegmentBase(LockableProperties):
         return self._name
 
     def NumPts(self, fs):
-        return int(np.round(self.Duration*fs))
+        #Python's round is the same as np.round (i.e. half to even), but much faster on scalars
+        return int(round(self.Duration*fs))
 
     @property
     def Duration(self):
@@ -55,7 +90,25 @@ class WaveformSegmentBase(LockableProperties):
         
         Returns a numpy array of points representing the total waveform.
         '''
-        cur_wfm = self._get_waveform(lab, fs, t0_ind, ch_index)
+        cur_wfm = self._get_waveform_cached(lab, fs, t0_ind, ch_index)
+        #Cached arrays are read-only - so return a copy that the caller may modify
+        return cur_wfm if cur_wfm.flags.writeable else cur_wfm.copy()
+
+    def _get_waveform_cached(self, lab, fs, t0_ind, ch_index):
+        #Same as get_waveform, but the returned array may be a read-only array from the Laboratory's WaveformCache. The envelope
+        #(i.e. _get_waveform) is cached on the segment parameters only (e.g. identical pulses at different positions share it),
+        #while the transformed waveform is cached on the WFMT settings/state, the point index and the channel.
+        wfm_cache = getattr(lab, '_waveform_cache', None)
+        wfm_key = self._get_waveform_key() if wfm_cache is not None and wfm_cache.Enabled else None
+        if wfm_key is None:
+            cur_wfm = self._get_waveform(lab, fs, t0_ind, ch_index)
+        else:
+            wfm_key = (self.__class__, fs, self.NumPts(fs), wfm_key)
+            cur_entry = wfm_cache.get(wfm_key)
+            if cur_entry is None:
+                cur_wfm = wfm_cache.put(wfm_key, np.asarray(self._get_waveform(lab, fs, t0_ind, ch_index)))
+            else:
+                cur_wfm = cur_entry[0]
         #Transform if necessary:      
         if self._transform_func:
             kwargs = self._transform_func.kwargs
@@ -65,13 +118,29 @@ class WaveformSegmentBase(LockableProperties):
                     none_keys += [cur_key]
             for cur_none_key in none_keys:
                 kwargs.pop(cur_none_key)
-            return lab.WFMT(self._transform_func.wfmt_name).modify_waveform(cur_wfm, fs, t0_ind, ch_index, **kwargs)
+            wfmt_obj = lab.WFMT(self._transform_func.wfmt_name)
+            wfmt_state = wfmt_obj._get_cache_state() if wfm_key is not None else None
+            if wfmt_state is None:
+                return wfmt_obj.modify_waveform(cur_wfm if cur_wfm.flags.writeable else cur_wfm.copy(), fs, t0_ind, ch_index, **kwargs)
+            wfmt_key = (wfm_key, wfmt_obj.Name, wfmt_state, get_hashable_key(kwargs), t0_ind, ch_index)
+            cur_entry = wfm_cache.get(wfmt_key)
+            if cur_entry is None:
+                cur_wfm = np.asarray(wfmt_obj.modify_waveform(cur_wfm, fs, t0_ind, ch_index, **kwargs))
+                #Store the WFMT state after the modification (e.g. phase tracking) so that it can be restored on a cache hit
+                return wfm_cache.put(wfmt_key, cur_wfm, wfmt_obj._get_cache_state())
+            wfmt_obj._set_cache_state(cur_entry[1])
+            return cur_entry[0]
         else:
             return cur_wfm
 
     def _get_waveform(self, lab, fs, t0_ind, ch_index):
         raise NotImplementedError()
 
+    def _get_waveform_key(self):
+        #Returns a hashable key of the parameters that determine the output of _get_waveform for a given sample rate and number of
+        #points; it must not depend on t0_ind or ch_index. Returns None if the waveform must not be cached (the default).
+        return None
+
     def _get_current_config(self):
         '''
         Gets the current JSON-style configuration that can be used to reinstantiate this class. Note that the inherited
@@ -149,7 +218,7 @@ class WFS_Group(WaveformSegmentBase):
             cur_time_1 = sum([x.Duration for x in self._wfm_segs])
         else:
             cur_time_1 = self._abs_time
-        return int(np.round(cur_time_1*fs)) * self._num_repeats
+        return int(round(cur_time_1*fs)) * self._num_repeats
 
     @property
     def NumRepeats(self):
@@ -246,15 +315,7 @@ class WFS_Group(WaveformSegmentBase):
             self._wfm_segs[elas_seg_ind].Duration = elastic_time    #Negate the -1 segment
 
         #Concatenate the individual waveform segments
-        final_wfm = np.array([])
-        t0 = 0
-        for m in range(self._num_repeats):
-            for cur_wfm_seg in self._wfm_segs:
-                if cur_wfm_seg.NumPts(fs) == 0:
-                    continue
-                #TODO: Preallocate - this is a bit inefficient...
-                final_wfm = np.concatenate((final_wfm, cur_wfm_seg.get_waveform(lab, fs, t0_ind + t0, ch_index)))
-                t0 = final_wfm.size
+        final_wfm = assemble_waveform_segments(self._wfm_segs, lab, fs, t0_ind, ch_index, self._num_repeats)
 
         #Reset segment to be elastic
         if elas_seg_ind != -1:
@@ -296,6 +357,9 @@ class WFS_Constant(WaveformSegmentBase):
     def _get_waveform(self, lab, fs, t0_ind, ch_index):
         return np.zeros(round(self.NumPts(fs))) + self._value
 
+    def _get_waveform_key(self):
+        return get_hashable_key(self._value)
+
     def _get_current_config(self):
         cur_dict = WaveformSegmentBase._get_current_config(self)
         cur_dict['Duration'] = self.Duration
@@ -350,6 +414,9 @@ class WFS_Gaussian(WaveformSegmentBase):
         #Make the height the desired amplitude...
         return self._amplitude * sample_points
 
+    def _get_waveform_key(self):
+        return (get_hashable_key(self._amplitude), self._num_sd)
+
     def _get_current_config(self):
         cur_dict = WaveformSegmentBase._get_current_config(self)
         cur_dict['Duration'] = self.Duration
@@ -401,6 +468,9 @@ class WFS_Cosine(WaveformSegmentBase):
         t_vals = np.arange(self.NumPts(fs)) / fs
         return self.Amplitude * np.cos(2*np.pi*self.Frequency * t_vals + self.Phase)
 
+    def _get_waveform_key(self):
+        return get_hashable_key((self._amplitude, self._frequency, self._phase))
+
     def _get_current_config(self):
         cur_dict = WaveformSegmentBase._get_current_config(self)
         cur_dict['Duration'] = self.Duration
@@ -482,6 +552,9 @@ class WFS_Multiplex(WaveformSegmentBase):
 
         return finalWaveform
 
+    def _get_waveform_key(self):
+        return get_hashable_key((self._amplitudes, self._frequencies, self._phases))
+
     def _get_current_config(self):
         cur_dict = WaveformSegmentBase._get_current_config(self)
         cur_dict['Duration'] = self.Duration
@@ -592,6 +665,12 @@ class WFS_RandomGaussian(WaveformSegmentBase):
     def _get_waveform(self, lab, fs, t0_ind, ch_index):
         return np.random.default_rng(seed=self.Seed).normal(self.Mean, self.StdDev, size=self.NumPts(fs))
 
+    def _get_waveform_key(self):
+        #i.e. the noise is only deterministic for a given seed - fresh noise must be drawn every time if it is unseeded
+        if self._seed is None:
+            return None
+        return get_hashable_key((self._mean, self._sd, self._seed))
+
     def _get_current_config(self):
         cur_dict = WaveformSegmentBase._get_current_config(self)
         cur_dict['Duration'] = self.Duration
@@ -1,5 +1,7 @@
 import numpy as np
+import math
 from sqdtoolz.HAL.LockableProperties import LockableProperties
+from sqdtoolz.HAL.WaveformCache import WaveformCache
 class WaveformTransformationArgs:
     def __init__(self, wfmt_name, kwargs):
         self.wfmt_name = wfmt_name
@@ -86,7 +88,20 @@ class WaveformTransformation(LockableProperties):
     def _process_kwargs(self, kwargs):
         raise NotImplementedError()
 
+    def _get_cache_state(self):
+        #Returns a hashable key of the settings and internal state (e.g. the tracked phase) that determine the output of
+        #modify_waveform. Returns None if the transformed waveforms must not be cached (the default).
+        return None
+
+    def _set_cache_state(self, state):
+        #Restores the internal state given by _get_cache_state after modifying a waveform (used on a cache hit)
+        pass
+
 class WFMT_ModulationIQ(WaveformTransformation):
+    #Cosine and sine carriers cos(2*pi*f*n/fs) and sin(2*pi*f*n/fs) shared by all IQ modulation WFMTs. The phase of a given
+    #segment is applied onto the cached carriers as a rotation (i.e. the angle addition formulae) instead of recomputing them.
+    _carrier_cache = WaveformCache(32e6)
+
     def __init__(self, name, lab, iq_frequency, **kwargs):
         super().__init__(name)
         if lab._register_WFMT(self):
@@ -96,6 +111,7 @@ class WFMT_ModulationIQ(WaveformTransformation):
             self._iq_phase_offset = kwargs.get('iq_phase_offset', 0.0)            #Defined as the phase to add to the Q (sine) term
             self._iq_dc_offsets = kwargs.get('iq_dc_offsets', (0.0, 0.0))       
             self._iq_upper_sb = kwargs.get('iq_upper_sb', True)
+            self._iq_single_precision = kwargs.get('iq_single_precision', False)    #Computes the modulated waveforms in float32
             self._cur_t0 = 0.0
         else:
             self._iq_frequency = iq_frequency
@@ -104,12 +120,14 @@ class WFMT_ModulationIQ(WaveformTransformation):
             self._iq_phase_offset = kwargs.get('iq_phase_offset', self._iq_phase_offset)            #Defined as the phase to add to the Q (sine) term
             self._iq_dc_offsets = kwargs.get('iq_dc_offsets', self._iq_dc_offsets)       
             self._iq_upper_sb = kwargs.get('iq_upper_sb', self._iq_upper_sb)
+            self._iq_single_precision = kwargs.get('iq_single_precision', self._iq_single_precision)
             self._cur_t0 = 0.0
 
     @classmethod
     def fromConfigDict(cls, config_dict, lab):
         return cls(config_dict["Name"], lab, config_dict["IQ Frequency"], iq_amplitude = config_dict["IQ Amplitude"], iq_amplitude_factor = config_dict["IQ Amplitude Factor"],
-                              iq_phase_offset = config_dict["IQ Phase Offset"], iq_dc_offsets = tuple(config_dict["IQ DC Offset"]), iq_upper_sb = config_dict["IQ using Upper Sideband"])
+                              iq_phase_offset = config_dict["IQ Phase Offset"], iq_dc_offsets = tuple(config_dict["IQ DC Offset"]), iq_upper_sb = config_dict["IQ using Upper Sideband"],
+                              iq_single_precision = config_dict.get("IQ Single Precision", False))
 
     @property
     def IQFrequency(self):
@@ -154,6 +172,13 @@ class WFMT_ModulationIQ(WaveformTransformation):
     def IQUpperSideband(self, boolVal: bool):
         self._iq_upper_sb = boolVal
 
+    @property
+    def IQSinglePrecision(self):
+        return self._iq_single_precision
+    @IQSinglePrecision.setter
+    def IQSinglePrecision(self, boolVal: bool):
+        self._iq_single_precision = boolVal
+
     def set_IQ_parameters(self, amp = 1.0, dc_offset = (0.0, 0.0), amplitude_factor = 1.0, phase_offset = 0.0):
         self.IQAmplitude = amp
         self.IQdcOffset = dc_offset
@@ -183,13 +208,37 @@ class WFMT_ModulationIQ(WaveformTransformation):
             else:
                 cur_t_off = -kwargs.get('phase_segment') / (2*np.pi*self.IQFrequency)
 
-        t_vals = np.arange(wfm_pts.size) / fs + t0 - self._cur_t0 - cur_t_off
+        #The carrier phase is 2*pi*f*(n/fs + t0 - cur_t0 - t_off) = theta_n + phi. Thus, cos(theta_n + phi) and sin(theta_n + phi)
+        #are rotations of the cached carriers cos(theta_n) and sin(theta_n) by phi.
+        assert ch_index == 0 or ch_index == 1, "Channel Index must be 0 or 1 for I or Q respectively."
+        cur_dtype = np.float32 if self._iq_single_precision else np.float64
+        carr_cos, carr_sin = self._get_carrier(fs, wfm_pts.size, cur_dtype)
+        cur_phs = 2 * np.pi * self.IQFrequency * (t0 - self._cur_t0 - cur_t_off)
         if ch_index == 0:   #I-Channel
-            return wfm_pts * self.IQAmplitude * np.cos(2 * np.pi * self.IQFrequency * t_vals) + self.IQdcOffset[0]
-        elif ch_index == 1: #Q-Channel
-            return wfm_pts * self.IQAmplitude * self.IQAmplitudeFactor * np.sin(2 * np.pi * self.IQFrequency * t_vals + self.IQPhaseOffset) + self.IQdcOffset[1]
+            cur_ampl = self.IQAmplitude
+            carr_mod = carr_cos * (cur_ampl * math.cos(cur_phs))
+            carr_mod -= carr_sin * (cur_ampl * math.sin(cur_phs))
+            cur_dc = self.IQdcOffset[0]
+        else:               #Q-Channel
+            cur_ampl = self.IQAmplitude * self.IQAmplitudeFactor
+            cur_phs += self.IQPhaseOffset
+            carr_mod = carr_sin * (cur_ampl * math.cos(cur_phs))
+            carr_mod += carr_cos * (cur_ampl * math.sin(cur_phs))
+            cur_dc = self.IQdcOffset[1]
+        carr_mod *= wfm_pts
+        if cur_dc != 0:
+            carr_mod += cur_dc
+        return carr_mod
+
+    def _get_carrier(self, fs, num_pts, dtype):
+        cur_key = (self.IQFrequency, fs, num_pts, np.dtype(dtype).str)
+        cur_entry = WFMT_ModulationIQ._carrier_cache.get(cur_key)
+        if cur_entry is None:
+            omega_n = 2 * np.pi * self.IQFrequency * (np.arange(num_pts) / fs)
+            carriers = WFMT_ModulationIQ._carrier_cache.put(cur_key, np.array([np.cos(omega_n), np.sin(omega_n)], dtype=dtype))
         else:
-            assert False, "Channel Index must be 0 or 1 for I or Q respectively."
+            carriers = cur_entry[0]
+        return carriers[0], carriers[1]
 
     def _get_current_config(self):
         ret_dict = {}
@@ -201,6 +250,7 @@ class WFMT_ModulationIQ(WaveformTransformation):
         ret_dict["IQ Phase Offset"] = self._iq_phase_offset
         ret_dict["IQ DC Offset"] = self._iq_dc_offsets
         ret_dict["IQ using Upper Sideband"] = self._iq_upper_sb
+        ret_dict["IQ Single Precision"] = self._iq_single_precision
         return ret_dict
 
     def _set_current_config(self, dict_config, instr_obj = None):
@@ -214,7 +264,14 @@ class WFMT_ModulationIQ(WaveformTransformation):
         self._iq_phase_offset = dict_config["IQ Phase Offset"]
         self._iq_dc_offsets = dict_config["IQ DC Offset"]
         self._iq_upper_sb  = dict_config["IQ using Upper Sideband"]
+        self._iq_single_precision = dict_config.get("IQ Single Precision", False)
     
+    def _get_cache_state(self):
+        return (self._iq_frequency, self._iq_amplitude, self._iq_amplitude_factor, self._iq_phase_offset, tuple(self._iq_dc_offsets), self._iq_upper_sb, self._iq_single_precision, self._cur_t0)
+
+    def _set_cache_state(self, state):
+        self._cur_t0 = state[-1]
+
     def _process_kwargs(self, kwargs):
         kwargs['phase'] = kwargs.get('phase', None)
         kwargs['phase_offset'] = kwargs.get('phase_offset', None)
@@ -0,0 +1,180 @@
+import os
+import sys
+import select
+import struct
+import threading
+import ctypes
+import ctypes.util
+
+class HaltSignal:
+    '''
+    In-process halt flag used by the Laboratory kill-switch. Checking the flag (is_set) is just a memory read. This base
+    backend is only set via trigger() (e.g. from another thread or a notebook callback) and never touches the filesystem;
+    the subclasses additionally watch for the halt-file (e.g. HALT.txt written by the ExperimentViewer) in the background.
+
+    Inputs:
+        - halt_file - Path of the file whose creation signals a halt.
+    '''
+    def __init__(self, halt_file):
+        self._halt_file = halt_file
+        self._event = threading.Event()
+
+    @property
+    def HaltFile(self):
+        return self._halt_file
+
+    def trigger(self):
+        self._event.set()
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def clear(self):
+        #Resets the flag and removes any halt-file
+        self._event.clear()
+        if os.path.exists(self._halt_file):
+            os.remove(self._halt_file)
+
+    def start(self):
+        #Clears any previous halt and starts watching for a new one
+        self.clear()
+
+    def stop(self):
+        pass
+
+class HaltSignalPolling(HaltSignal):
+    '''
+    Halt flag that is also set when the halt-file appears. The halt-file is polled by a background thread at most once every
+    poll_interval seconds so that the halt latency is bounded by poll_interval while the sweep loop only reads the flag.
+
+    Inputs:
+        - halt_file     - Path of the file whose creation signals a halt.
+        - poll_interval - Time (in seconds) between checks for the halt-file.
+    '''
+    def __init__(self, halt_file, poll_interval=0.2):
+        super().__init__(halt_file)
+        assert poll_interval > 0, "The halt-file poll interval must be positive."
+        self._poll_interval = poll_interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _check_file(self):
+        if os.path.exists(self._halt_file):
+            self._event.set()
+
+    def _watch(self):
+        while not self._stop_event.wait(self._poll_interval):
+            self._check_file()
+
+    def start(self):
+        super().start()
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._watch, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+class HaltSignalInotify(HaltSignalPolling):
+    '''
+    Halt flag that is set by Linux inotify events on the folder of the halt-file (i.e. with no polling of the filesystem). As
+    inotify does not see files written by other machines on network shares, the halt-file is still polled every poll_interval
+    seconds as a backstop.
+
+    Inputs:
+        - halt_file     - Path of the file whose creation signals a halt.
+        - poll_interval - Time (in seconds) between backstop checks for the halt-file.
+    '''
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_NONBLOCK = 0x00000800
+    IN_CLOEXEC = 0x00080000
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, halt_file, poll_interval=5.0):
+        super().__init__(halt_file, poll_interval)
+        assert HaltSignalInotify.is_available(), "inotify is not available on this system."
+
+    @staticmethod
+    def _get_libc():
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        except OSError:
+            return None
+        if not hasattr(libc, 'inotify_init1'):
+            return None
+        return libc
+
+    @staticmethod
+    def is_available():
+        return HaltSignalInotify._get_libc() is not None
+
+    def _watch(self):
+        libc = HaltSignalInotify._get_libc()
+        fd = libc.inotify_init1(HaltSignalInotify.IN_NONBLOCK | HaltSignalInotify.IN_CLOEXEC)
+        if fd < 0:
+            return super()._watch()     #e.g. the limit of inotify instances has been reached
+        try:
+            watch_dir = os.path.dirname(os.path.abspath(self._halt_file))
+            mask = HaltSignalInotify.IN_CREATE | HaltSignalInotify.IN_MOVED_TO | HaltSignalInotify.IN_CLOSE_WRITE
+            if libc.inotify_add_watch(fd, watch_dir.encode(), mask) < 0:
+                return super()._watch()
+            halt_name = os.path.basename(self._halt_file).encode()
+            #The file may have been created before the watch was added
+            self._check_file()
+            while not self._stop_event.is_set():
+                ready, _, _ = select.select([fd, self._wake_fd[0]], [], [], self._poll_interval)
+                if fd in ready:
+                    try:
+                        buf = os.read(fd, 4096)
+                    except BlockingIOError:
+                        continue
+                    offset = 0
+                    while offset < len(buf):
+                        _, _, _, name_len = HaltSignalInotify.EVENT_HEADER.unpack_from(buf, offset)
+                        offset += HaltSignalInotify.EVENT_HEADER.size
+                        if buf[offset:offset+name_len].rstrip(b'\0') == halt_name:
+                            self._check_file()  #i.e. not already removed on clearing the halt
+                        offset += name_len
+                elif len(ready) == 0:
+                    self._check_file()
+        finally:
+            os.close(fd)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._wake_fd = os.pipe()
+        super().start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop_event.set()
+            os.write(self._wake_fd[1], b'\0')
+            self._thread.join()
+            self._thread = None
+            os.close(self._wake_fd[0])
+            os.close(self._wake_fd[1])
+
+HALT_SIGNAL_BACKENDS = ['auto', 'flag', 'polling', 'inotify']
+
+def create_halt_signal(halt_file, backend='auto', poll_interval=None):
+    '''
+    Returns the halt signal for the given backend: 'flag' (in-process only), 'polling', 'inotify' or 'auto' (i.e. inotify if
+    available, otherwise polling). If poll_interval is None, the default of the backend is used.
+    '''
+    assert backend in HALT_SIGNAL_BACKENDS, f"The halt signal backend must be one of: {HALT_SIGNAL_BACKENDS}."
+    if backend == 'auto':
+        backend = 'inotify' if HaltSignalInotify.is_available() else 'polling'
+    if backend == 'flag':
+        return HaltSignal(halt_file)
+    kwargs = {} if poll_interval is None else {'poll_interval' : poll_interval}
+    if backend == 'inotify':
+        return HaltSignalInotify(halt_file, **kwargs)
+    return HaltSignalPolling(halt_file, **kwargs)
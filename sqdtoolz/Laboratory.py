@@ -3,34 +3,49 @@ from sqdtoolz.ExperimentConfiguration import*
 from sqdtoolz.Variable import*
 from sqdtoolz.ExperimentSpecification import*
 from sqdtoolz.HAL.HALbase import*
-from sqdtoolz.HAL.ACQ import*
-from sqdtoolz.HAL.AWG import*
-from sqdtoolz.HAL.DDG import*
-from sqdtoolz.HAL.GENmwSource import*
-from sqdtoolz.HAL.GENvoltSource import*
-from sqdtoolz.HAL.GENswitch import*
-from sqdtoolz.HAL.GENswitchTrig import*
-from sqdtoolz.HAL.ACQvna import*
-from sqdtoolz.HAL.GENatten import*
-from sqdtoolz.HAL.GENsmu import*
-from sqdtoolz.HAL.ZI.ZIQubit import ZIQubit
-from sqdtoolz.HAL.ZI.ZIACQ import ZIACQ
-from sqdtoolz.HAL.ZI.ZIQuantumElement import ZIQuantumElement   #TODO: Okay refactor this to be more automated...
-from sqdtoolz.HAL.SOFTqpu import SOFTqpu
-from sqdtoolz.HAL.Processors.ProcessorCPU import*
-try:
-    from sqdtoolz.HAL.Processors.ProcessorGPU import*
-except (ModuleNotFoundError, ImportError):
-    pass
-from sqdtoolz.HAL.Processors.ProcessorFPGA import*
+from sqdtoolz.HAL.WaveformTransformations import*
+from sqdtoolz.ClassRegistry import CLASS_MODULES, get_class
+import importlib
 from datetime import datetime
 from pathlib import Path
 import json
 import os
 import time
+import threading
 import numpy as np
 import sys
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from sqdtoolz.Utilities.FileJSON import SQDJSONEncoder, SerialiseJSON
+from sqdtoolz.Utilities.FileRunIndex import FileRunIndex
+from sqdtoolz.HaltSignal import create_halt_signal, HALT_SIGNAL_BACKENDS
+from sqdtoolz.HAL.LockableProperties import invalidate_write_caches
+from sqdtoolz.HAL.WaveformCache import WaveformCache
+
+#The HAL and processor classes are resolved lazily via ClassRegistry. These are the modules that used to be star-imported
+#here - they are only loaded for scripts that still rely on: from sqdtoolz.Laboratory import*
+_LEGACY_STAR_MODULES = ['sqdtoolz.HAL.ACQ', 'sqdtoolz.HAL.AWG', 'sqdtoolz.HAL.DDG', 'sqdtoolz.HAL.GENmwSource', 'sqdtoolz.HAL.GENvoltSource',
+                        'sqdtoolz.HAL.GENswitch', 'sqdtoolz.HAL.GENswitchTrig', 'sqdtoolz.HAL.ACQvna', 'sqdtoolz.HAL.GENatten', 'sqdtoolz.HAL.GENsmu',
+                        'sqdtoolz.HAL.ZI.ZIQubit', 'sqdtoolz.HAL.ZI.ZIACQ', 'sqdtoolz.HAL.ZI.ZIQuantumElement', 'sqdtoolz.HAL.SOFTqpu',
+                        'sqdtoolz.HAL.Processors.ProcessorCPU', 'sqdtoolz.HAL.Processors.ProcessorGPU', 'sqdtoolz.HAL.Processors.ProcessorFPGA']
+
+def _load_legacy_namespace():
+    cur_globals = globals()
+    for cur_module in _LEGACY_STAR_MODULES:
+        try:
+            cur_module = importlib.import_module(cur_module)
+        except (ModuleNotFoundError, ImportError):
+            continue    #e.g. ProcessorGPU without cupy
+        for cur_name, cur_obj in vars(cur_module).items():
+            if not cur_name.startswith('_'):
+                cur_globals.setdefault(cur_name, cur_obj)
+
+def __getattr__(name):
+    if name == '__all__':
+        _load_legacy_namespace()
+        return [x for x in globals() if not x.startswith('_')]
+    if name in CLASS_MODULES:
+        return get_class(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 class Laboratory:
     def __init__(self, instr_config_file, save_dir, using_VS_Code=False):
@@ -48,6 +63,7 @@ class Laboratory:
         self._group_dir = {'Dir':"", 'InitDir':"", 'SweepQueue':[], 'ExptIndex' : -1}
 
         Path(self._save_dir).mkdir(parents=True, exist_ok=True)
+        self._run_index = FileRunIndex(self._save_dir)
 
         self._using_VS_Code = using_VS_Code
         self._cur_message = ''
@@ -60,6 +76,27 @@ class Laboratory:
         self._waveform_transforms = {}
         self._activated_instruments = []
         self._update_state = True
+        #Debouncing of the state files written on every progress-bar ping (and the contents last written to said files)
+        self._update_state_interval = 1.0
+        self._update_state_pings = None
+        self._state_last_time = 0
+        self._state_num_pings = 0
+        self._state_file_contents = {}
+        #Cached snapshots of the QCoDeS instruments for instrument_configuration.txt
+        self._snapshot_cached = False
+        self._snapshot_max_age = None
+        self._snapshot_refresh_interval = 3600
+        self._snapshot_volatile = []
+        self._snapshot_last_full = None
+        self._snapshot_hal_configs = {}
+        #Kill-switch (i.e. halting experiments via HALT.txt in the save-directory or via halt())
+        self._halt_signal_backend = 'auto'
+        self._halt_signal_poll_interval = None
+        self._halt_signal = None
+        #Skipping of redundant HAL property writes when applying ExperimentConfigurations
+        self._hal_write_cache = False
+        #Memoised waveform segments shared by the AWG HALs
+        self._waveform_cache = WaveformCache()
 
     @property
     def UpdateStateEnabled(self):
@@ -68,6 +105,105 @@ class Laboratory:
     def UpdateStateEnabled(self, bool_val):
         self._update_state = bool_val
 
+    @property
+    def UpdateStateInterval(self):
+        #Minimum time (in seconds) between the state files being written during an experiment
+        return self._update_state_interval
+    @UpdateStateInterval.setter
+    def UpdateStateInterval(self, val):
+        assert val >= 0, "The state update interval must be a non-negative number of seconds."
+        self._update_state_interval = val
+
+    @property
+    def UpdateStatePings(self):
+        #If not None, the state files are also written after this many progress-bar pings (even within UpdateStateInterval)
+        return self._update_state_pings
+    @UpdateStatePings.setter
+    def UpdateStatePings(self, val):
+        assert val is None or (isinstance(val, int) and val > 0), "The number of pings between state updates must be a positive integer or None."
+        self._update_state_pings = val
+
+    @property
+    def InstrumentSnapshotCached(self):
+        #If True, instrument_configuration.txt only re-queries the instrument parameters that are stale (see _get_instrument_snapshot)
+        return self._snapshot_cached
+    @InstrumentSnapshotCached.setter
+    def InstrumentSnapshotCached(self, bool_val):
+        self._snapshot_cached = bool_val
+        self._snapshot_last_full = None
+
+    @property
+    def InstrumentSnapshotMaxAge(self):
+        #If not None, cached parameter values older than this many seconds are re-queried in cached snapshots
+        return self._snapshot_max_age
+    @InstrumentSnapshotMaxAge.setter
+    def InstrumentSnapshotMaxAge(self, val):
+        assert val is None or val >= 0, "The maximum age of cached parameter values must be a non-negative number of seconds or None."
+        self._snapshot_max_age = val
+
+    @property
+    def InstrumentSnapshotRefreshInterval(self):
+        #If not None, a full snapshot (i.e. querying every parameter) is taken if the last one is older than this many seconds
+        return self._snapshot_refresh_interval
+    @InstrumentSnapshotRefreshInterval.setter
+    def InstrumentSnapshotRefreshInterval(self, val):
+        assert val is None or val >= 0, "The full snapshot refresh interval must be a non-negative number of seconds or None."
+        self._snapshot_refresh_interval = val
+
+    @property
+    def InstrumentSnapshotVolatile(self):
+        #List of the full names of parameters (e.g. 'virMWS_CH1_power') or instruments/channels (e.g. 'virMWS_CH1') that are
+        #always re-queried in cached snapshots (e.g. read-back values such as temperatures or measured currents)
+        return self._snapshot_volatile[:]
+    @InstrumentSnapshotVolatile.setter
+    def InstrumentSnapshotVolatile(self, list_names):
+        assert isinstance(list_names, list), "The volatile parameters must be given as a list of full parameter or instrument names."
+        self._snapshot_volatile = list_names[:]
+
+    @property
+    def HaltSignalBackend(self):
+        #Backend used to detect HALT.txt: 'auto', 'flag' (only via halt()), 'polling' or 'inotify' (see sqdtoolz.HaltSignal)
+        return self._halt_signal_backend
+    @HaltSignalBackend.setter
+    def HaltSignalBackend(self, backend):
+        assert backend in HALT_SIGNAL_BACKENDS, f"The halt signal backend must be one of: {HALT_SIGNAL_BACKENDS}."
+        self._halt_signal_backend = backend
+        self._halt_signal = None
+
+    @property
+    def HaltSignalPollInterval(self):
+        #Time (in seconds) between checks for HALT.txt (i.e. the maximum halt latency when polling); None for the backend default
+        return self._halt_signal_poll_interval
+    @HaltSignalPollInterval.setter
+    def HaltSignalPollInterval(self, val):
+        assert val is None or val > 0, "The halt signal poll interval must be positive or None."
+        self._halt_signal_poll_interval = val
+        self._halt_signal = None
+
+    @property
+    def HALWriteCache(self):
+        #If True, applying an ExperimentConfiguration skips setting HAL properties to the values last written onto them
+        return self._hal_write_cache
+    @HALWriteCache.setter
+    def HALWriteCache(self, bool_val):
+        self._hal_write_cache = bool_val
+        invalidate_write_caches()
+
+    @property
+    def WaveformCache(self):
+        #Cache of the generated waveform segment arrays (see sqdtoolz.HAL.WaveformCache); set WaveformCache.MaxBytes = 0 to disable
+        return self._waveform_cache
+
+    def invalidate_HAL_write_caches(self):
+        #Forces the next ExperimentConfiguration applied to rewrite every HAL property (e.g. after changing instrument settings
+        #directly via the drivers or the front-panel)
+        invalidate_write_caches()
+
+    def halt(self):
+        #Halts the currently running experiment (e.g. when called from another thread); equivalent to creating HALT.txt
+        if self._halt_signal is not None:
+            self._halt_signal.trigger()
+
     def reload_yaml(self):
         #NOTE: This will update the snapshots and thus, change instrument state of already loaded instruments. But it is handy
         #to help load a new instrument into the QCoDeS station (when adding a new instrument in the YAML).
@@ -82,13 +218,35 @@ class Laboratory:
             return None
         return None
 
+    def _iter_last_run_dirs(self):
+        #Yields the run folders from the latest to the earliest (the run index is built if it does not exist, e.g. on old save-directories)
+        if not self._run_index.exists():
+            self._run_index.rebuild()
+        for cur_run in self._run_index.iter_runs_reversed():
+            yield cur_run['Path'][:-1]
+
+    def find_runs(self, name=None, start=None, end=None, status=None):
+        '''
+        Returns the list of runs in the save-directory as dictionaries with the keys: Time, Name, Path and Status (i.e.
+        'running', 'completed', 'halted' or 'failed'). The arguments are optional filters: the experiment name, the start
+        and end datetime objects and the status. See FileRunIndex.find_runs for details.
+        '''
+        if not self._run_index.exists():
+            self._run_index.rebuild()
+        return self._run_index.find_runs(name, start, end, status)
+
+    def rebuild_run_index(self):
+        #Rebuilds the index of runs by scanning the save-directory (e.g. if runs were added by older versions of SQDToolz)
+        return self._run_index.rebuild()
+
     def update_variables_from_last_expt(self, file_name = ''):
         if file_name == '':
-            #TODO: Stress test this with say 100000 directories
-            dirs = [x[0] for x in os.walk(self._save_dir)]  #Walk gives a tuple: (dirpath, dirnames, filenames)
-            cur_dir = dirs[-1].replace('\\','/')
-            if os.path.isfile(cur_dir + "/laboratory_parameters.txt"):
-                filepath = cur_dir + "/laboratory_parameters.txt"
+            filepath = None
+            for cur_dir in self._iter_last_run_dirs():
+                if os.path.isfile(cur_dir + "/laboratory_parameters.txt"):
+                    filepath = cur_dir + "/laboratory_parameters.txt"
+                    break
+            assert filepath is not None, "No previous experiment with a laboratory_parameters.txt file was found."
         else:
             filepath = file_name
         with open(filepath) as json_file:
@@ -98,7 +256,7 @@ class Laboratory:
                 if cur_key in self._variables.keys():
                     self._variables[cur_key]._set_current_config(cur_dict)
                 else:
-                    self._variables[cur_key] = globals()[cur_dict['Type']].fromConfigDict(cur_key, cur_dict, self)
+                    self._variables[cur_key] = get_class(cur_dict['Type']).fromConfigDict(cur_key, cur_dict, self)
 
     def cold_reload_last_configuration(self, folder_dir = ""):
         if folder_dir == "" and os.path.isfile(self._save_dir + "_last_state.txt") and os.path.isfile(self._save_dir + "_last_vars.txt") and os.path.isfile(self._save_dir + "_last_exp_configs.txt"):
@@ -115,11 +273,10 @@ class Laboratory:
             if folder_dir != "":
                 dirs = [folder_dir]
             else:
-                #Go through the directories in reverse chronological order (presuming data-stamped folders)
-                dirs = [x[0] for x in os.walk(self._save_dir)]  #Walk gives a tuple: (dirpath, dirnames, filenames)
-                dirs.sort()
+                #Go through the directories in reverse chronological order
+                dirs = self._iter_last_run_dirs()
 
-            for cur_cand_dir in dirs[::-1]:
+            for cur_cand_dir in dirs:
                 cur_dir = cur_cand_dir.replace('\\','/')
                 #Check current candidate directory has the required files
                 if not os.path.isfile(cur_dir + "/laboratory_configuration.txt"):
@@ -165,19 +322,19 @@ class Laboratory:
         for dict_cur_hal in config_dict['HALs']:
             self._print_message(f"Loading HAL: {dict_cur_hal['Name']}")
             cur_class_name = dict_cur_hal['Type']
-            globals()[cur_class_name].fromConfigDict(dict_cur_hal, self)
+            get_class(cur_class_name).fromConfigDict(dict_cur_hal, self)
             self._erase_line()
         #Create and load the PROCs
         for dict_cur_proc in config_dict['PROCs']:
             self._print_message(f"Loading PROC: {dict_cur_proc['Name']}")
             cur_class_name = dict_cur_proc['Type']
-            globals()[cur_class_name].fromConfigDict(dict_cur_proc, self)
+            get_class(cur_class_name).fromConfigDict(dict_cur_proc, self)
             self._erase_line()
         #Create and load the WFMTs
         for dict_cur_wfmt in config_dict['WFMTs']:
             self._print_message(f"Loading WFMT: {dict_cur_wfmt['Name']}")
             cur_class_name = dict_cur_wfmt['Type']
-            globals()[cur_class_name].fromConfigDict(dict_cur_wfmt, self)
+            get_class(cur_class_name).fromConfigDict(dict_cur_wfmt, self)
             self._erase_line()
         #Create and load the SPECs
         for dict_cur_spec in config_dict['SPECs']:
@@ -323,22 +480,190 @@ class Laboratory:
         self._station.add_component(instrObj)
         self._activated_instruments += [instrObj.name]
 
+    def _close_unregistered_instrument(self, instrID):
+        #Check if the instrument is in the station, but unregistered (i.e. it crashed during initialisation). If so, remove it...
+        #ALSO NOTE:
+        #   QCoDeS does this awful thing where it stores the instruments inside the Instrument class attribute - i.e. one cannot run
+        #   multiple QCoDeS instances at once in a given kernel! Anyway, it stores its own list of instruments that may not appear in
+        #   components if initialisation fails...
+        if instrID in qc.Instrument._all_instruments:
+            instr = qc.Instrument.find_instrument(instrID)
+            instr.close()
+
+    def _load_instrument_into_station(self, instrID):
+        self._close_unregistered_instrument(instrID)
+        self._station.load_instrument(instrID)
+        #The HAL properties last written may not reflect the state of the (re)loaded instrument
+        invalidate_write_caches()
+
+    def _build_instrument(self, instrID):
+        #Initialises the instrument (as described in the YAML, including its parameter options) in a private QCoDeS station so
+        #that the shared station is untouched until the instrument is registered via _register_instrument
+        build_station = qc.Station(config_file=self._station.config_file, default=False, use_monitor=False)
+        instr = build_station.load_instrument(instrID)
+        return instr, build_station._monitor_parameters
+
+    def _register_instrument(self, instr, monitor_params):
+        #The snapshot was already updated when building the instrument
+        self._station.add_component(instr, update_snapshot=False)
+        self._station._monitor_parameters += monitor_params
+        invalidate_write_caches()
+
     def load_instrument(self, instrID):
         # assert not (instrID in self._station.components), f"Instrument by the name {instrID} has already been loaded."
         if not (instrID in self._activated_instruments):
-            #Check if the instrument is in the station, but unregistered (i.e. it crashed during initialisation). If so, remove it...
-            #ALSO NOTE:
-            #   QCoDeS does this awful thing where it stores the instruments inside the Instrument class attribute - i.e. one cannot run
-            #   multiple QCoDeS instances at once in a given kernel! Anyway, it stores its own list of instruments that may not appear in
-            #   components if initialisation fails...
-            if instrID in qc.Instrument._all_instruments:
-                instr = qc.Instrument.find_instrument(instrID)
-                instr.close()
-            self._station.load_instrument(instrID)
+            self._load_instrument_into_station(instrID)
             self._activated_instruments += [instrID]
+
+    def _get_instrument_dependencies(self, instr_configs, dependencies):
+        #Dependencies are either given explicitly or implied by an init argument that names another instrument in the YAML
+        ret_deps = {}
+        for cur_instr in instr_configs:
+            cur_deps = set(dependencies.get(cur_instr, []))
+            cur_init = instr_configs[cur_instr].get('init', {})
+            if isinstance(cur_init, dict):
+                cur_deps |= set([x for x in cur_init.values() if isinstance(x, str) and x in instr_configs and x != cur_instr])
+            ret_deps[cur_instr] = cur_deps
+        return ret_deps
+
+    def load_instruments(self, instrIDs=None, max_workers=4, timeout=None, dependencies={}, print_report=True):
+        '''
+        Loads multiple instruments from the QCoDeS station YAML concurrently. An instrument is only loaded once all the instruments it
+        depends on have been loaded; its dependencies are loaded even if they are not listed in instrIDs.
+
+        Inputs:
+            - instrIDs     - List of the instruments to load. If None, every instrument in the station YAML is loaded.
+            - max_workers  - Maximum number of instruments that are initialised simultaneously.
+            - timeout      - If not None, the maximum time (in seconds) given to each instrument to initialise. An instrument that
+                             finishes initialising after its time-out is closed rather than loaded.
+            - dependencies - Dictionary mapping instrument names onto the list of instruments that must be loaded first. Note that
+                             an instrument is also taken to depend on any other instrument named as a value in its init arguments.
+            - print_report - If True, the initialisation time of every instrument is printed.
+
+        Returns a dictionary mapping every instrument considered onto a dictionary with the keys: 'Status' (one of 'loaded', 'already
+        loaded', 'failed', 'timeout' or 'skipped' if a dependency did not load), 'Time' (initialisation time in seconds) and 'Error'.
+        An AssertionError is raised (after the report) if any instrument did not load.
+        '''
+        assert self._instr_config_file != "", "A station YAML file must be given to the Laboratory to load instruments from it."
+        instr_configs = self._station.config['instruments']
+        if instrIDs is None:
+            instrIDs = list(instr_configs.keys())
+        for cur_instr in list(instrIDs) + list(dependencies.keys()):
+            assert cur_instr in instr_configs, f"Instrument by the name {cur_instr} is not in the station YAML."
+        all_deps = self._get_instrument_dependencies(instr_configs, dependencies)
+        for cur_instr in all_deps:
+            for cur_dep in all_deps[cur_instr]:
+                assert cur_dep in instr_configs, f"The dependency {cur_dep} of instrument {cur_instr} is not in the station YAML."
+        #Add the dependencies (recursively) to the instruments to load
+        to_load = []
+        pending = list(instrIDs)
+        while len(pending) > 0:
+            cur_instr = pending.pop(0)
+            if cur_instr not in to_load:
+                to_load += [cur_instr]
+                pending += list(all_deps[cur_instr])
+        deps = {x : all_deps[x] for x in to_load}
+        #Check for cyclic dependencies via a topological sort
+        ordered, rem_deps = set(), dict(deps)
+        while len(rem_deps) > 0:
+            cur_ready = [x for x in rem_deps if rem_deps[x] <= ordered]
+            assert len(cur_ready) > 0, f"The instruments {list(rem_deps.keys())} have cyclic dependencies."
+            for cur_instr in cur_ready:
+                ordered.add(cur_instr)
+                rem_deps.pop(cur_instr)
+
+        report = {x : {'Status' : 'pending', 'Time' : 0.0, 'Error' : ''} for x in to_load}
+        for cur_instr in to_load:
+            if cur_instr in self._activated_instruments:
+                report[cur_instr]['Status'] = 'already loaded'
+        #The workers only build the instruments; they are registered into the shared station on this thread. A worker that
+        #finishes after its time-out (i.e. once its state is 'abandoned') closes its instrument instead.
+        start_times = {}
+        worker_states = {}
+        reg_lock = threading.Lock()
+        def load_worker(instrID):
+            start_times[instrID] = time.time()
+            instr, monitor_params = self._build_instrument(instrID)
+            with reg_lock:
+                if worker_states[instrID] != 'abandoned':
+                    worker_states[instrID] = 'built'
+                    return instr, monitor_params, time.time() - start_times[instrID]
+            instr.close()
+            raise TimeoutError(f"Instrument {instrID} finished initialising after its time-out and was closed.")
+
+        t0 = time.time()
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        running = {}
+        try:
+            while True:
+                #Skip the instruments with failed dependencies and submit those with all dependencies loaded
+                for cur_instr in to_load:
+                    if report[cur_instr]['Status'] != 'pending':
+                        continue
+                    dep_states = [report[x]['Status'] for x in deps[cur_instr]]
+                    if any(x in ['failed', 'timeout', 'skipped'] for x in dep_states):
+                        report[cur_instr]['Status'] = 'skipped'
+                        report[cur_instr]['Error'] = 'A dependency did not load.'
+                    elif all(x in ['loaded', 'already loaded'] for x in dep_states):
+                        report[cur_instr]['Status'] = 'running'
+                        self._close_unregistered_instrument(cur_instr)
+                        worker_states[cur_instr] = 'running'
+                        running[executor.submit(load_worker, cur_instr)] = cur_instr
+                if len(running) == 0:
+                    if any(report[x]['Status'] == 'pending' for x in to_load):
+                        continue    #i.e. instruments that were just unblocked by skipped dependencies
+                    break
+                #Wait for the next instrument to finish (or for the next one to time out)
+                wait_time = None
+                if timeout is not None:
+                    cur_starts = [start_times[running[x]] for x in running if running[x] in start_times]
+                    wait_time = max(0.0, min(cur_starts) + timeout - time.time()) if len(cur_starts) > 0 else timeout
+                done, not_done = wait(list(running.keys()), timeout=wait_time, return_when=FIRST_COMPLETED)
+                for cur_future in done:
+                    cur_instr = running.pop(cur_future)
+                    try:
+                        instr, monitor_params, report[cur_instr]['Time'] = cur_future.result()
+                        with reg_lock:
+                            self._register_instrument(instr, monitor_params)
+                        report[cur_instr]['Status'] = 'loaded'
+                        self._activated_instruments += [cur_instr]
+                    except Exception as e:
+                        report[cur_instr]['Time'] = time.time() - start_times.get(cur_instr, t0)
+                        report[cur_instr]['Status'] = 'failed'
+                        report[cur_instr]['Error'] = f"{type(e).__name__}: {e}"
+                if timeout is not None:
+                    #A timed-out initialisation cannot be interrupted; its thread is just abandoned (unless it has just finished)
+                    for cur_future in list(running.keys()):
+                        cur_instr = running[cur_future]
+                        if cur_instr in start_times and time.time() - start_times[cur_instr] >= timeout:
+                            with reg_lock:
+                                if worker_states[cur_instr] == 'built':
+                                    continue
+                                worker_states[cur_instr] = 'abandoned'
+                            running.pop(cur_future)
+                            report[cur_instr]['Time'] = time.time() - start_times[cur_instr]
+                            report[cur_instr]['Status'] = 'timeout'
+                            report[cur_instr]['Error'] = f"Initialisation took longer than {timeout}s."
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        total_time = time.time() - t0
+
+        if print_report:
+            print(f"Loaded instruments in {total_time:.2f}s (sum of initialisation times: {sum([report[x]['Time'] for x in report]):.2f}s):")
+            for cur_instr in sorted(report.keys(), key=lambda x: -report[x]['Time']):
+                cur_line = f"\t{cur_instr:<20} {report[cur_instr]['Status']:<15} {report[cur_instr]['Time']:7.3f}s"
+                if report[cur_instr]['Error'] != '':
+                    cur_line += f"  ({report[cur_instr]['Error']})"
+                print(cur_line)
+        failed = [x for x in report if report[x]['Status'] in ['failed', 'timeout', 'skipped']]
+        assert len(failed) == 0, "Could not load the instruments: " + ", ".join([f"{x} ({report[x]['Status']}: {report[x]['Error']})" for x in failed])
+        return report
     
     def release_all_instruments(self):
         self._station.close_all_registered_instruments()
+        #Also stop the worker threads of the processors
+        for cur_proc in self._processors:
+            self._processors[cur_proc].release()
 
     def _get_instrument(self, instrID):
         if type(instrID) is list:
@@ -397,12 +722,8 @@ class Laboratory:
             if self._group_dir['InitDir'] == "":
                 self._group_dir['InitDir'] = datetime.now().strftime(f"%Y-%m-%d/%H%M%S-{self._group_dir['Dir']}/")
             folder_time_stamp = self._group_dir['InitDir'] + datetime.now().strftime(f"%H%M%S-" + expt_obj.Name + "/")
-        #Create the nested directory structure if it does not exist...
         cur_exp_path = self._save_dir + folder_time_stamp
-        Path(cur_exp_path).mkdir(parents=True, exist_ok=True)
 
-        #Reset kill-switch state
-        self._kill_switch_reset(cur_exp_path)
         kwargs['kill_signal'] = self._kill_switch_check
         kwargs['kill_signal_send'] = self._kill_signal_send_internal
 
@@ -432,47 +753,61 @@ class Laboratory:
             new_rec_params += [(new_rec_param[0], new_rec_param[1], cur_param_name)]
         kwargs['rec_params'] = new_rec_params
 
-        #Setup marker for running Experiment (mostly to notify the ExperimentViewer...)
-        exp_params = {'Configuration': expt_obj.ConfigName, 'SPECs': self.CONFIG(expt_obj.ConfigName).get_spec_names()}
-        expt_param_file = self._save_dir + '_cur_exp.json'
-        with open(expt_param_file, 'w') as outfile:
-            json.dump(exp_params, outfile, indent=4, cls=SQDJSONEncoder)
+        #Create the nested directory structure if it does not exist...
+        Path(cur_exp_path).mkdir(parents=True, exist_ok=True)
+
+        #The run is indexed as failed if anything raises from here on (e.g. in the experiment, post-processing or saving)
+        self._run_index.append(folder_time_stamp, expt_obj.Name, 'running')
+        try:
+            #Setup marker for running Experiment (mostly to notify the ExperimentViewer...)
+            exp_params = {'Configuration': expt_obj.ConfigName, 'SPECs': self.CONFIG(expt_obj.ConfigName).get_spec_names()}
+            expt_param_file = self._save_dir + '_cur_exp.json'
+            with open(expt_param_file, 'w') as outfile:
+                json.dump(exp_params, outfile, indent=4, cls=SQDJSONEncoder)
 
-        ret_vals = expt_obj._run(cur_exp_path, sweep_vars, ping_iteration=self._update_progress_bar, **kwargs)
-        self._group_dir['ExptIndex'] += 1
+            #Reset kill-switch state (i.e. starts watching for HALT.txt)
+            self._kill_switch_reset(cur_exp_path)
+            try:
+                ret_vals = expt_obj._run(cur_exp_path, sweep_vars, ping_iteration=self._update_progress_bar, **kwargs)
+            finally:
+                self._halt_signal.stop()
+            self._group_dir['ExptIndex'] += 1
 
-        #Save the experiment configuration
-        self.save_experiment_configs(cur_exp_path)
-        #Save experiment-specific experiment-configuration data (i.e. timing diagram)
-        expt_obj.save_config(cur_exp_path, 'timing_diagram', 'experiment_parameters.txt', self._group_dir['SweepQueue'], self._group_dir['ExptIndex'])
+            #Save the experiment configuration
+            self.save_experiment_configs(cur_exp_path)
+            #Save experiment-specific experiment-configuration data (i.e. timing diagram)
+            expt_obj.save_config(cur_exp_path, 'timing_diagram', 'experiment_parameters.txt', self._group_dir['SweepQueue'], self._group_dir['ExptIndex'])
 
-        #Run postprocessing if the experiment completed
-        if not self._killed_expt:
-            expt_obj._post_process(ret_vals)
+            #Run postprocessing if the experiment completed
+            if not self._killed_expt:
+                expt_obj._post_process(ret_vals)
         
-        #Save instrument configurations (QCoDeS)
-        self._save_instrument_config(cur_exp_path)
-        #Save Laboratory Configuration
-        self.save_laboratory_config(cur_exp_path)
+            #Save Laboratory Configuration
+            lab_config = self.save_laboratory_config(cur_exp_path)
+            #Save instrument configurations (QCoDeS)
+            self._save_instrument_config(cur_exp_path, lab_config['HALs'])
         
-        #Save Laboratory Parameters
-        self.save_variables(cur_exp_path)
+            #Save Laboratory Parameters
+            self.save_variables(cur_exp_path)
 
-        #Delete the currently running experiment parameters file...
-        if os.path.exists(expt_param_file):
-            os.remove(expt_param_file)
+            #Delete the currently running experiment parameters file...
+            if os.path.exists(expt_param_file):
+                os.remove(expt_param_file)
 
+            self._run_index.append(folder_time_stamp, expt_obj.Name, 'halted' if self._killed_expt else 'completed')
+        except BaseException:
+            self._run_index.append(folder_time_stamp, expt_obj.Name, 'failed')
+            raise
         self.update_state()
         return ret_vals
 
-    def save_variables(self, cur_exp_path = '', file_name = 'laboratory_parameters.txt'):
+    def _get_variables_str(self):
         param_dict = {k:v._get_current_config() for (k,v) in self._variables.items()}
+        return '{\n' + ',\n'.join(f"\"{x}\" : {json.dumps(param_dict[x], cls=SQDJSONEncoder)}" for x in param_dict.keys()) + '\n}\n'
+
+    def save_variables(self, cur_exp_path = '', file_name = 'laboratory_parameters.txt'):
         with open(cur_exp_path + file_name, 'w') as outfile:
-            # json.dump(param_dict, outfile)
-            outfile.write(
-                '{\n' +
-                ',\n'.join(f"\"{x}\" : {json.dumps(param_dict[x], cls=SQDJSONEncoder)}" for x in param_dict.keys()) +
-                '\n}\n')
+            outfile.write(self._get_variables_str())
 
     def save_experiment_configs(self, cur_exp_path, file_name = 'experiment_configurations.txt'):
         dict_expt_configs = {x : self._expt_configs[x].get_config() for x in self._expt_configs}
@@ -512,7 +847,72 @@ class Laboratory:
                 json.dump(param_dict, outfile, indent=4, cls=SQDJSONEncoder)
         return param_dict
 
-    def _save_instrument_config(self, cur_exp_path):
+    def _iter_instrument_parameters(self, instr_obj, prefix_volatile=False, visited=None):
+        #Yields (parameter, is_volatile) for all parameters in an instrument and its submodules (channels etc.)
+        if visited is None:
+            visited = set()
+        if id(instr_obj) in visited:
+            return
+        visited.add(id(instr_obj))
+        is_volatile = prefix_volatile or getattr(instr_obj, 'full_name', None) in self._snapshot_volatile
+        for cur_param in getattr(instr_obj, 'parameters', {}).values():
+            yield cur_param, is_volatile or cur_param.full_name in self._snapshot_volatile
+        for cur_submodule in getattr(instr_obj, 'submodules', {}).values():
+            yield from self._iter_instrument_parameters(cur_submodule, is_volatile, visited)
+
+    def _get_hal_instruments(self, cur_config):
+        #Returns the names of the loaded instruments referenced in a HAL configuration dictionary
+        ret_instrs = set()
+        if isinstance(cur_config, str):
+            if cur_config in self._station.components:
+                ret_instrs.add(cur_config)
+        elif isinstance(cur_config, dict):
+            for cur_val in cur_config.values():
+                ret_instrs |= self._get_hal_instruments(cur_val)
+        elif isinstance(cur_config, (list, tuple)):
+            for cur_val in cur_config:
+                ret_instrs |= self._get_hal_instruments(cur_val)
+        return ret_instrs
+
+    def _get_instrument_snapshot(self, hal_configs=None):
+        '''
+        Returns the QCoDeS station snapshot. If InstrumentSnapshotCached is False, every parameter is queried. Otherwise, the cached
+        parameter values (i.e. the values last set or read via QCoDeS) are used and only the following parameters are re-queried:
+            - Parameters that have never been read/set (i.e. invalid cache) or whose cached values are older than InstrumentSnapshotMaxAge.
+            - Parameters (or instruments/channels) flagged in InstrumentSnapshotVolatile.
+            - All parameters of instruments used by HALs whose configuration changed since the last snapshot (i.e. in case the
+              HAL writes bypass the QCoDeS parameters).
+        A full snapshot is still taken on the first call and if the last full snapshot is older than InstrumentSnapshotRefreshInterval.
+        '''
+        if hal_configs is None:
+            hal_configs = self.save_laboratory_config('')['HALs']
+        cur_hal_configs = {x['Name'] : json.dumps(x, sort_keys=True, cls=SQDJSONEncoder) for x in hal_configs}
+        cur_time = time.time()
+        if not self._snapshot_cached or self._snapshot_last_full is None or (self._snapshot_refresh_interval is not None and cur_time - self._snapshot_last_full >= self._snapshot_refresh_interval):
+            self._snapshot_last_full = cur_time
+            self._snapshot_hal_configs = cur_hal_configs
+            return self._station.snapshot_base(update=True)
+
+        dirty_instrs = set()
+        for cur_hal in hal_configs:
+            if self._snapshot_hal_configs.get(cur_hal['Name'], None) != cur_hal_configs[cur_hal['Name']]:
+                dirty_instrs |= self._get_hal_instruments(cur_hal)
+        self._snapshot_hal_configs = cur_hal_configs
+        for cur_name, cur_instr in self._station.components.items():
+            if not isinstance(cur_instr, qc.Instrument) or not qc.Instrument.is_valid(cur_instr):
+                continue
+            for cur_param, is_volatile in self._iter_instrument_parameters(cur_instr, cur_name in dirty_instrs):
+                if cur_param.snapshot_exclude or not cur_param.gettable or not cur_param._snapshot_get or not cur_param.snapshot_value:
+                    continue
+                cur_ts = cur_param.cache.timestamp
+                if is_volatile or not cur_param.cache.valid or cur_ts is None or (self._snapshot_max_age is not None and cur_time - cur_ts.timestamp() > self._snapshot_max_age):
+                    try:
+                        cur_param.get()
+                    except Exception:
+                        pass    #QCoDeS also just logs the parameters that fail to update in a snapshot
+        return self._station.snapshot_base(update=False)
+
+    def _save_instrument_config(self, cur_exp_path, hal_configs=None):
         #Sometimes the configuration parameters use byte-values; those bytes need to be converted into strings
         #Code taken from: https://stackoverflow.com/questions/57014259/json-dumps-on-dictionary-with-bytes-for-keys
         def decode_dict(d):
@@ -527,7 +927,7 @@ class Laboratory:
                 result.update({key: value})
             return result
         with open(cur_exp_path + 'instrument_configuration.txt', 'w') as outfile:
-            raw_snapshot = self._station.snapshot_base()
+            raw_snapshot = self._get_instrument_snapshot(hal_configs)
             json.dump(decode_dict(raw_snapshot), outfile, indent=4, cls=SQDJSONEncoder)
 
 
@@ -564,11 +964,39 @@ class Laboratory:
             print()
         return ret_str
 
-    def update_state(self):
+    def _write_state_file(self, file_name, contents):
+        #Only rewrites the file if its contents changed. The write is atomic (via a temporary file) so that readers like the
+        #ExperimentViewer never see a partially written file.
+        file_path = self._save_dir + file_name
+        if self._state_file_contents.get(file_name, None) == contents and os.path.isfile(file_path):
+            return
+        temp_path = file_path + '.tmp'
+        with open(temp_path, 'w') as outfile:
+            outfile.write(contents)
+        try:
+            os.replace(temp_path, file_path)
+        except PermissionError:
+            #On Windows, the replacement fails if another process has the file open - so just overwrite it instead
+            with open(file_path, 'w') as outfile:
+                outfile.write(contents)
+            os.remove(temp_path)
+        self._state_file_contents[file_name] = contents
+
+    def update_state(self, force=True):
+        #If not forced (e.g. on the progress-bar pings), the update is skipped if it is within UpdateStateInterval seconds and
+        #UpdateStatePings pings of the last update.
+        self._state_num_pings += 1
+        cur_time = time.time()
+        if not force and cur_time - self._state_last_time < self._update_state_interval and (self._update_state_pings is None or self._state_num_pings < self._update_state_pings):
+            return
+        self._state_last_time = cur_time
+        self._state_num_pings = 0
         if self.UpdateStateEnabled:
-            self.save_laboratory_config(self._save_dir, '_last_state.txt')
-            self.save_variables(self._save_dir, '_last_vars.txt')
-        self.save_experiment_configs(self._save_dir, '_last_exp_configs.txt')   #This is just a JSON transfer...
+            self._write_state_file('_last_state.txt', json.dumps(self.save_laboratory_config(''), indent=4, cls=SQDJSONEncoder))
+            self._write_state_file('_last_vars.txt', self._get_variables_str())
+        dict_expt_configs = {x : self._expt_configs[x].get_config() for x in self._expt_configs}
+        self._write_state_file('_last_exp_configs.txt', json.dumps(dict_expt_configs, indent=4, cls=SQDJSONEncoder))   #This is just a JSON transfer...
+
     def open_browser(self):
         cur_dir = os.path.dirname(os.path.realpath(__file__)).replace('\\','/')
         drive = cur_dir[0:2]
@@ -579,16 +1007,17 @@ class Laboratory:
     def _kill_signal_send_internal(self):
         self._kill_internal = True
     def _kill_switch_reset(self, cur_exp_path):
-        halt_loc = self._save_dir + 'HALT.txt'
-        if os.path.exists(halt_loc):
-            os.remove(halt_loc)
+        if self._halt_signal is None:
+            self._halt_signal = create_halt_signal(self._save_dir + 'HALT.txt', self._halt_signal_backend, self._halt_signal_poll_interval)
+        #Removes any previous HALT.txt and starts watching for a new one
+        self._halt_signal.start()
         self._kill_switch_dir = cur_exp_path
         self._killed_expt = False
         self._kill_internal = False
     def _kill_switch_check(self):
-        halt_loc = self._save_dir + 'HALT.txt'
-        if os.path.exists(halt_loc):
-            os.remove(halt_loc)
+        #Only a memory read as the halt signal watches for HALT.txt in the background
+        if self._halt_signal.is_set():
+            self._halt_signal.clear()
             #Notify the experiment directory of the halting...
             open(self._kill_switch_dir + 'EXPERIMENT MANUALLY HALTED.txt', 'a').close()
             self._killed_expt = True
@@ -651,4 +1080,4 @@ class Laboratory:
         self._prog_bar_str = self._printProgressBar(int(val_pct*100), 100, suffix=f"{total_time}, {time_left}", prev_str=self._prog_bar_str, printEnd = prog_bar_char, using_vs_code=self._using_VS_Code)
 
         #Use the progress-bar ping as an opportunity to dump the current state of the instruments if update is enabled...
-        self.update_state()
+        self.update_state(force=False)
@@ -4,6 +4,11 @@ os.environ["HDF5_USE_FILE_LOCKING"] = "FALSE"
 import h5py
 import os.path
 import json
+import time
+import sqlite3
+import hashlib
+import threading
+import weakref
 from h5py._hl.files import File
 import numpy as np
 import itertools
@@ -11,6 +16,10 @@ try:
     import xarray as xr
 except (ModuleNotFoundError, ImportError):
     pass
+try:
+    import hdf5plugin   #Optional - provides the blosc and lz4 filters
+except (ModuleNotFoundError, ImportError):
+    hdf5plugin = None
 
 from datetime import datetime
 
@@ -21,13 +30,92 @@ from numpy.core.fromnumeric import argsort
 from sqdtoolz.Variable import VariableBase, VariableInternalTransient
 
 class FileIOWriter:
+    #Storage layouts (the version is stored in the root attribute 'format_version'; files without it are version 1)
+    LAYOUT_VERSIONS = {'monolithic' : 1, 'channels' : 2}
+    CHUNK_TARGET_BYTES = 1024*1024
+    CHUNK_MIN_BYTES = 16*1024
+    #Time-stamp formats: 'string' (datetime strings per row), 'ns' (int64 nanoseconds per row) or 'ns_packet' (int64 nanoseconds per data packet)
+    TIMESTAMP_FORMATS = ['string', 'ns', 'ns_packet']
+    #Open writers (by absolute file path) so that readers in this process can flush their buffers before reading
+    _open_writers = weakref.WeakValueDictionary()
+
     def __init__(self, filepath, **kwargs):
         self._filepath = filepath
         self._hf = None
         self._data_array_shape = None
         self.store_timestamps = kwargs.get('store_timestamps', True)
+        self._ts_format = kwargs.get('timestamp_format', 'string')
+        assert self._ts_format in FileIOWriter.TIMESTAMP_FORMATS, f"The time-stamp format must be one of: {FileIOWriter.TIMESTAMP_FORMATS}."
         self._create_reverse_channels = kwargs.get('add_reverse_channels', False)
         self._reverse_channel_suffix = kwargs.get('reverse_channel_suffix', '_reverse')
+        #Storage layout: 'monolithic' (one 2D dataset 'data' of rows x channels) or 'channels' (one chunked 1D dataset per channel)
+        self._layout = kwargs.get('layout', 'monolithic')
+        assert self._layout in FileIOWriter.LAYOUT_VERSIONS, f"The storage layout must be one of: {list(FileIOWriter.LAYOUT_VERSIONS.keys())}."
+        self._filter_opts = FileIOWriter._get_filter_options(kwargs.get('compression', 'gzip'), kwargs.get('compression_opts', None), kwargs.get('shuffle', False))
+        #Write-behind buffer: flushed once buffer_packets are held (None for no limit) or buffer_time seconds after the oldest
+        #buffered packet was pushed (None for no limit; enforced via a timer) - and always on query_data, flush, close and when
+        #a FileIOReader in this process reads the file. buffer_packets = 1 is write-through.
+        self._buffer_packets = kwargs.get('buffer_packets', 1)
+        self._buffer_time = kwargs.get('buffer_time', None)
+        assert self._buffer_packets == None or (isinstance(self._buffer_packets, int) and self._buffer_packets > 0), "The argument buffer_packets must be a positive integer or None."
+        assert self._buffer_time == None or self._buffer_time >= 0, "The argument buffer_time must be a non-negative number of seconds or None."
+        self._buffer = []
+        self._flush_timer = None
+        #Guards the buffer and file against the flush timer and readers on other threads
+        self._lock = threading.RLock()
+        FileIOWriter._open_writers[os.path.abspath(filepath)] = self
+
+    @staticmethod
+    def flush_file(filepath):
+        #Writes out the buffer of the writer (if any) in this process that has the given file open
+        cur_writer = FileIOWriter._open_writers.get(os.path.abspath(filepath), None)
+        if cur_writer is not None:
+            cur_writer.flush()
+
+    @staticmethod
+    def _get_filter_options(compression, compression_opts, shuffle):
+        #Returns the keyword arguments passed onto h5py's create_dataset
+        if compression in [None, 'none']:
+            ret_opts = {}
+        elif compression in ['gzip', 'lzf']:
+            ret_opts = {'compression' : compression}
+            if compression_opts != None:
+                assert compression == 'gzip', "The LZF filter does not take any compression options."
+                ret_opts['compression_opts'] = compression_opts
+        elif compression in ['blosc', 'lz4']:
+            assert hdf5plugin != None, f"The package hdf5plugin must be installed to use the {compression} filter."
+            if compression == 'blosc':
+                ret_opts = dict(hdf5plugin.Blosc(cname='lz4', clevel=5 if compression_opts == None else compression_opts, shuffle=hdf5plugin.Blosc.SHUFFLE if shuffle else hdf5plugin.Blosc.NOSHUFFLE))
+                shuffle = False     #Blosc does its own shuffling
+            else:
+                ret_opts = dict(hdf5plugin.LZ4())
+        else:
+            assert False, f"The compression filter {compression} is not supported. Use: None, 'gzip', 'lzf', 'blosc' or 'lz4'."
+        if shuffle:
+            ret_opts['shuffle'] = True
+        return ret_opts
+
+    def _get_chunk_rows(self, arr_size, num_sweep_dims):
+        #Chunks are aligned to the data packets so that every packet write fills whole chunks (partially written chunks are
+        #recompressed and rewritten on every write). Small packets are grouped up to the size of the inner-most sweep, while
+        #large packets are split evenly into chunks no larger than CHUNK_TARGET_BYTES.
+        elems_target = max(1, FileIOWriter.CHUNK_TARGET_BYTES // 8)
+        elems_min = max(1, FileIOWriter.CHUNK_MIN_BYTES // 8)
+        pkt_size = int(self._datapkt_size)
+        if pkt_size > elems_target:
+            chunk_rows = elems_target
+            for num_splits in range(int(np.ceil(pkt_size / elems_target)), 4*int(np.ceil(pkt_size / elems_target))+1):
+                if pkt_size % num_splits == 0:
+                    chunk_rows = pkt_size // num_splits
+                    break
+        elif pkt_size < elems_min:
+            num_pkts = int(np.ceil(elems_min / pkt_size))
+            if num_sweep_dims > 0:
+                num_pkts = min(num_pkts, self._data_array_shape[num_sweep_dims-1])
+            chunk_rows = num_pkts * pkt_size
+        else:
+            chunk_rows = pkt_size
+        return int(max(1, min(chunk_rows, arr_size)))
 
     def _get_dataset_sizes(self, sweep_vars, data_pkt):
         random_dataset = next(iter(data_pkt['data'].values()))
@@ -92,15 +180,27 @@ class FileIOWriter:
 
                 arr_size = int(np.prod(np.array(self._data_array_shape, dtype=np.int64)))
                 self._num_cols = len(self._meas_chs)
-                arr = np.zeros((arr_size, self._num_cols))
-                arr[:] = np.nan
+                self._hf.attrs['format_version'] = FileIOWriter.LAYOUT_VERSIONS[self._layout]
+                #The unwritten entries read as NaN via the fill-value (rather than explicitly writing NaNs into the whole array)
                 #TODO: Change this if allowing resizing on other sweeping axes...
-                max_shape = list(arr.shape)
-                max_shape[0] = None
-                self._dset = self._hf.create_dataset("data", data=arr, compression="gzip", maxshape=max_shape)
+                if self._layout == 'channels':
+                    chunk_rows = self._get_chunk_rows(arr_size, len(sweep_vars))
+                    grp_data = self._hf.create_group('data')
+                    self._dsets = [grp_data.create_dataset(cur_meas_ch, shape=(arr_size,), dtype=np.float64, fillvalue=np.nan,
+                                                           chunks=(chunk_rows,), maxshape=(None,), **self._filter_opts) for cur_meas_ch in self._meas_chs]
+                else:
+                    self._dset = self._hf.create_dataset("data", shape=(arr_size, self._num_cols), dtype=np.float64, fillvalue=np.nan,
+                                                         maxshape=(None, self._num_cols), **self._filter_opts)
                 self._dset_ind = 0
-                #Time-stamps (usually length 27 bytes)
-                if self.store_timestamps:
+                if self.store_timestamps and self._ts_format != 'string':
+                    #Time-stamps as int64 nanoseconds since the epoch (unwritten entries read as NaT via the fill-value)
+                    ts_rows = self._datapkt_size if self._ts_format == 'ns_packet' else 1
+                    self._dsetTS = self._hf.create_dataset("timeStamps", shape=(arr_size // ts_rows,), dtype=np.int64, fillvalue=np.datetime64('NaT','ns').astype(np.int64),
+                                                           maxshape=(None,), **self._filter_opts)
+                    self._dsetTS.attrs['units'] = 'ns'
+                    self._dsetTS.attrs['rows_per_stamp'] = ts_rows
+                elif self.store_timestamps:
+                    #Time-stamps (usually length 27 bytes)
                     self._ts_len = len( np.datetime_as_string(np.datetime64(datetime.now()),timezone='UTC').encode('utf-8') )
                     arr = np.array([np.datetime64()]*arr_size, dtype=f'S{self._ts_len}')
                     #TODO: Change this if allowing resizing on other sweeping axes...
@@ -110,25 +210,44 @@ class FileIOWriter:
                 
                 self._hf.swmr_mode = True
 
+    @property
+    def _num_rows(self):
+        if self._layout == 'channels':
+            return self._dsets[0].shape[0]
+        return self._dset.shape[0]
+
+    def _flush_datasets(self):
+        if self._layout == 'channels':
+            for cur_dset in self._dsets:
+                cur_dset.flush()
+        else:
+            self._dset.flush()
+
     def push_datapkt(self, data_pkt, sweep_vars, sweepEx = {}, dset_ind = -1):
+        with self._lock:
+            self._push_datapkt(data_pkt, sweep_vars, sweepEx, dset_ind)
+
+    def _push_datapkt(self, data_pkt, sweep_vars, sweepEx, dset_ind):
         self._init_hdf5(sweep_vars, data_pkt, sweepEx)
 
-        cur_shape = self._dset.shape
         leSize, params, leShape = self._get_dataset_sizes(sweep_vars, data_pkt)
         proposed_arr_size = int(np.prod(leShape))
-        if proposed_arr_size > cur_shape[0]:
+        if proposed_arr_size > self._num_rows:
             assert len(sweepEx) == 0, "Many-one sweeps are not supported with array resizing at the moment."
             if len(sweep_vars) > 1:
                 for m, cur_sweep_var in enumerate(sweep_vars[1:]):
                     assert cur_sweep_var[1].size == self._data_array_shape[m+1], "Array resizing is only supported for the left-most sweeping variable for now."
-            self._dset.resize( (proposed_arr_size, self._num_cols) )
+            if self._layout == 'channels':
+                for cur_dset in self._dsets:
+                    cur_dset.resize( (proposed_arr_size,) )
+            else:
+                self._dset.resize( (proposed_arr_size, self._num_cols) )
             #
             self._hf['parameters'][sweep_vars[0][0].Name].resize((sweep_vars[0][1].size+1,))
             self._hf['parameters'][sweep_vars[0][0].Name][1:] = sweep_vars[0][1]    #TODO: Can optimise by not writing previous values here?
             #
             if self.store_timestamps:
-                ts_shape = self._dsetTS.shape
-                self._dsetTS.resize((proposed_arr_size,))
+                self._dsetTS.resize((proposed_arr_size // self._dsetTS.attrs.get('rows_per_stamp', 1),))
 
         if dset_ind >= 0:
             cur_dset_ind = dset_ind
@@ -137,21 +256,82 @@ class FileIOWriter:
         #
         #Doing the columns individually - e.g. as required when using reverse for example as only some channels get filled/populated at a time...
         for x in data_pkt['data']:
-            cur_data = data_pkt['data'][x].flatten()
             assert x in self._meas_chs, f"The channel {x} was not present when initialising the FileIOWriter object. Cannot write this data as the storage has not been properly initialised."
-            self._dset[cur_dset_ind*self._datapkt_size : (cur_dset_ind+1)*self._datapkt_size, self._meas_chs.index(x)] = cur_data
-        #
         if self.store_timestamps:
             #TODO: When reverse-sweeping, the time-stamps are just overwritten as they don't go to the granularity of dependent variables? Fix this with some changes?
-            #Trick taken from here: https://stackoverflow.com/questions/68443753/datetime-storing-in-hd5-database
-            utc_strs = np.repeat(np.datetime_as_string(np.datetime64(datetime.now()),timezone='UTC').encode('utf-8'), cur_data.shape[0])
-            self._dsetTS[cur_dset_ind*self._datapkt_size : (cur_dset_ind+1)*self._datapkt_size] = utc_strs
-            self._dsetTS.flush()
+            if self._ts_format == 'string':
+                cur_ts = np.datetime_as_string(np.datetime64(datetime.now()),timezone='UTC').encode('utf-8')
+            else:
+                cur_ts = np.datetime64(datetime.now(), 'ns').astype(np.int64)
+        else:
+            cur_ts = None
+        if self._buffer_packets == 1:
+            #Write-through (ravel does not copy contiguous arrays as the data is written immediately)
+            self._write_packets(cur_dset_ind, 1, {x : np.ravel(data_pkt['data'][x]) for x in data_pkt['data']}, [cur_ts])
+            self._flush_datasets()
+        else:
+            #The buffer must hold copies as the caller may reuse the arrays in the data packet
+            self._buffer.append((cur_dset_ind, {x : data_pkt['data'][x].flatten() for x in data_pkt['data']}, cur_ts))
+            if self._buffer_packets != None and len(self._buffer) >= self._buffer_packets:
+                self.flush()
+            elif self._buffer_time != None and self._flush_timer is None:
+                #The timer flushes the buffer even if no further packets are pushed (e.g. during a slow acquisition)
+                self._flush_timer = threading.Timer(self._buffer_time, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
         self._dset_ind += 1
-        self._dset.flush()
-    
+
+    def _write_packets(self, start_ind, num_pkts, ch_data, time_stamps):
+        #Writes num_pkts consecutive data packets (starting at packet index start_ind) as one contiguous hyperslab per channel
+        row_start, row_end = start_ind*self._datapkt_size, (start_ind+num_pkts)*self._datapkt_size
+        for x in ch_data:
+            if self._layout == 'channels':
+                self._dsets[self._meas_chs.index(x)][row_start:row_end] = ch_data[x]
+            else:
+                self._dset[row_start:row_end, self._meas_chs.index(x)] = ch_data[x]
+        if self.store_timestamps:
+            if self._ts_format == 'ns_packet':
+                self._dsetTS[start_ind:start_ind+num_pkts] = np.array(time_stamps, dtype=np.int64)
+            else:
+                #Trick taken from here: https://stackoverflow.com/questions/68443753/datetime-storing-in-hd5-database
+                self._dsetTS[row_start:row_end] = np.repeat(np.array(time_stamps), self._datapkt_size)
+            self._dsetTS.flush()
+
+    def flush(self):
+        #Writes out all buffered data packets (coalescing runs of consecutive packet indices) and flushes the HDF5 file
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if self._hf == None or len(self._buffer) == 0:
+                return
+            self._write_buffer()
+
+    def _write_buffer(self):
+        runs = []
+        for cur_ind, cur_data, cur_ts in self._buffer:
+            if len(runs) > 0 and runs[-1][0] + len(runs[-1][2]) == cur_ind and runs[-1][1][0].keys() == cur_data.keys():
+                runs[-1][1].append(cur_data)
+                runs[-1][2].append(cur_ts)
+            else:
+                runs.append((cur_ind, [cur_data], [cur_ts]))
+        #The runs are written in the order they were pushed so that rewriting a packet index keeps the last value
+        for start_ind, cur_datas, cur_tss in runs:
+            if len(cur_datas) == 1:
+                ch_data = cur_datas[0]
+            else:
+                ch_data = {x : np.concatenate([y[x] for y in cur_datas]) for x in cur_datas[0]}
+            self._write_packets(start_ind, len(cur_datas), ch_data, cur_tss)
+        self._buffer = []
+        self._flush_datasets()
+
     def query_data(self, slice_indices):
         #Given as a LIST of arrays
+        with self._lock:
+            self.flush()
+            return self._query_data(slice_indices)
+
+    def _query_data(self, slice_indices):
         assert len(slice_indices) <= len(self._data_array_shape), f"Number of slice indices {len(slice_indices)} must correspond to shape of stored array {len(self._data_array_shape)}"
         #Pad out remaining indices as [:]...
         if len(slice_indices) < len(self._data_array_shape):
@@ -172,15 +352,22 @@ class FileIOWriter:
 
         #data_inds = np.ravel_multi_index(slice_indices, self._data_array_shape)
         data_inds = np.sort(data_inds)
-        ret_data = self._dset[data_inds]    #Second index = #columns or #dep_params
+        if self._layout == 'channels':
+            ret_data = np.stack([cur_dset[data_inds] for cur_dset in self._dsets], axis=-1)
+        else:
+            ret_data = self._dset[data_inds]    #Second index = #columns or #dep_params
         return ret_data.reshape(tuple([np.array(x).size for x in slice_indices]+[ret_data.shape[1]]))
 
     def close(self):
-        if self._hf:
-            self._hf.close()
-            self._hf = None
-            self._data_array_shape = None
-            self._meas_chs = []
+        with self._lock:
+            if self._hf:
+                self.flush()
+                self._hf.close()
+                self._hf = None
+                self._data_array_shape = None
+                self._meas_chs = []
+            if FileIOWriter._open_writers.get(os.path.abspath(self._filepath), None) is self:
+                del FileIOWriter._open_writers[os.path.abspath(self._filepath)]
 
     @staticmethod
     def write_file_direct(filepath, data_array, param_names, param_vals, dep_param_names, **kwargs):
@@ -235,11 +422,138 @@ class FileIODatalogger:
             self._filewriter.close()
         self._filewriter = None
 
+class FileIOLazyArray:
+    '''
+    Lazy view of the data in a FileIOReader. It has the same shape as the array returned by get_numpy_array (i.e. the
+    sweeping/slicing parameters followed by the output channels), but only reads the rows spanned by the selection. Note
+    that lists/arrays of indices are applied independently along each dimension (i.e. like xarray/h5py rather than numpy).
+
+    Inputs:
+        - reader - FileIOReader object holding the opened data file.
+    '''
+    #Gaps of up to this many unselected rows between selected rows are read (and discarded) rather than being split into separate reads
+    MAX_ROW_GAP = 1024
+
+    def __init__(self, reader):
+        self._reader = reader
+        self.shape = tuple([len(x) for x in reader.param_vals] + [len(reader.dep_params)])
+        self.dtype = np.dtype(np.float64)
+        self.ndim = len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _get_dim_indices(self, key):
+        #Returns an index array for every dimension along with the dimensions that are dropped (i.e. indexed by an integer)
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(x is Ellipsis for x in key):
+            ind = [x is Ellipsis for x in key].index(True)
+            key = key[:ind] + (slice(None),)*(self.ndim - len(key) + 1) + key[ind+1:]
+        assert len(key) <= self.ndim, f"There are {len(key)} indices given for an array of {self.ndim} dimensions."
+        key = key + (slice(None),)*(self.ndim - len(key))
+        dim_inds, drop_dims = [], []
+        for m, cur_key in enumerate(key):
+            if isinstance(cur_key, slice):
+                cur_inds = np.arange(self.shape[m])[cur_key]
+            elif np.isscalar(cur_key):
+                assert -self.shape[m] <= int(cur_key) < self.shape[m], f"Index {cur_key} is out of bounds for dimension {m} of size {self.shape[m]}."
+                cur_inds = np.array([int(cur_key) % self.shape[m]])
+                drop_dims.append(m)
+            else:
+                cur_inds = np.arange(self.shape[m])[np.array(cur_key)]
+            dim_inds.append(cur_inds)
+        return dim_inds, drop_dims
+
+    def _read_rows(self, rows, channels):
+        #Reads the given (sorted and unique) rows of the given channels; nearby rows are coalesced into contiguous reads
+        ret_data = np.zeros((rows.size, channels.size), dtype=self.dtype)
+        if rows.size == 0:
+            return ret_data
+        run_breaks = np.where(np.diff(rows) > FileIOLazyArray.MAX_ROW_GAP)[0] + 1
+        for run_inds in np.split(np.arange(rows.size), run_breaks):
+            row_start, row_end = rows[run_inds[0]], rows[run_inds[-1]] + 1
+            if self._reader.format_version >= 2:
+                cur_data = np.stack([self._reader.dsets[c][row_start:row_end] for c in channels], axis=-1)
+            else:
+                cur_data = self._reader.dset[row_start:row_end][:, channels]
+            ret_data[run_inds] = cur_data[rows[run_inds] - row_start]
+        return ret_data
+
+    def __getitem__(self, key):
+        assert self._reader.hdf5_file is not None, "The reader has released the file - create a new FileIOReader instance to extract data."
+        self._reader._flush_writer()
+        dim_inds, drop_dims = self._get_dim_indices(key)
+        sel_shape = tuple(x.size for x in dim_inds)
+        if np.prod(sel_shape) == 0:
+            ret_data = np.zeros(sel_shape, dtype=self.dtype)
+        else:
+            rows = np.ravel_multi_index(np.ix_(*dim_inds[:-1]), self.shape[:-1]).flatten() if self.ndim > 1 else np.array([0])
+            uniq_rows, row_map = np.unique(rows, return_inverse=True)
+            ret_data = self._read_rows(uniq_rows, dim_inds[-1])[row_map.flatten()].reshape(sel_shape)
+        if len(drop_dims) > 0:
+            ret_data = ret_data.reshape(tuple(x for m, x in enumerate(sel_shape) if m not in drop_dims))
+        return ret_data
+
+    def sel(self, coords={}, channels=None):
+        '''
+        Returns the data selected via the sweeping/slicing parameter values rather than the indices.
+
+        Inputs:
+            - coords   - Dictionary in which the keys are the parameter names and the values are either: a single value (dropping
+                         the dimension), a list/array of values or a slice of values (e.g. slice(1e9, 2e9) selects all values within
+                         that range). Values are matched to the nearest parameter value. Parameters not given are fully selected.
+            - channels - A channel name or list of channel names. Set to None to select all channels.
+        '''
+        key = [slice(None)]*self.ndim
+        for cur_param in coords:
+            assert cur_param in self._reader.param_names, f"The parameter {cur_param} is not in this data file. The parameters are: {self._reader.param_names}."
+            m = self._reader.param_names.index(cur_param)
+            cur_vals = self._reader.param_vals[m]
+            cur_sel = coords[cur_param]
+            if isinstance(cur_sel, slice):
+                assert cur_sel.step is None, "Slices of parameter values cannot take a step."
+                cur_inds = np.arange(cur_vals.size)
+                if cur_sel.start is not None:
+                    cur_inds = cur_inds[cur_vals[cur_inds] >= cur_sel.start]
+                if cur_sel.stop is not None:
+                    cur_inds = cur_inds[cur_vals[cur_inds] <= cur_sel.stop]
+                key[m] = cur_inds
+            elif np.isscalar(cur_sel):
+                key[m] = int(np.argmin(np.abs(cur_vals - cur_sel)))
+            else:
+                key[m] = np.array([np.argmin(np.abs(cur_vals - x)) for x in cur_sel], dtype=int)
+        if channels is not None:
+            if isinstance(channels, str):
+                assert channels in self._reader.dep_params, f"The channel {channels} is not in this data file. The channels are: {self._reader.dep_params}."
+                key[-1] = self._reader.dep_params.index(channels)
+            else:
+                for x in channels:
+                    assert x in self._reader.dep_params, f"The channel {x} is not in this data file. The channels are: {self._reader.dep_params}."
+                key[-1] = np.array([self._reader.dep_params.index(x) for x in channels], dtype=int)
+        return self[tuple(key)]
+
+    def iter_chunks(self, axis=0, block_size=1):
+        '''
+        Iterates over the data in blocks for out-of-core processing. It yields tuples of (key, data) where key is the index tuple
+        such that data = self[key]. Each block spans block_size indices along the given axis (i.e. all indices along the axes
+        before it are iterated individually, while all indices along the axes after it are fully selected).
+        '''
+        assert 0 <= axis < self.ndim - 1, f"The axis must be a sweeping/slicing parameter (i.e. between 0 and {self.ndim-2})."
+        assert block_size > 0, "The block size must be a positive integer."
+        for outer_inds in np.ndindex(*self.shape[:axis]):
+            for start_ind in range(0, self.shape[axis], block_size):
+                cur_key = tuple(int(x) for x in outer_inds) + (slice(start_ind, min(start_ind + block_size, self.shape[axis])),)
+                yield cur_key, self[cur_key]
+
 class FileIOReader:
     def __init__(self, filepath):
         self.file_path = filepath
         self.folder_path = os.path.dirname(filepath)
+        FileIOWriter.flush_file(filepath)
         self.hdf5_file =   h5py.File(filepath, 'r', libver='latest', swmr=True, locking=False)
+        #Files without a format_version are from the original monolithic layout (version 1)
+        self.format_version = int(self.hdf5_file.attrs.get('format_version', 1))
         self.dset = self.hdf5_file["data"]
         if 'timeStamps' in self.hdf5_file:
             self.dsetTS = self.hdf5_file["timeStamps"]
@@ -254,6 +568,9 @@ class FileIOReader:
         for cur_key in self.hdf5_file["measurements"].keys():
             cur_ind = self.hdf5_file["measurements"][cur_key][0]
             self.dep_params[cur_ind] = cur_key
+        if self.format_version >= 2:
+            #The group 'data' holds a 1D dataset per channel
+            self.dsets = [self.dset[x] for x in self.dep_params]
 
         #Extract the param_many_one_maps if any exist:
         if 'param_many_one_maps' in self.hdf5_file:
@@ -275,17 +592,51 @@ class FileIOReader:
             self.param_names[cur_ind] = cur_param
             self.param_vals[cur_ind] = self.hdf5_file["parameters"][cur_param][1:]
 
+    def _flush_writer(self):
+        #Writes out the buffer of any writer in this process that has the file open (its rows are then visible to this reader
+        #as the file is shared within the process)
+        FileIOWriter.flush_file(self.file_path)
+
+    def refresh(self):
+        #Refreshes the datasets so that a SWMR reader in another process (e.g. live plotting) sees the rows written since the
+        #file was opened. It is not needed within the writing process (and HDF5 fails on it if the file is opened there twice).
+        self._flush_writer()
+        for cur_dset in (self.dsets if self.format_version >= 2 else [self.dset]) + ([self.dsetTS] if self.dsetTS is not None else []):
+            cur_dset.refresh()
+
     def get_numpy_array(self):
         if not self.hdf5_file is None:
+            self._flush_writer()
             cur_shape = [len(x) for x in self.param_vals] + [len(self.dep_params)]
+            if self.format_version >= 2:
+                return np.stack([x[:] for x in self.dsets], axis=-1).reshape(tuple(x for x in cur_shape))
             return self.dset[:].reshape(tuple(x for x in cur_shape))
         else:
             assert False, "The reader has released the file - create a new FileIOReader instance to extract data."
             return np.array([])
-    
-    def get_xarray(self):
+
+    def get_lazy_array(self):
+        #Returns a FileIOLazyArray view of the data (i.e. indexing it only reads the selected rows from the file)
+        assert not self.hdf5_file is None, "The reader has released the file - create a new FileIOReader instance to extract data."
+        return FileIOLazyArray(self)
+
+    def get_xarray(self, lazy=False):
+        #If lazy, the DataArrays are backed by dask arrays (chunked along the data packets) that only read the file when computed
         data_arrays = []
-        arr = self.get_numpy_array()
+        if lazy:
+            try:
+                import dask.array   #Optional - imported here as it is slow to import and only used by the lazy backend
+            except (ModuleNotFoundError, ImportError):
+                assert False, "The package dask must be installed to use a lazy xarray."
+            lazy_arr = self.get_lazy_array()
+            #The chunks span whole inner dimensions (i.e. contiguous rows in the file) up to about 16MB
+            chunks, rem_elems = [], (16*1024*1024) // lazy_arr.dtype.itemsize
+            for cur_size in lazy_arr.shape[::-1]:
+                chunks.insert(0, max(1, min(cur_size, rem_elems)))
+                rem_elems = max(1, rem_elems // cur_size)
+            arr = dask.array.from_array(lazy_arr, chunks=tuple(chunks), asarray=True, fancy=False)
+        else:
+            arr = self.get_numpy_array()
         for v, dep_var in enumerate(self.dep_params):
             my_slice = [ np.s_[0:] for x in self.param_vals] + [v]
             my_slice = np.s_[tuple(my_slice)]
@@ -296,9 +647,15 @@ class FileIOReader:
     def get_time_stamps(self):
         if not self.hdf5_file is None:
             assert not self.dsetTS is None, "There are no time-stamps in this data file. It was probably created before the time-stamp feature was implemented in SQDToolz."
+            self._flush_writer()
             cur_shape = [len(x) for x in self.param_vals]
             cur_data = self.dsetTS[:]
-            cur_data = np.array([np.datetime64(x) for x in cur_data])
+            if cur_data.dtype.kind == 'S':
+                #Original format of datetime strings (with the trailing Z) per row
+                cur_data = np.char.rstrip(cur_data.astype('U'), 'Z').astype('datetime64[us]')
+            else:
+                #int64 nanoseconds since the epoch - either per row or per data packet (i.e. rows_per_stamp rows)
+                cur_data = np.repeat(cur_data, int(self.dsetTS.attrs.get('rows_per_stamp', 1))).astype('datetime64[ns]')
             return cur_data.reshape(tuple(x for x in cur_shape))
         else:
             assert False, "The reader has released the file - create a new FileIOReader instance to extract data."
@@ -307,11 +664,154 @@ class FileIOReader:
     def release(self):
         if not self.hdf5_file is None:
             self.dset = None
+            self.dsets = None
             self.hdf5_file.close()
             self.file_path = ''
             self.folder_path = ''
             self.hdf5_file = None
 
+class FileIOCatalogue:
+    '''
+    Persistent index of the experiment folders in a directory, stored as an SQLite database in the user cache directory (i.e.
+    nothing is written into the data directories). For every data file, it holds the sweeping/slicing parameters, channel names,
+    file index and laboratory variable values. An entry is only re-read (i.e. the data file opened and the JSON metadata parsed)
+    when the data file or its metadata files are modified.
+
+    To avoid walking (i.e. listing) every folder on repeated loads, the modification times of all directories (which change
+    when a file or folder is added, removed or renamed in them) are stored on walking them. If none of them changed, the folders
+    of the last walk are reused. Either way, the data and metadata files of every folder are checked for modifications.
+
+    Inputs:
+        - main_dir   - Directory holding the experiment folders (e.g. the date folder or the folder of a grouped experiment).
+        - persistent - If False (or if the database cannot be opened in the cache directory), the index is only held in memory.
+    '''
+    SCHEMA_VERSION = 3
+    #Directory holding the databases (one per indexed directory); if None, the user cache directory is used
+    CACHE_DIR = None
+    #Directory modification times within this many seconds of being recorded are not trusted (i.e. coarse file-system clocks)
+    MTIME_GUARD = 2.0
+
+    def __init__(self, main_dir, persistent=True):
+        self._main_dir = main_dir
+        self._conn = None
+        if persistent:
+            try:
+                self._conn = sqlite3.connect(FileIOCatalogue.get_database_path(main_dir), timeout=10)
+                self._init_tables()
+            except (sqlite3.Error, OSError):
+                self._conn = None
+        if self._conn is None:
+            self._conn = sqlite3.connect(':memory:')
+            self._init_tables()
+
+    @staticmethod
+    def get_database_path(main_dir):
+        cache_dir = FileIOCatalogue.CACHE_DIR
+        if cache_dir is None:
+            cache_dir = os.path.join(os.environ.get('LOCALAPPDATA', os.path.join(os.path.expanduser('~'), '.cache')), 'sqdtoolz', 'catalogues')
+        os.makedirs(cache_dir, exist_ok=True)
+        dir_hash = hashlib.sha1(os.path.abspath(main_dir).encode('utf-8')).hexdigest()
+        return os.path.join(cache_dir, dir_hash + '.sqlite')
+
+    def _init_tables(self):
+        if self._conn.execute('PRAGMA user_version').fetchone()[0] == FileIOCatalogue.SCHEMA_VERSION:
+            return
+        with self._conn:
+            self._conn.execute('DROP TABLE IF EXISTS runs')
+            self._conn.execute('DROP TABLE IF EXISTS signatures')
+            self._conn.execute('DROP TABLE IF EXISTS signature')
+            self._conn.execute('''CREATE TABLE runs (folder TEXT, file_name TEXT, mtimes TEXT, file_index INTEGER, sweep_names TEXT, lab_vars TEXT,
+                                  param_names TEXT, param_vals TEXT, dep_params TEXT, has_time_stamps INTEGER, PRIMARY KEY (folder, file_name))''')
+            self._conn.execute('CREATE TABLE signature (time_recorded REAL, dir_mtimes TEXT)')
+            self._conn.execute(f'PRAGMA user_version = {FileIOCatalogue.SCHEMA_VERSION}')
+
+    def _read_entry(self, rel_folder, file_name, mtimes, file_paths):
+        cur_file = FileIOReader(file_paths[0])
+        with open(file_paths[1]) as json_file:
+            data = json.load(json_file)
+            sweep_names = data['Sweeps']
+            file_index = data.get('FileIndex', None)
+        with open(file_paths[2]) as json_file:
+            data = json.load(json_file)
+            lab_vars = {x : data[x]['Value'] for x in data}
+        ret_entry = (rel_folder, file_name, mtimes, file_index, json.dumps(sweep_names), json.dumps(lab_vars), json.dumps(cur_file.param_names),
+                     json.dumps([np.asarray(x).tolist() for x in cur_file.param_vals]), json.dumps(cur_file.dep_params), int(cur_file.dsetTS is not None))
+        cur_file.release()
+        return ret_entry
+
+    def _get_folders(self):
+        #Returns the folders (relative to main_dir) - only walking the directories if any were modified since the last walk
+        cur_sig = self._conn.execute('SELECT time_recorded, dir_mtimes FROM signature').fetchone()
+        if cur_sig is not None:
+            dir_mtimes = json.loads(cur_sig[1])
+            try:
+                if cur_sig[0] - max(dir_mtimes.values())*1e-9 >= FileIOCatalogue.MTIME_GUARD and all(os.stat(os.path.join(self._main_dir, x)).st_mtime_ns == dir_mtimes[x] for x in dir_mtimes):
+                    return sorted([x for x in dir_mtimes if x != '.']), None
+            except OSError:
+                pass
+        #The time is taken before the walk so that directories modified during the walk are not trusted on the next call
+        sig_time = time.time()
+        dir_mtimes = {}
+        for cur_dir, _, _ in os.walk(self._main_dir):
+            try:
+                dir_mtimes[os.path.relpath(cur_dir, self._main_dir)] = os.stat(cur_dir).st_mtime_ns
+            except OSError:
+                pass
+        return sorted([x for x in dir_mtimes if x != '.']), (sig_time, json.dumps(dir_mtimes))
+
+    def get_runs(self, file_name, dir_suffix=''):
+        '''
+        Returns a tuple of: the list of runs (sorted by folder name) holding the data file file_name in the folders ending with
+        dir_suffix and the list of such folders that were ignored due to missing data or metadata files. Each run is a dictionary
+        with the keys: folder, file_index (None for legacy files), sweep_names, lab_vars (dictionary of the variable values),
+        param_names, param_vals (list of numpy arrays), dep_params and has_time_stamps.
+        '''
+        cur_entries = {x[0] : x for x in self._conn.execute('SELECT * FROM runs WHERE file_name = ?', (file_name,))}
+        cur_folders, new_sig = self._get_folders()
+        runs, folders_ignored, new_entries = [], [], []
+        stale_folders = []
+        for rel_folder in cur_folders:
+            cur_folder = os.path.join(self._main_dir, rel_folder)
+            cur_entry = cur_entries.pop(rel_folder, None)
+            #Check that the suffix of the folder name matches...
+            if not os.path.basename(cur_folder).endswith(dir_suffix):
+                continue
+            #Check that the relevant data and attribute files exist...
+            file_paths = [cur_folder + '/' + x for x in [file_name, 'experiment_parameters.txt', 'laboratory_parameters.txt']]
+            try:
+                mtimes = json.dumps([os.path.getmtime(x) for x in file_paths])
+            except OSError:
+                folders_ignored += [cur_folder]
+                if cur_entry is not None:
+                    stale_folders += [rel_folder]
+                continue
+            if cur_entry is None or cur_entry[2] != mtimes:
+                cur_entry = self._read_entry(rel_folder, file_name, mtimes, file_paths)
+                new_entries += [cur_entry]
+            runs += [{
+                'folder' : cur_folder, 'file_index' : cur_entry[3], 'sweep_names' : json.loads(cur_entry[4]), 'lab_vars' : json.loads(cur_entry[5]),
+                'param_names' : json.loads(cur_entry[6]), 'param_vals' : [np.array(x) for x in json.loads(cur_entry[7])],
+                'dep_params' : json.loads(cur_entry[8]), 'has_time_stamps' : bool(cur_entry[9])
+            }]
+        #The catalogued folders that no longer exist are dropped (those of other suffixes are kept)
+        stale_folders += list(cur_entries.keys())
+        #The catalogue is just a cache - so it is fine if another process holds the lock (i.e. it gets updated on the next call)
+        try:
+            with self._conn:
+                self._conn.executemany('INSERT OR REPLACE INTO runs VALUES (?,?,?,?,?,?,?,?,?,?)', new_entries)
+                self._conn.executemany('DELETE FROM runs WHERE folder = ? AND file_name = ?', [(x, file_name) for x in stale_folders])
+                if new_sig is not None:
+                    self._conn.execute('DELETE FROM signature')
+                    self._conn.execute('INSERT INTO signature VALUES (?,?)', new_sig)
+        except sqlite3.Error:
+            pass
+        return runs, folders_ignored
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
 class FileIODirectory:
     class plt_object:
         def __init__(self, pc, z_values):
@@ -328,7 +828,17 @@ class FileIODirectory:
             ax.add_collection(self.pc)
             ax.autoscale()
 
-    def __init__(self, filepath):
+    def __init__(self, filepath, use_catalogue=True, var_filters={}):
+        '''
+        Inputs:
+            - filepath      - Path to the data file in one of the experiment folders (the similar files are collected from the
+                              sibling folders with the same folder-name suffix).
+            - use_catalogue - If True, the metadata of the files is taken from (and kept in) a FileIOCatalogue of the parent
+                              folder (stored in the user cache directory), so that only new or modified files are opened on
+                              repeated loads.
+            - var_filters   - Dictionary in which the keys are variable names and the values are either a value (matched via
+                              np.isclose) or a function taking the variable value and returning True to keep the folder.
+        '''
         cur_dir_path = os.path.dirname(filepath)
         dir_name = os.path.basename(cur_dir_path)
         assert dir_name[0:6].isdigit(), "The time-stamp is not present in this folder."
@@ -338,59 +848,44 @@ class FileIODirectory:
         self._cur_dir_suffix = dir_name[6:]
         self._cur_file_name = os.path.basename(filepath)
 
-        #Collect all relevant similar files...
-        cur_dir_files = [x[0] for x in os.walk(self._main_dir)][1:]
+        #Collect all relevant similar files (note that the data files are not opened here; the metadata is in the catalogue)...
+        catalogue = FileIOCatalogue(self._main_dir, persistent=use_catalogue)
+        cur_runs, self.folders_ignored = catalogue.get_runs(self._cur_file_name, self._cur_dir_suffix)
+        catalogue.close()
         cur_files = []
-        self.folders = []
-        self.folders_ignored = []
         no_file_index = False
-        for cur_folder in cur_dir_files:
-            #Check that the suffix of the folder name matches...
-            if not os.path.basename(cur_folder).endswith(self._cur_dir_suffix):
-                continue
-
-            #Check that the relevant data and attribute files exist...
-            filepath = cur_folder +'/' + self._cur_file_name
-            if not os.path.isfile(cur_folder +'/' + self._cur_file_name):
-                self.folders_ignored += [cur_folder]
-                continue
-            if not os.path.isfile(cur_folder +'/' + 'experiment_parameters.txt'):
-                self.folders_ignored += [cur_folder]
-                continue
-            if not os.path.isfile(cur_folder +'/' + 'laboratory_parameters.txt'):
-                self.folders_ignored += [cur_folder]
-                continue
-
-            #Collect the information and add it to a list (note that the giant numpy array is not read in here...)...
-            cur_file = FileIOReader(filepath)
-            with open(cur_folder +'/' + 'experiment_parameters.txt') as json_file:
-                data = json.load(json_file)
-                var_names = data['Sweeps']
-                if not no_file_index and 'FileIndex' in data:
-                    cur_file_index = data['FileIndex']
+        for cur_run in cur_runs:
+            skip_run = False
+            for cur_var in var_filters:
+                if cur_var not in cur_run['lab_vars']:
+                    skip_run = True
+                elif callable(var_filters[cur_var]):
+                    skip_run = skip_run or not var_filters[cur_var](cur_run['lab_vars'][cur_var])
                 else:
-                    cur_file_index = 0
-                    no_file_index = True
-            with open(cur_folder +'/' + 'laboratory_parameters.txt') as json_file:
-                data = json.load(json_file)
-                var_vals = [data[x]['Value'] for x in var_names]
-
-            cur_files += [(cur_file, var_names, var_vals, cur_file_index, cur_folder)]
+                    skip_run = skip_run or not np.isclose(cur_run['lab_vars'][cur_var], var_filters[cur_var])
+            if skip_run:
+                continue
+            var_vals = [cur_run['lab_vars'][x] for x in cur_run['sweep_names']]
+            if cur_run['file_index'] is None:
+                no_file_index = True
+            cur_files += [(cur_run, cur_run['sweep_names'], var_vals, cur_run['file_index'], cur_run['folder'])]
+        assert len(cur_files) > 0, f"There are no valid data files {self._cur_file_name} in the folders of {self._main_dir} (after applying the variable filters)."
 
-        #Correct for the arbitrary nature of the folder order given by: os.walk
+        #Correct for the arbitrary nature of the folder order
         if no_file_index:
             print("Running FileIODirectory on files generated in legacy version of SQDToolz may cause the files to load to be in a mixed order.")
         else:
             cur_files = sorted(cur_files, key=lambda x: x[3])
         self.folders = [x[4] for x in cur_files]
+        self._lab_vars = [x[0]['lab_vars'] for x in cur_files]
 
         self.non_uniform = False
 
         #Try to figure out the outer structure...
         cur_param_names_outer = cur_files[0][1]
-        cur_param_names_inner = cur_files[0][0].param_names
-        cur_param_vals_inner = cur_files[0][0].param_vals
-        self.dep_params = cur_files[0][0].dep_params
+        cur_param_names_inner = cur_files[0][0]['param_names']
+        cur_param_vals_inner = cur_files[0][0]['param_vals']
+        self.dep_params = cur_files[0][0]['dep_params']
         same_sweep_vars_outer_loop = True
         for cur_file in cur_files:
             #Check that the outer looping variables are the same
@@ -398,15 +893,15 @@ class FileIODirectory:
                 same_sweep_vars_outer_loop = False
             #Check inner sweeping variables are the same
             #TODO: Investigate whether the demand that the files must be of the same inner parameter order is too stringent.
-            assert cur_param_names_inner == cur_file[0].param_names, "The inner parameters are different across files. This is a vary non-uniform set of files and shall not be parsed."
-            if len(cur_param_vals_inner) == len(cur_file[0].param_vals):
+            assert cur_param_names_inner == cur_file[0]['param_names'], "The inner parameters are different across files. This is a vary non-uniform set of files and shall not be parsed."
+            if len(cur_param_vals_inner) == len(cur_file[0]['param_vals']):
                 for cur_ind in range(len(cur_param_vals_inner)):
-                    if not np.array_equal(cur_param_vals_inner[cur_ind], cur_file[0].param_vals[cur_ind]):
+                    if not np.array_equal(cur_param_vals_inner[cur_ind], cur_file[0]['param_vals'][cur_ind]):
                         self.non_uniform = True
                         break
             else:
                 self.non_uniform = True
-            assert self.dep_params == cur_file[0].dep_params, "The dependent parameters are different across files. This is a vary non-uniform set of files and shall not be parsed."
+            assert self.dep_params == cur_file[0]['dep_params'], "The dependent parameters are different across files. This is a vary non-uniform set of files and shall not be parsed."
         if len(cur_param_names_outer) == 0:
             same_sweep_vars_outer_loop = False
 
@@ -430,71 +925,70 @@ class FileIODirectory:
             cur_param_names_outer = ['DirFileNo']
             self._cur_param_vals_outer = [np.arange(len(cur_files))]
 
+        #The data arrays are only read from the files when first requested
+        self._cur_file_paths = [x[4] + '/' + self._cur_file_name for x in cur_files]
+        self._cur_data = None
+        self._cur_data_ts = None
+        self.param_names = cur_param_names_outer + cur_param_names_inner
         if not self.non_uniform:
             #The sampling is uniform and thus, one can amalgamate all datasets into one giant numpy array!
-            cur_arrays = []
-            for cur_file in cur_files:
-                cur_arrays += [cur_file[0].get_numpy_array()]
-            cur_data = np.concatenate(cur_arrays)
-
-            #Process time-stamps (assuming that if the first file supports it, then the remaining shall as well...)
-            if cur_file[0].dsetTS is not None:
-                cur_arrays_ts = [cur_file[0].get_time_stamps() for cur_file in cur_files]
-                self._ts_valid = True
-            else:
-                self._ts_valid = False
-            cur_arrays_ts = np.concatenate(cur_arrays_ts)
-
-            self.param_names = cur_param_names_outer + cur_param_names_inner
             self.param_vals = self._cur_param_vals_outer + cur_param_vals_inner
-            self._cur_data = cur_data.reshape(tuple( [x.size for x in self.param_vals] + [len(self.dep_params)] ))
-            self._cur_data_ts = cur_arrays_ts.reshape(tuple( [x.size for x in self.param_vals] ))
+            #Process time-stamps (assuming that if the first file supports it, then the remaining shall as well...)
+            self._ts_valid = cur_files[0][0]['has_time_stamps']
         else:
             #TIME STAMPS ARE CURRENTLY UNSUPPORTED FOR NON-UNIFORM INDEXING
             #TODO: Give support for time-stamps in non-uniform indexing...
             self._ts_valid = False
 
             #The dataset is non-uniform, so don't reshape the lists...
-            self.param_names = cur_param_names_outer + cur_param_names_inner
             self.param_vals = self._cur_param_vals_outer
 
-            self._cur_data = [{'param_vals':x[0].param_vals, 'data':x[0].get_numpy_array()} for x in cur_files]
-            #Setup the indexing to match the outer sweeping parameters...
-            self._cur_data = np.array(self._cur_data).reshape(tuple(x.size for x in self.param_vals))
-
             self.uniform_indices = [True]*len(cur_param_names_outer)
             uniform_inners = []
             for cur_inner_ind in range(len(cur_param_names_inner)):
                 param_uniform = True
                 for cur_file in cur_files:
-                    if not np.array_equal(cur_file[0].param_vals[cur_inner_ind], cur_files[0][0].param_vals[cur_inner_ind]):
+                    if not np.array_equal(cur_file[0]['param_vals'][cur_inner_ind], cur_files[0][0]['param_vals'][cur_inner_ind]):
                         param_uniform = False
                         break
                 uniform_inners += [param_uniform]
             self.uniform_indices += uniform_inners
-        
+
+    def _load_data(self):
+        if self._cur_data is not None:
+            return
+        cur_readers = [FileIOReader(x) for x in self._cur_file_paths]
+        if not self.non_uniform:
+            cur_data = np.concatenate([x.get_numpy_array() for x in cur_readers])
+            self._cur_data = cur_data.reshape(tuple( [x.size for x in self.param_vals] + [len(self.dep_params)] ))
+            if self._ts_valid:
+                cur_arrays_ts = np.concatenate([x.get_time_stamps() for x in cur_readers])
+                self._cur_data_ts = cur_arrays_ts.reshape(tuple( [x.size for x in self.param_vals] ))
+        else:
+            self._cur_data = [{'param_vals':x.param_vals, 'data':x.get_numpy_array()} for x in cur_readers]
+            #Setup the indexing to match the outer sweeping parameters...
+            self._cur_data = np.array(self._cur_data).reshape(tuple(x.size for x in self.param_vals))
         #Release the HDF5 reader files...
-        for cur_file in cur_files:
-            cur_file[0].release()
+        for cur_reader in cur_readers:
+            cur_reader.release()
 
     @classmethod
-    def fromReader(cls, obj_FileIOReader):
-        return cls(obj_FileIOReader.file_path)
+    def fromReader(cls, obj_FileIOReader, **kwargs):
+        return cls(obj_FileIOReader.file_path, **kwargs)
 
     def get_numpy_array(self):
+        self._load_data()
         return self._cur_data
 
     def get_var_dict_arrays(self, return_slicing_params = False):
         ret_dict = {}
         array_shape = [x.size for x in self._cur_param_vals_outer]
         array_size = np.prod(array_shape)
-        for m, cur_folder in enumerate(self.folders):
-            with open(cur_folder +'/' + 'laboratory_parameters.txt') as json_file:
-                data = json.load(json_file)
-                for cur_var in data.keys():
-                    if not cur_var in ret_dict:
-                        ret_dict[cur_var] = np.empty((array_size,))
-                    ret_dict[cur_var][m] = data[cur_var]['Value']
+        for m, cur_lab_vars in enumerate(self._lab_vars):
+            for cur_var in cur_lab_vars.keys():
+                if not cur_var in ret_dict:
+                    ret_dict[cur_var] = np.empty((array_size,))
+                ret_dict[cur_var][m] = cur_lab_vars[cur_var]
         for cur_var in ret_dict:
             ret_dict[cur_var] = ret_dict[cur_var].reshape(tuple(array_shape))
         if return_slicing_params:
@@ -504,9 +998,11 @@ class FileIODirectory:
 
     def get_time_stamps(self):
         assert self._ts_valid, "Time-stamps are not present or supported for this directory."
+        self._load_data()
         return self._cur_data_ts
 
     def get_rects_from_nonuniform_index(self, second_axis_param, slicing_indices_dict, non_uniform_on_x = True):
+        self._load_data()
         assert self.uniform_indices.count(False) == 1, "This function only supports 1 nonuniform index."
         axis1_index = self.uniform_indices.index(False) - len(self.param_vals)
 
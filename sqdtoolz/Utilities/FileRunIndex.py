@@ -0,0 +1,183 @@
+import os
+import re
+import json
+import sys
+from datetime import datetime
+
+class FileRunIndex:
+    '''
+    Append-only index of the experiment runs in a Laboratory save-directory (stored in the file _run_index.txt). Every
+    change in the status of a run appends a line holding the JSON dictionary: {'Time', 'Name', 'Path', 'Status'} where
+    Path is the run folder relative to the save-directory and Status is one of: 'running', 'completed', 'halted' or
+    'failed'. As the lines are appended in chronological order, the last runs are found by reading the file backwards and
+    runs within a time-window are found via a binary search over the file.
+
+    Inputs:
+        - save_dir - The save-directory of the Laboratory object.
+    '''
+    FILE_NAME = '_run_index.txt'
+    TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+    BLOCK_SIZE = 64*1024
+
+    def __init__(self, save_dir):
+        self._save_dir = save_dir.replace('\\','/')
+        if self._save_dir[-1] != '/':
+            self._save_dir += '/'
+        self._file_path = self._save_dir + FileRunIndex.FILE_NAME
+
+    def exists(self):
+        return os.path.isfile(self._file_path)
+
+    def append(self, rel_path, name, status, time_stamp=None):
+        if time_stamp is None:
+            time_stamp = datetime.now()
+        cur_line = json.dumps({'Time' : time_stamp.strftime(FileRunIndex.TIME_FORMAT), 'Name' : name, 'Path' : rel_path, 'Status' : status})
+        #A new index in a save-directory that already holds (unindexed) runs must first list them
+        if not self.exists():
+            self.rebuild()
+        with open(self._file_path, 'a') as outfile:
+            outfile.write(cur_line + '\n')
+
+    @staticmethod
+    def _parse_line(cur_line):
+        #Lines may be partially written on a crash - these are just skipped
+        try:
+            return json.loads(cur_line)
+        except ValueError:
+            return None
+
+    def _iter_lines_reversed(self):
+        with open(self._file_path, 'rb') as fh:
+            fh.seek(0, os.SEEK_END)
+            cur_pos = fh.tell()
+            remainder = b''
+            while cur_pos > 0:
+                read_size = min(FileRunIndex.BLOCK_SIZE, cur_pos)
+                cur_pos -= read_size
+                fh.seek(cur_pos)
+                cur_lines = (fh.read(read_size) + remainder).split(b'\n')
+                remainder = cur_lines[0]
+                for cur_line in cur_lines[:0:-1]:
+                    if cur_line.strip():
+                        yield cur_line.decode('utf-8')
+            if remainder.strip():
+                yield remainder.decode('utf-8')
+
+    def _get_entry(self, cur_entry):
+        ret_entry = dict(cur_entry)
+        ret_entry['Path'] = self._save_dir + cur_entry['Path']
+        return ret_entry
+
+    def iter_runs_reversed(self):
+        '''
+        Yields the runs (as dictionaries with the keys: Time, Name, Path and Status) from the latest to the earliest. Only
+        the latest status of each run is given. Note that Path is the full path of the run folder.
+        '''
+        if not self.exists():
+            return
+        seen_paths = set()
+        for cur_line in self._iter_lines_reversed():
+            cur_entry = FileRunIndex._parse_line(cur_line)
+            if cur_entry is None or cur_entry['Path'] in seen_paths:
+                continue
+            seen_paths.add(cur_entry['Path'])
+            yield self._get_entry(cur_entry)
+
+    def get_last_run(self, status=None):
+        #Returns the latest run (with the given status if not None) or None if there are no such runs
+        for cur_run in self.iter_runs_reversed():
+            if status is None or cur_run['Status'] == status:
+                return cur_run
+        return None
+
+    def _seek_time(self, fh, file_size, time_str):
+        #Binary search for the offset of the first line at which the time-stamp is at least time_str
+        lo, hi = 0, file_size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if mid > 0:
+                fh.seek(mid - 1)
+                fh.readline()
+            else:
+                fh.seek(0)
+            cur_entry = FileRunIndex._parse_line(fh.readline())
+            if cur_entry is None or cur_entry['Time'] >= time_str:
+                hi = mid
+            else:
+                lo = mid + 1
+        if lo > 0:
+            fh.seek(lo - 1)
+            fh.readline()
+        else:
+            fh.seek(0)
+
+    def find_runs(self, name=None, start=None, end=None, status=None):
+        '''
+        Returns the list of runs (as dictionaries with the keys: Time, Name, Path and Status) in chronological order.
+
+        Inputs:
+            - name   - If not None, only the runs of the experiments with this name are returned.
+            - start  - If not None, only the runs with entries at or after this datetime object are returned.
+            - end    - If not None, only the runs with entries at or before this datetime object are returned.
+            - status - If not None, only the runs with this (latest) status are returned.
+        '''
+        if not self.exists():
+            return []
+        end_str = None if end is None else end.strftime(FileRunIndex.TIME_FORMAT)
+        ret_runs = {}
+        with open(self._file_path, 'rb') as fh:
+            fh.seek(0, os.SEEK_END)
+            file_size = fh.tell()
+            if start is not None:
+                self._seek_time(fh, file_size, start.strftime(FileRunIndex.TIME_FORMAT))
+            else:
+                fh.seek(0)
+            for cur_line in fh:
+                cur_entry = FileRunIndex._parse_line(cur_line)
+                if cur_entry is None:
+                    continue
+                if end_str is not None and cur_entry['Time'] > end_str:
+                    break
+                if name is None or cur_entry['Name'] == name:
+                    #Later entries of a run supersede the earlier ones (the run keeps its position of first appearance)
+                    ret_runs[cur_entry['Path']] = self._get_entry(cur_entry)
+        return [x for x in ret_runs.values() if status is None or x['Status'] == status]
+
+    def rebuild(self):
+        '''
+        Rebuilds the index by scanning the save-directory for run folders (i.e. the folders named HHMMSS-name within the date
+        folders or the group folders). The status of each run is inferred from the files in its folder. Any existing index is
+        replaced.
+        '''
+        cur_runs = []
+        for cur_dir, cur_sub_dirs, cur_files in os.walk(self._save_dir):
+            rel_path = os.path.relpath(cur_dir, self._save_dir).replace('\\','/')
+            path_parts = rel_path.split('/')
+            if len(path_parts) < 2 or not re.match(r'^\d{4}-\d{2}-\d{2}$', path_parts[0]) or not re.match(r'^\d{6}-', path_parts[-1]):
+                continue
+            if len(cur_files) == 0 and any(re.match(r'^\d{6}-', x) for x in cur_sub_dirs):
+                continue    #i.e. a group folder
+            if 'EXPERIMENT MANUALLY HALTED.txt' in cur_files or 'EXPERIMENT INTERNALLY HALTED.txt' in cur_files:
+                cur_status = 'halted'
+            elif all(x in cur_files for x in ['experiment_parameters.txt', 'laboratory_configuration.txt', 'laboratory_parameters.txt']):
+                cur_status = 'completed'
+            else:
+                cur_status = 'failed'
+            try:
+                cur_time = datetime.strptime(path_parts[0] + path_parts[-1][:6], '%Y-%m-%d%H%M%S')
+            except ValueError:
+                continue
+            cur_runs += [(cur_time, rel_path + '/', path_parts[-1][7:], cur_status)]
+        cur_runs.sort()
+        temp_path = self._file_path + '.tmp'
+        with open(temp_path, 'w') as outfile:
+            for cur_time, rel_path, name, status in cur_runs:
+                outfile.write(json.dumps({'Time' : cur_time.strftime(FileRunIndex.TIME_FORMAT), 'Name' : name, 'Path' : rel_path, 'Status' : status}) + '\n')
+        os.replace(temp_path, self._file_path)
+        return len(cur_runs)
+
+if __name__ == '__main__':
+    #Rebuilds the run index of an existing save-directory: python -m sqdtoolz.Utilities.FileRunIndex <save_dir>
+    assert len(sys.argv) == 2, "Usage: python -m sqdtoolz.Utilities.FileRunIndex <save_dir>"
+    num_runs = FileRunIndex(sys.argv[1]).rebuild()
+    print(f"Indexed {num_runs} runs in {sys.argv[1]}")
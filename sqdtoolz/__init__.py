@@ -1,42 +1,90 @@
-try:    #This should only fail if it is a light-installation (i.e. no QCoDeS or instrumentation control installed)
-    from sqdtoolz.Laboratory import Laboratory
-    from sqdtoolz.Experiment import Experiment
-    from sqdtoolz.ExperimentConfiguration import*
-    from sqdtoolz.ExperimentSpecification import*
-    from sqdtoolz.Variable import*
+import importlib
+import importlib.util
+import sys
+import types
 
-    from sqdtoolz.HAL.DDG import DDG
-    from sqdtoolz.HAL.ACQ import ACQ
-    from sqdtoolz.HAL.ACQdso import ACQdso
-    from sqdtoolz.HAL.AWG import WaveformAWG #TODO: Refactor this - RB is angry
-    from sqdtoolz.HAL.GENmwSource import GENmwSource
-    from sqdtoolz.HAL.GENvoltSource import GENvoltSource
-    from sqdtoolz.HAL.GENatten import GENatten
-    from sqdtoolz.HAL.GENfuncGen import GENfuncGen
-    from sqdtoolz.HAL.GENswitch import GENswitch
-    from sqdtoolz.HAL.GENswitchTrig import GENswitchTrig
-    from sqdtoolz.HAL.GENtherm import GENtherm
-    from sqdtoolz.HAL.SOFTpid import SOFTpid
-    from sqdtoolz.HAL.SOFTqpu import SOFTqpu
-    import sqdtoolz.HAL.ZI as ZI
-    from sqdtoolz.HAL.ACQvna import ACQvna
-    from sqdtoolz.HAL.ACQsa import ACQsa
-    from sqdtoolz.HAL.GENsmu import GENsmu
-    from sqdtoolz.HAL.WaveformSegments import*
-    from sqdtoolz.HAL.WaveformMapper import*
-    from sqdtoolz.HAL.WaveformTransformations import*
+#The package namespace is populated lazily (PEP 562) so that importing a light-weight module (e.g. the FileIO utilities
+#for data analysis) does not import QCoDeS, LabOne Q and all the HAL/processor modules. A missing optional dependency
+#(e.g. on a light-installation with no QCoDeS or instrumentation control installed) just leaves the name undefined.
+_LAZY_NAMES = {
+    'Laboratory'                : 'sqdtoolz.Laboratory',
+    'Experiment'                : 'sqdtoolz.Experiment',
+    'ExperimentConfiguration'   : 'sqdtoolz.ExperimentConfiguration',
+    'ExperimentSpecification'   : 'sqdtoolz.ExperimentSpecification',
+    'DDG'                       : 'sqdtoolz.HAL.DDG',
+    'ACQ'                       : 'sqdtoolz.HAL.ACQ',
+    'ACQdso'                    : 'sqdtoolz.HAL.ACQdso',
+    'WaveformAWG'               : 'sqdtoolz.HAL.AWG',   #TODO: Refactor this - RB is angry
+    'GENmwSource'               : 'sqdtoolz.HAL.GENmwSource',
+    'GENvoltSource'             : 'sqdtoolz.HAL.GENvoltSource',
+    'GENatten'                  : 'sqdtoolz.HAL.GENatten',
+    'GENfuncGen'                : 'sqdtoolz.HAL.GENfuncGen',
+    'GENswitch'                 : 'sqdtoolz.HAL.GENswitch',
+    'GENswitchTrig'             : 'sqdtoolz.HAL.GENswitchTrig',
+    'GENtherm'                  : 'sqdtoolz.HAL.GENtherm',
+    'SOFTpid'                   : 'sqdtoolz.HAL.SOFTpid',
+    'SOFTqpu'                   : 'sqdtoolz.HAL.SOFTqpu',
+    'ZI'                        : 'sqdtoolz.HAL.ZI',
+    'ACQvna'                    : 'sqdtoolz.HAL.ACQvna',
+    'ACQsa'                     : 'sqdtoolz.HAL.ACQsa',
+    'GENsmu'                    : 'sqdtoolz.HAL.GENsmu',
+    'MultiACQ'                  : 'sqdtoolz.HAL.MultiACQ',
+}
+#Modules whose entire namespace is exposed (i.e. the former star-imports) - searched in order on the first access of a name
+_STAR_MODULES = ['sqdtoolz.ExperimentConfiguration', 'sqdtoolz.ExperimentSpecification', 'sqdtoolz.Variable',
+                 'sqdtoolz.HAL.WaveformSegments', 'sqdtoolz.HAL.WaveformMapper', 'sqdtoolz.HAL.WaveformTransformations',
+                 'sqdtoolz.HAL.Processors.ProcessorCPU', 'sqdtoolz.HAL.Processors.ProcessorFPGA', 'sqdtoolz.HAL.Processors.ProcessorGPU']
 
-    from sqdtoolz.HAL.Processors.ProcessorCPU import*
-    from sqdtoolz.HAL.Processors.ProcessorFPGA import*
-except (ModuleNotFoundError, ImportError):
-    pass
-try:
-    from sqdtoolz.HAL.MultiACQ import MultiACQ
-except ModuleNotFoundError:
-    pass
-try:
-    from sqdtoolz.HAL.Processors.ProcessorGPU import*
-except (ModuleNotFoundError, ImportError):
-    pass
+class _PackageModule(types.ModuleType):
+    def __setattr__(self, name, value):
+        #The import system binds every imported sub-module onto the package. The sub-modules named after their main class
+        #(e.g. sqdtoolz.Laboratory) are replaced by that class so that stz.Laboratory etc. remain the classes.
+        if name in _LAZY_NAMES and isinstance(value, types.ModuleType) and value.__name__ == _LAZY_NAMES[name] and hasattr(value, name):
+            value = getattr(value, name)
+        super().__setattr__(name, value)
 
-# print('hi')
\ No newline at end of file
+sys.modules[__name__].__class__ = _PackageModule
+
+def _import_optional(module_name):
+    try:
+        return importlib.import_module(module_name)
+    except (ModuleNotFoundError, ImportError):
+        return None
+
+def _load_all():
+    #Eagerly loads the full namespace (e.g. for: from sqdtoolz import*)
+    cur_globals = globals()
+    for cur_module in _STAR_MODULES:
+        cur_module = _import_optional(cur_module)
+        if cur_module is not None:
+            cur_globals.update({k:v for k,v in vars(cur_module).items() if not k.startswith('_')})
+    for cur_name in _LAZY_NAMES:
+        try:
+            __getattr__(cur_name)
+        except AttributeError:
+            pass
+
+def __getattr__(name):
+    if name == '__all__':
+        _load_all()
+        return [x for x in globals() if not x.startswith('_') and x not in ['importlib', 'sys', 'types']]
+    if name.startswith('__'):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if name in _LAZY_NAMES:
+        cur_module = _import_optional(_LAZY_NAMES[name])
+        if cur_module is not None:
+            globals()[name] = cur_module if name == 'ZI' else getattr(cur_module, name)
+            return globals()[name]
+    elif importlib.util.find_spec(f'{__name__}.{name}') is not None:
+        #i.e. a sub-module or sub-package
+        return importlib.import_module(f'{__name__}.{name}')
+    else:
+        for cur_module in _STAR_MODULES:
+            cur_module = _import_optional(cur_module)
+            if cur_module is not None and hasattr(cur_module, name):
+                globals()[name] = getattr(cur_module, name)
+                return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_NAMES))
@@ -0,0 +1,67 @@
+import sqdtoolz as stz
+import numpy as np
+import time
+
+#Benchmarks the 'Basic' AWG auto-compression (i.e. finding the repeated MinSize chunks of the waveforms) on long repetitive
+#sequences against the previous implementation that compared every chunk with every unique chunk found so far (O(n^2)). The
+#sequences (unique chunks and sequence indices) must be identical.
+#ASSUMING THAT IT IS RUN IN VSCODE WITH SQDToolz AS THE MAIN FOLDER!
+lab = stz.Laboratory('UnitTests/UTestExperimentConfiguration.yaml', 'bench_save_dir/')
+lab.load_instrument('virAWG')
+awg_wfm = stz.WaveformAWG("Wfm1", lab, [('virAWG', 'CH1'), ('virAWG', 'CH2')], 1e9)
+
+def auto_comp_pairwise(awg_wfm, dS, final_wfm_for_chan, mkr_list):
+    num_main_secs = int(np.floor(final_wfm_for_chan.size / dS))
+    seq_segs = [final_wfm_for_chan[0:dS]]
+    seq_mkrs = [awg_wfm._extract_marker_segments(mkr_list, 0, dS)]
+    seq_ids  = [0]
+    for m in range(1,num_main_secs):
+        cur_seg = final_wfm_for_chan[(m*dS):((m+1)*dS)]
+        cur_mkrs = awg_wfm._extract_marker_segments(mkr_list, m*dS, (m+1)*dS)
+        found_match = False
+        for ind, cur_seq_seg in enumerate(seq_segs):
+            if np.array_equal(cur_seg, cur_seq_seg) and all([np.array_equal(seq_mkrs[ind][mkr], cur_mkrs[mkr]) for mkr in range(len(cur_mkrs))]):
+                seq_ids += [ind]
+                found_match = True
+                break
+        if not found_match:
+            seq_ids += [len(seq_segs)]
+            seq_segs += [cur_seg]
+            seq_mkrs += [cur_mkrs]
+    if (m+1)*dS < final_wfm_for_chan.size:
+        cur_mkrs = awg_wfm._extract_marker_segments(mkr_list, m*dS, mkr_list[0].size)
+        if found_match:
+            seq_ids[-1] = len(seq_segs)
+            seq_segs += [final_wfm_for_chan[(m*dS):]]
+            seq_mkrs += [cur_mkrs]
+        else:
+            seq_segs[-1] = final_wfm_for_chan[(m*dS):]
+            seq_mkrs[-1] = cur_mkrs
+    return {'waveforms' : seq_segs, 'markers' : seq_mkrs, 'seq_ids' : seq_ids}
+
+dS = 8
+rng = np.random.default_rng(42)
+#Repetitive sequence (e.g. randomised benchmarking) built from a small library of gate pulses separated by idle chunks
+gate_lib = [np.concatenate((0.5*np.exp(-0.5*((np.arange(4*dS)-2*dS)/(0.5*dS))**2) * np.cos(0.3*m*np.arange(4*dS)), np.zeros(dS))) for m in range(24)]
+for num_gates in [100, 1000, 5000, 20000]:
+    gates = rng.integers(len(gate_lib), size=num_gates)
+    final_wfm = np.concatenate([gate_lib[x] for x in gates] + [np.zeros(dS//2)])
+    mkr_list = [np.zeros(final_wfm.size, dtype=np.ubyte), np.array([], dtype=np.ubyte)]
+    mkr_list[0][:dS] = 1
+    #The pairwise comparison is too slow for the longest sequences
+    if num_gates <= 5000:
+        t0 = time.time()
+        old_data = auto_comp_pairwise(awg_wfm, dS, final_wfm, mkr_list)
+        t_old = time.time() - t0
+    else:
+        old_data, t_old = None, np.nan
+    t0 = time.time()
+    new_data = awg_wfm._program_auto_comp_basic(awg_wfm._awg_chan_list[0], final_wfm, mkr_list)
+    t_new = time.time() - t0
+    if old_data is not None:
+        assert old_data['seq_ids'] == new_data['seq_ids'], "The sequence indices differ from the pairwise auto-compression."
+        assert all(np.array_equal(x, y) for x, y in zip(old_data['waveforms'], new_data['waveforms'])), "The unique waveform segments differ from the pairwise auto-compression."
+        assert all(np.array_equal(x[m], y[m]) for x, y in zip(old_data['markers'], new_data['markers']) for m in range(len(x))), "The unique marker segments differ from the pairwise auto-compression."
+    print(f"{final_wfm.size//dS:>7} chunks ({len(new_data['waveforms']):>3} unique): pairwise {t_old*1e3:9.1f}ms, hashed {t_new*1e3:7.1f}ms")
+
+lab.release_all_instruments()
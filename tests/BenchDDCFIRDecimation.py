@@ -0,0 +1,34 @@
+import sqdtoolz as stz
+import numpy as np
+import copy
+import time
+
+#Benchmarks the fused CPU_DDCFIRDecimation stage against running the CPU_DDC, CPU_FIR and CPU_Decimation stages in succession
+#(i.e. demodulating and filtering at the full rate before discarding most of the filtered samples). The results must match.
+#ASSUMING THAT IT IS RUN IN VSCODE WITH SQDToolz AS THE MAIN FOLDER!
+num_reps = 100
+num_segs = 4
+data_size = 4096
+num_trials = 5
+rng = np.random.default_rng(42)
+raw_data = {'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : rng.normal(size=(num_reps, num_segs, data_size)), 'ch2' : rng.normal(size=(num_reps, num_segs, data_size))}, 'misc' : {'SampleRates' : [500e6, 500e6]}}
+fir_specs = [{'Type' : 'low', 'Taps' : 40, 'fc' : 10e6, 'Win' : 'hamming'}]*4
+
+def run_stages(cur_stages):
+    t0 = time.time()
+    for m in range(num_trials):
+        cur_data = copy.deepcopy(raw_data)
+        for cur_stage in cur_stages:
+            cur_data = cur_stage.process_data(cur_data)
+    return (time.time() - t0) / num_trials, cur_data
+
+t_copy, _ = run_stages([])
+for deci_fac in [1, 4, 10, 25]:
+    t_unfused, data_unfused = run_stages([stz.CPU_DDC([25e6, 35e6]), stz.CPU_FIR(fir_specs), stz.CPU_Decimation('sample', deci_fac)])
+    t_fused, data_fused = run_stages([stz.CPU_DDCFIRDecimation([25e6, 35e6], fir_specs, 'sample', deci_fac)])
+    assert list(data_unfused['data'].keys()) == list(data_fused['data'].keys()), "The fused stage does not give the same channels as the unfused stages."
+    assert data_unfused['misc']['SampleRates'] == data_fused['misc']['SampleRates'], "The fused stage does not give the same sample rates as the unfused stages."
+    for cur_ch in data_unfused['data']:
+        assert np.max(np.abs(data_unfused['data'][cur_ch] - data_fused['data'][cur_ch])) < 1e-10, "The fused stage does not match the unfused stages."
+    num_samples = 2*num_reps*num_segs*data_size
+    print(f"Decimation {deci_fac:>2}: unfused {(t_unfused-t_copy)*1e3:7.1f}ms ({num_samples/(t_unfused-t_copy)/1e6:6.1f}MS/s), fused {(t_fused-t_copy)*1e3:7.1f}ms ({num_samples/(t_fused-t_copy)/1e6:6.1f}MS/s)")
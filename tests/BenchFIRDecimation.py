@@ -0,0 +1,34 @@
+import sqdtoolz as stz
+import numpy as np
+import copy
+import time
+
+#Benchmarks the polyphase CPU_FIRDecimation stage against a CPU_FIR stage (with the same anti-aliasing filter) followed by a
+#CPU_Decimation stage (i.e. filtering every sample before discarding most of them). The results and metadata must match.
+#ASSUMING THAT IT IS RUN IN VSCODE WITH SQDToolz AS THE MAIN FOLDER!
+num_reps = 100
+num_segs = 4
+data_size = 4096
+num_trials = 5
+rng = np.random.default_rng(42)
+raw_data = {'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : rng.normal(size=(num_reps, num_segs, data_size)), 'ch2' : rng.normal(size=(num_reps, num_segs, data_size))}, 'misc' : {'SampleRates' : [500e6, 500e6]}}
+
+def run_stages(cur_stages):
+    t0 = time.time()
+    for m in range(num_trials):
+        cur_data = copy.deepcopy(raw_data)
+        for cur_stage in cur_stages:
+            cur_data = cur_stage.process_data(cur_data)
+    return (time.time() - t0) / num_trials, cur_data
+
+t_copy, _ = run_stages([])
+for deci_fac in [2, 4, 8, 16]:
+    #Same filter as the default anti-aliasing filter of CPU_FIRDecimation (cut-off at the decimated Nyquist frequency)
+    fir_specs = [{'Type' : 'low', 'Taps' : 20*deci_fac+1, 'fc' : 500e6/(2*deci_fac), 'Win' : ('kaiser', 5.0)}]*2
+    t_unfused, data_unfused = run_stages([stz.CPU_FIR(fir_specs), stz.CPU_Decimation('sample', deci_fac)])
+    t_fused, data_fused = run_stages([stz.CPU_FIRDecimation('sample', deci_fac)])
+    assert data_unfused['parameters'] == data_fused['parameters'], "The polyphase stage does not give the same parameters."
+    assert data_unfused['misc']['SampleRates'] == data_fused['misc']['SampleRates'], "The polyphase stage does not give the same sample rates."
+    for cur_ch in data_unfused['data']:
+        assert np.max(np.abs(data_unfused['data'][cur_ch] - data_fused['data'][cur_ch])) < 1e-10, "The polyphase stage does not match FIR-then-slice."
+    print(f"Decimation {deci_fac:>2} ({20*deci_fac+1:>3} taps): FIR-then-slice {(t_unfused-t_copy)*1e3:7.1f}ms, polyphase {(t_fused-t_copy)*1e3:7.1f}ms ({(t_unfused-t_copy)/(t_fused-t_copy):4.1f}x)")
@@ -0,0 +1,64 @@
+from sqdtoolz.Utilities.FileIO import FileIOWriter, FileIOReader
+from sqdtoolz.Variable import VariableInternalTransient
+import numpy as np
+import time
+import os
+
+#Benchmarks the write throughput and file size of the FileIOWriter storage layouts, compression filters and write buffering.
+#ASSUMING THAT IT IS RUN IN VSCODE WITH SQDToolz AS THE MAIN FOLDER!
+file_path = 'bench_fileio.h5'
+
+def run_bench(sweep_vars, pkt_shape, options):
+    rng = np.random.default_rng(1)
+    #Digitiser-like data (i.e. few distinct levels and noise) so that the compression ratios are meaningful
+    data_pkts = [{
+                    'parameters' : [f'ind{m}' for m in range(len(pkt_shape))],
+                    'data' : { f'ch{c}' : np.round(rng.normal(0, 20, pkt_shape)) for c in range(4) }
+                } for m in range(8)]
+    num_pkts = int(np.prod([x[1].size for x in sweep_vars]))
+    num_bytes = 4 * int(np.prod(pkt_shape)) * 8 * num_pkts
+    print(f'\n{num_pkts} packets of shape {pkt_shape} across 4 channels:')
+    for cur_opts in options:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        try:
+            wrtr = FileIOWriter(file_path, store_timestamps=False, **cur_opts)
+        except AssertionError as e:
+            print(f'{str(cur_opts):<110} skipped: {e}')
+            continue
+        t0 = time.time()
+        for m in range(num_pkts):
+            wrtr.push_datapkt(data_pkts[m % len(data_pkts)], sweep_vars)
+        wrtr.close()
+        t_write = time.time() - t0
+        #
+        t0 = time.time()
+        rdr = FileIOReader(file_path)
+        rdr.get_numpy_array()
+        rdr.release()
+        t_read = time.time() - t0
+        print(f'{str(cur_opts):<110} write: {num_bytes/t_write/1e6:7.1f}MB/s ({t_write/num_pkts*1e6:7.1f}us/packet), read: {num_bytes/t_read/1e6:7.1f}MB/s, size: {os.path.getsize(file_path)/1e6:6.2f}MB (raw {num_bytes/1e6:.2f}MB)')
+
+#Large packets (e.g. raw traces) - dominated by the storage layout and compression
+run_bench([(VariableInternalTransient('flux'), np.arange(20)), (VariableInternalTransient('freq'), np.arange(50))], (16, 256), [
+    {'layout':'monolithic'},    #Original layout (gzip level 4)
+    {'layout':'channels', 'compression':'gzip'},
+    {'layout':'channels', 'compression':'gzip', 'compression_opts':1, 'shuffle':True},
+    {'layout':'channels', 'compression':'lzf'},
+    {'layout':'channels', 'compression':'lzf', 'shuffle':True},
+    {'layout':'channels', 'compression':None},
+    {'layout':'channels', 'compression':'blosc', 'shuffle':True},
+    {'layout':'channels', 'compression':'lz4'},
+])
+
+#Small packets (e.g. averaged data) - dominated by the per-packet write and flush overheads
+run_bench([(VariableInternalTransient('flux'), np.arange(100)), (VariableInternalTransient('freq'), np.arange(100))], (4,), [
+    {'layout':'monolithic'},
+    {'layout':'monolithic', 'buffer_packets':100},
+    {'layout':'channels', 'compression':'lzf'},
+    {'layout':'channels', 'compression':'lzf', 'buffer_packets':100},
+    {'layout':'channels', 'compression':'lzf', 'buffer_packets':None, 'buffer_time':1.0},
+])
+
+if os.path.exists(file_path):
+    os.remove(file_path)
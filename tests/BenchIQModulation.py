@@ -0,0 +1,34 @@
+import sqdtoolz as stz
+import numpy as np
+import time
+
+#Benchmarks the IQ modulation in WFMT_ModulationIQ (rotating the cached carriers) against the previous implementation that
+#evaluated the cosine/sine over the time vector on every call. The modulated waveforms must match.
+#ASSUMING THAT IT IS RUN IN VSCODE WITH SQDToolz AS THE MAIN FOLDER!
+lab = stz.Laboratory('UnitTests/UTestExperimentConfiguration.yaml', 'bench_save_dir/')
+wfmt = stz.WFMT_ModulationIQ('IQmod', lab, 47e7)
+
+def modulate_direct(wfmt, wfm_pts, fs, t0_ind, ch_index):
+    t_vals = np.arange(wfm_pts.size) / fs + t0_ind / fs - wfmt._cur_t0
+    if ch_index == 0:
+        return wfm_pts * wfmt.IQAmplitude * np.cos(2 * np.pi * wfmt.IQFrequency * t_vals) + wfmt.IQdcOffset[0]
+    return wfm_pts * wfmt.IQAmplitude * wfmt.IQAmplitudeFactor * np.sin(2 * np.pi * wfmt.IQFrequency * t_vals + wfmt.IQPhaseOffset) + wfmt.IQdcOffset[1]
+
+fs = 1e9
+for num_pts, num_segs in [(40, 10000), (1000, 1000), (100000, 20)]:
+    wfm_pts = np.exp(-0.5*((np.arange(num_pts) - num_pts/2)/(num_pts/6))**2)
+    t0s = np.arange(num_segs) * (num_pts + 8)
+    res_times = []
+    res_wfms = []
+    for cur_func in [lambda t0, ch: modulate_direct(wfmt, wfm_pts, fs, t0, ch), lambda t0, ch: wfmt.modify_waveform(wfm_pts, fs, t0, ch)]:
+        for single_prec in ([False] if len(res_times) == 0 else [False, True]):
+            wfmt.IQSinglePrecision = single_prec
+            wfmt.initialise_for_new_waveform()
+            t0 = time.time()
+            cur_wfms = [cur_func(t0_ind, ch) for t0_ind in t0s for ch in range(2)]
+            res_times += [time.time() - t0]
+            res_wfms += [cur_wfms]
+    wfmt.IQSinglePrecision = False
+    assert all(np.max(np.abs(x - y)) < 1e-8 for x, y in zip(res_wfms[0], res_wfms[1])), "The cached-carrier modulation does not match the direct modulation."
+    assert all(np.max(np.abs(x - y)) < 1e-5 for x, y in zip(res_wfms[0], res_wfms[2])), "The single precision modulation does not match the direct modulation."
+    print(f"{num_segs:>6} segments of {num_pts:>6} points: direct {res_times[0]*1e3:8.1f}ms, cached carrier {res_times[1]*1e3:8.1f}ms, cached carrier (float32) {res_times[2]*1e3:8.1f}ms")
@@ -0,0 +1,36 @@
+import subprocess
+import sys
+
+#Benchmarks the import time of sqdtoolz for typical use-cases via: python -X importtime
+#The cumulative times of the top-level imports are summed (i.e. the total time spent importing) and the slowest
+#top-level packages are listed. Each case is run in a fresh interpreter several times and the fastest run is reported.
+#ASSUMING THAT IT IS RUN IN VSCODE WITH SQDToolz AS THE MAIN FOLDER!
+cases = {
+    'analysis-only'     : "from sqdtoolz.Utilities.FileIO import FileIOReader",
+    'package only'      : "import sqdtoolz as stz",
+    'full-lab'          : "import sqdtoolz as stz; stz.Laboratory; stz.Experiment; stz.ACQ; stz.DDG; stz.WaveformAWG; stz.ProcessorCPU; stz.WFS_Gaussian",
+    'full-lab with ZI'  : "import sqdtoolz as stz; stz.Laboratory; stz.Experiment; stz.ZIQubit if hasattr(stz, 'ZIQubit') else stz.ZI.ZIQubit",
+    'legacy star-import': "from sqdtoolz.Laboratory import*",
+}
+num_runs = 3
+
+def get_import_times(code):
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    top_level = {}
+    for cur_line in proc.stderr.splitlines():
+        #Lines are formatted as: import time: self [us] | cumulative | imported package
+        if not cur_line.startswith('import time:') or 'cumulative' in cur_line:
+            continue
+        cur_cols = cur_line[12:].split('|')
+        cur_name = cur_cols[2].rstrip()
+        #Top-level imports have a single space of indentation
+        if cur_name.startswith(' ') and not cur_name.startswith('  '):
+            top_level[cur_name.strip()] = int(cur_cols[1])*1e-6
+    return sum(top_level.values()), top_level
+
+for cur_case in cases:
+    cur_runs = [get_import_times(cases[cur_case]) for m in range(num_runs)]
+    total_time, top_level = min(cur_runs, key=lambda x: x[0])
+    slowest = sorted(top_level.items(), key=lambda x: -x[1])[:5]
+    print(f"{cur_case:<20} {total_time:6.2f}s  (slowest: {', '.join([f'{x[0]} {x[1]:.2f}s' for x in slowest])})")
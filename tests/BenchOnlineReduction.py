@@ -0,0 +1,46 @@
+import sqdtoolz as stz
+import numpy as np
+import time
+import tracemalloc
+
+#Benchmarks the online end-stage reductions of ProcessorCPU (i.e. folding every processed packet into running means/variances)
+#against concatenating all packets before reducing them. The peak memory is measured via tracemalloc while streaming blocks of
+#repetitions (each block is generated on the fly like a digitiser returning it).
+#ASSUMING THAT IT IS RUN IN VSCODE WITH SQDToolz AS THE MAIN FOLDER!
+lab = stz.Laboratory('', 'bench_save_dir/')
+
+class CPU_MeanVarianceConcat(stz.CPU_MeanVariance):
+    #Same stage with the online folding disabled
+    def _can_fold_online(self, data_pkt):
+        return False
+
+reps_per_block = 100
+num_segs = 4
+data_size = 1024
+
+def run_acquisition(cur_proc, num_blocks):
+    rng = np.random.default_rng(42)
+    t0 = time.time()
+    for m in range(num_blocks):
+        cur_block = rng.normal(100.0, 1.0, size=(reps_per_block, num_segs, data_size))
+        cur_proc.push_data({'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : cur_block}, 'misc' : {'SampleRates' : [500e6]}})
+    ret_data = cur_proc.get_all_data()
+    return time.time() - t0, ret_data
+
+for num_blocks in [10, 50, 200]:
+    res_datas = []
+    res_str = f"{num_blocks*reps_per_block:>6} repetitions ({num_blocks*reps_per_block*num_segs*data_size*8/1e6:6.0f}MB):"
+    for cur_stage, cur_label in [(CPU_MeanVarianceConcat, 'concatenated'), (stz.CPU_MeanVariance, 'online')]:
+        cur_proc = stz.ProcessorCPU('cpu_bench', lab, streaming=True, max_queued_packets=2)
+        cur_proc.reset_pipeline()
+        cur_proc.add_stage_end(cur_stage('repetition'))
+        tracemalloc.start()
+        cur_time, cur_data = run_acquisition(cur_proc, num_blocks)
+        peak_mem = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        cur_proc.Streaming = False
+        res_datas += [cur_data]
+        res_str += f" {cur_label} {cur_time*1e3:7.1f}ms (peak {peak_mem/1e6:7.1f}MB),"
+    for cur_ch in res_datas[0]['data']:
+        assert np.max(np.abs(res_datas[0]['data'][cur_ch] - res_datas[1]['data'][cur_ch])) < 1e-9, "The online reduction does not match the concatenated reduction."
+    print(res_str[:-1])
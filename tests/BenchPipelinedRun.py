@@ -0,0 +1,43 @@
+import sqdtoolz as stz
+import numpy as np
+import shutil
+import time
+
+#Benchmarks the serial and pipelined (pipeline_depth > 0) execution modes of Experiment._run using the dummy instruments.
+#The acquisition time per sweeping point is emulated via the delay argument, while the storage time is set by the size
+#of the data returned by the dummy ACQ.
+#ASSUMING THAT IT IS RUN IN VSCODE WITH SQDToolz AS THE MAIN FOLDER!
+lab = stz.Laboratory('UnitTests/UTestExperimentConfiguration.yaml', 'bench_save_dir/')
+
+lab.load_instrument('virACQ')
+lab.load_instrument('virDDG')
+lab.load_instrument('virAWG')
+
+stz.ACQ("dum_acq", lab, 'virACQ')
+stz.DDG("ddg", lab, 'virDDG')
+awg_wfm = stz.WaveformAWG("Wfm1", lab, [('virAWG', 'CH1'), ('virAWG', 'CH2')], 1e9)
+awg_wfm.add_waveform_segment(stz.WFS_Gaussian("init", None, 24e-9, 0.5))
+awg_wfm.add_waveform_segment(stz.WFS_Constant("zero", None, 40e-9, 0.0))
+stz.ExperimentConfiguration('benchConf', lab, 1e-6, ['ddg', 'Wfm1'], 'dum_acq')
+
+stz.VariableInternal('outer', lab)
+stz.VariableInternal('inner', lab)
+
+acq_delay = 0.02
+num_pts = 10*10
+for num_samples in [1024, 16384, 131072]:
+    lab.HAL('dum_acq').NumSamples = num_samples
+    lab.HAL('dum_acq').NumRepetitions = 4
+    res_times = []
+    for cur_depth in [0, 1, 4]:
+        exp = stz.Experiment("bench", lab.CONFIG('benchConf'))
+        t0 = time.time()
+        res = lab.run_single(exp, [(lab.VAR('outer'), np.arange(10)), (lab.VAR('inner'), np.arange(10))], delay=acq_delay, pipeline_depth=cur_depth, disable_progress_bar=True)
+        res_times += [(time.time() - t0)/num_pts]
+        res.release()
+        exp.close_all_read_files()
+        time.sleep(1)   #Otherwise it writes to the same folder as the previous run...
+    print(f'\nNumSamples={num_samples}: ' + ', '.join([f'depth {d}: {t*1e3:.1f}ms/point' for d, t in zip([0, 1, 4], res_times)]) + f' (acquisition {acq_delay*1e3:.1f}ms/point)')
+
+lab.release_all_instruments()
+shutil.rmtree('bench_save_dir')
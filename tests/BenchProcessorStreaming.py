@@ -0,0 +1,44 @@
+import sqdtoolz as stz
+import numpy as np
+import time
+
+#Benchmarks the streaming mode of ProcessorCPU, in which the packets are processed by worker threads as they are pushed (i.e.
+#while the next block is being acquired), against the synchronous mode that processes all packets in get_all_data. The
+#acquisition is emulated by waiting for every block of repetitions (e.g. as in the FIFO mode of a digitiser).
+#ASSUMING THAT IT IS RUN IN VSCODE WITH SQDToolz AS THE MAIN FOLDER!
+lab = stz.Laboratory('', 'bench_save_dir/')
+
+num_blocks = 20
+reps_per_block = 50
+num_segs = 4
+data_size = 2048
+acq_time_per_block = 0.02
+rng = np.random.default_rng(42)
+raw_blocks = [rng.integers(-2**15, 2**15, size=(reps_per_block, num_segs, data_size)).astype(np.float64) for m in range(num_blocks)]
+
+def run_acquisition(cur_proc):
+    t0 = time.time()
+    for cur_block in raw_blocks:
+        time.sleep(acq_time_per_block)
+        cur_proc.push_data({'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : cur_block.copy()}, 'misc' : {'SampleRates' : [500e6]}})
+    ret_data = cur_proc.get_all_data()
+    return time.time() - t0, ret_data
+
+res_times = []
+res_datas = []
+for streaming, num_workers in [(False, 1), (True, 1), (True, 2)]:
+    cur_proc = stz.ProcessorCPU('cpu_bench', lab, streaming=streaming, num_workers=num_workers)
+    cur_proc.reset_pipeline()
+    cur_proc.add_stage(stz.CPU_DDC([25e6]))
+    cur_proc.add_stage(stz.CPU_FIR([{'Type' : 'low', 'Taps' : 40, 'fc' : 10e6, 'Win' : 'hamming'}]*2))
+    cur_proc.add_stage(stz.CPU_Mean('sample'))
+    cur_proc.add_stage_end(stz.CPU_Mean('repetition'))
+    run_acquisition(cur_proc)   #Warm-up
+    cur_time, cur_data = run_acquisition(cur_proc)
+    cur_proc.Streaming = False
+    res_times += [cur_time]
+    res_datas += [cur_data]
+    print(f"Streaming={streaming!s:<5} (workers={num_workers}): {cur_time*1e3:7.1f}ms (acquisition alone: {num_blocks*acq_time_per_block*1e3:.0f}ms)")
+for cur_data in res_datas[1:]:
+    for cur_ch in res_datas[0]['data']:
+        assert np.array_equal(cur_data['data'][cur_ch], res_datas[0]['data'][cur_ch]), "The streamed results do not match the synchronous results."
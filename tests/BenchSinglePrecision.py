@@ -0,0 +1,60 @@
+import sqdtoolz as stz
+import numpy as np
+import time
+import tracemalloc
+
+#Benchmarks the single-precision mode of ProcessorCPU (i.e. processing 16-bit digitiser data as float32 with float64
+#accumulators in the reductions) against the default double-precision processing. The throughput, the peak memory (via
+#tracemalloc) and the maximum relative deviation from the double-precision results are shown for typical readout pipelines.
+#ASSUMING THAT IT IS RUN IN VSCODE WITH SQDToolz AS THE MAIN FOLDER!
+lab = stz.Laboratory('', 'bench_save_dir/')
+
+num_blocks = 10
+reps_per_block = 100
+num_segs = 4
+data_size = 4096
+rng = np.random.default_rng(42)
+raw_blocks = [rng.integers(-2**15, 2**15, size=(reps_per_block, num_segs, data_size)).astype(np.int16) for m in range(num_blocks)]
+fir_specs = [{'Type' : 'low', 'Taps' : 40, 'fc' : 10e6, 'Win' : 'hamming'}]*2
+
+def setup_unfused(cur_proc):
+    cur_proc.add_stage(stz.CPU_DDC([25e6]))
+    cur_proc.add_stage(stz.CPU_FIR(fir_specs))
+    cur_proc.add_stage(stz.CPU_MeanBlock('sample', 8))
+    cur_proc.add_stage_end(stz.CPU_Mean('repetition'))
+
+def setup_fused(cur_proc):
+    cur_proc.add_stage(stz.CPU_DDCFIRDecimation([25e6], fir_specs, 'sample', 8))
+    cur_proc.add_stage(stz.CPU_FFT())
+    cur_proc.add_stage_end(stz.CPU_MeanVariance('repetition'))
+
+def run_acquisition(cur_proc):
+    #The time (best of 3 runs) and the peak memory are measured in separate runs as tracemalloc slows down the allocations
+    cur_times = []
+    for m in range(3):
+        t0 = time.time()
+        for cur_block in raw_blocks:
+            cur_proc.push_data({'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : cur_block}, 'misc' : {'SampleRates' : [500e6]}})
+        ret_data = cur_proc.get_all_data()
+        cur_times += [time.time() - t0]
+    cur_time = min(cur_times)
+    tracemalloc.start()
+    for cur_block in raw_blocks:
+        cur_proc.push_data({'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : cur_block}, 'misc' : {'SampleRates' : [500e6]}})
+    cur_proc.get_all_data()
+    peak_mem = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return cur_time, peak_mem, ret_data
+
+num_samples = num_blocks*reps_per_block*num_segs*data_size
+for cur_name, cur_setup in [('DDC, FIR, MeanBlock', setup_unfused), ('DDCFIRDecimation, FFT', setup_fused)]:
+    res_datas = []
+    for data_type, acc_float64 in [('float64', True), ('float32', True), ('float32', False)]:
+        cur_proc = stz.ProcessorCPU('cpu_bench', lab, data_type=data_type, accumulate_float64=acc_float64)
+        cur_proc.reset_pipeline()
+        cur_setup(cur_proc)
+        run_acquisition(cur_proc)   #Warm-up
+        cur_time, peak_mem, cur_data = run_acquisition(cur_proc)
+        res_datas += [cur_data]
+        max_err = max(np.max(np.abs(cur_data['data'][x] - res_datas[0]['data'][x])) / np.max(np.abs(res_datas[0]['data'][x])) for x in cur_data['data'])
+        print(f"{cur_name:<22} {data_type} (float64 accumulators={acc_float64!s:<5}): {cur_time*1e3:7.1f}ms ({num_samples/cur_time/1e6:6.1f}MS/s), peak {peak_mem/1e6:6.1f}MB, max relative deviation {max_err:.1e}")
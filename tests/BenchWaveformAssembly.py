@@ -0,0 +1,56 @@
+import sqdtoolz as stz
+import numpy as np
+import time
+
+#Benchmarks the assembly of the raw AWG waveforms (WaveformAWG._assemble_waveform_raw) for long sequences of segments (e.g. as
+#found in randomised benchmarking) against the previous implementation that concatenated the segments one after another. The
+#assembled waveforms must be identical.
+#ASSUMING THAT IT IS RUN IN VSCODE WITH SQDToolz AS THE MAIN FOLDER!
+lab = stz.Laboratory('UnitTests/UTestExperimentConfiguration.yaml', 'bench_save_dir/')
+lab.load_instrument('virAWG')
+stz.WFMT_ModulationIQ('IQmod', lab, 47e7)
+
+def assemble_by_concatenation(awg_wfm):
+    elas_seg_ind, elastic_time = awg_wfm._get_elastic_time_seg_params()
+    if elas_seg_ind != -1:
+        awg_wfm._wfm_segment_list[elas_seg_ind].Duration = elastic_time
+    final_wfms = [np.array([])]*len(awg_wfm._awg_chan_list)
+    for cur_ch in range(len(awg_wfm._awg_chan_list)):
+        for cur_wfm_seg in awg_wfm._wfm_segment_list:
+            cur_wfm_seg.reset_waveform_transforms(lab)
+        t0 = 0
+        for cur_wfm_seg in awg_wfm._wfm_segment_list:
+            if cur_wfm_seg.NumPts(awg_wfm.SampleRate) == 0:
+                continue
+            final_wfms[cur_ch] = np.concatenate((final_wfms[cur_ch], cur_wfm_seg.get_waveform(lab, awg_wfm.SampleRate, t0, cur_ch)))
+            t0 = final_wfms[cur_ch].size
+        final_wfms[cur_ch] *= awg_wfm._global_factor
+    if elas_seg_ind != -1:
+        awg_wfm._wfm_segment_list[elas_seg_ind].Duration = -1
+    return final_wfms
+
+for num_segs in [10, 100, 1000, 10000]:
+    awg_wfm = stz.WaveformAWG(f"Wfm{num_segs}", lab, [('virAWG', 'CH1'), ('virAWG', 'CH2')], 1e9)
+    #Random sequence of gate-like pulses (IQ-modulated Gaussians) separated by idle time and a final elastic segment
+    rng = np.random.default_rng(42)
+    for m in range(num_segs-1):
+        if m % 2 == 0:
+            awg_wfm.add_waveform_segment(stz.WFS_Gaussian(f"pulse{m}", lab.WFMT('IQmod').apply(), 20e-9, rng.choice([0.25, 0.5])))
+        else:
+            awg_wfm.add_waveform_segment(stz.WFS_Constant(f"idle{m}", None, 4e-9, 0.0))
+    awg_wfm.add_waveform_segment(stz.WFS_Constant("pad", None, -1, 0.0))
+    awg_wfm.set_valid_total_time(num_segs*20e-9)
+
+    num_runs = max(1, 1000 // num_segs)
+    t0 = time.time()
+    for m in range(num_runs):
+        old_wfms = assemble_by_concatenation(awg_wfm)
+    t_old = (time.time() - t0) / num_runs
+    t0 = time.time()
+    for m in range(num_runs):
+        new_wfms = awg_wfm._assemble_waveform_raw()
+    t_new = (time.time() - t0) / num_runs
+    assert all(np.array_equal(x, y) for x, y in zip(old_wfms, new_wfms)), "The preallocated waveform assembly does not match the concatenated one."
+    print(f"{num_segs:>6} segments ({new_wfms[0].size:>7} points): concatenation {t_old*1e3:8.2f}ms, preallocated {t_new*1e3:8.2f}ms")
+
+lab.release_all_instruments()
@@ -0,0 +1,36 @@
+import sqdtoolz as stz
+import numpy as np
+import time
+
+#Benchmarks the waveform segment cache (Laboratory.WaveformCache) when sweeping the amplitude of one pulse in a long sequence of
+#IQ-modulated pulses (i.e. prepare_initial re-assembles the whole waveform on every sweeping point).
+#ASSUMING THAT IT IS RUN IN VSCODE WITH SQDToolz AS THE MAIN FOLDER!
+lab = stz.Laboratory('UnitTests/UTestExperimentConfiguration.yaml', 'bench_save_dir/')
+lab.load_instrument('virAWG')
+stz.WFMT_ModulationIQ('IQmod', lab, 47e7)
+
+num_sweep_pts = 20
+for num_pulses in [10, 100, 1000]:
+    awg_wfm = stz.WaveformAWG(f"Wfm{num_pulses}", lab, [('virAWG', 'CH1'), ('virAWG', 'CH2')], 1e9)
+    for m in range(num_pulses):
+        awg_wfm.add_waveform_segment(stz.WFS_Gaussian(f"pulse{m}", lab.WFMT('IQmod').apply(), 40e-9, 0.5))
+        awg_wfm.add_waveform_segment(stz.WFS_Constant(f"idle{m}", None, 8e-9, 0.0))
+    res_times = []
+    res_wfms = []
+    for cur_budget in [0, 128e6]:
+        lab.WaveformCache.MaxBytes = cur_budget
+        lab.WaveformCache.clear()
+        lab.WaveformCache.reset_stats()
+        cur_wfms = []
+        t0 = time.time()
+        for cur_ampl in np.linspace(0, 1, num_sweep_pts):
+            awg_wfm.get_waveform_segment(f"pulse{num_pulses//2}").Amplitude = cur_ampl
+            cur_wfms += [awg_wfm._assemble_waveform_raw()]
+        res_times += [(time.time() - t0) / num_sweep_pts]
+        res_wfms += [cur_wfms]
+    for x, y in zip(res_wfms[0], res_wfms[1]):
+        assert all(np.array_equal(a, b) for a, b in zip(x, y)), "The cached waveforms do not match the uncached waveforms."
+    stats = lab.WaveformCache.get_stats()
+    print(f"{num_pulses:>5} pulses: uncached {res_times[0]*1e3:7.2f}ms/point, cached {res_times[1]*1e3:7.2f}ms/point (hits {stats['Hits']}, misses {stats['Misses']}, {stats['Bytes']/1e6:.2f}MB)")
+
+lab.release_all_instruments()